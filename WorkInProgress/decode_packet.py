@@ -3,7 +3,12 @@
 Decode VGA packet based on liblewei-3.2.2.so.c structure
 """
 
-import struct
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from protocol import CMD_VIDEO, HEADER_LENGTH, PAYLOAD_OFFSET, VGAPacket, cmd_name
 
 def decode_vga_packet(hex_str):
     """Decode VGA packet (0x6363 protocol) from line 15240-15300"""
@@ -13,23 +18,19 @@ def decode_vga_packet(hex_str):
     print(f"Raw hex: {hex_str}\n")
     
     # Basic header (line 15240-15266)
-    header = struct.unpack('<H', data[0:2])[0]
-    cmd_type = data[2]
-    seq_id = struct.unpack('<H', data[3:5])[0]
-    pkt_len = struct.unpack('<H', data[5:7])[0]
-    frame_type = data[7]
-    frame_id = struct.unpack('<I', data[8:12])[0]
+    packet = VGAPacket(data)
+    magic, cmd_type, seq_id, pkt_len, frame_type, frame_id = packet.header()
     
     print(f"=== Basic Header ===")
-    print(f"Header:       0x{header:04X} ({'VGA' if header == 0x6363 else 'Unknown'})")
-    print(f"Command Type: 0x{cmd_type:02X} ({get_cmd_name(cmd_type)})")
+    print(f"Header:       0x{magic.hex().upper()} ({'VGA' if packet.valid else 'Unknown'})")
+    print(f"Command Type: 0x{cmd_type:02X} ({cmd_name(cmd_type)})")
     print(f"Sequence ID:  0x{seq_id:04X} ({seq_id})")
     print(f"Packet Len:   0x{pkt_len:04X} ({pkt_len} bytes)")
     print(f"Frame Type:   0x{frame_type:02X}")
     print(f"Frame ID:     0x{frame_id:08X} ({frame_id})")
     
     # Multi-packet video fields (line 15296-15300)
-    if cmd_type == 0x03 and len(data) >= 0x2D:
+    if cmd_type == CMD_VIDEO and packet.has_video_fields:
         print(f"\n=== Multi-Packet Video Fields (cmd_type=0x03) ===")
         
         # From C code line 15298-15299
@@ -37,15 +38,13 @@ def decode_vga_packet(hex_str):
         # uVar18 = local_7a6;         // total packets
         # __n = (ulong)local_7a4;     // data length
         
-        packet_seq = struct.unpack('<H', data[0x27:0x29])[0]      # local_7a8
-        total_packets = struct.unpack('<H', data[0x29:0x2B])[0]   # local_7a6
-        data_len = struct.unpack('<H', data[0x2B:0x2D])[0]        # local_7a4
+        packet_seq, total_packets, data_len = packet.video_fields()  # local_7a8/7a6/7a4
         
         print(f"Packet Seq:    {packet_seq}/{total_packets}")
         print(f"Data Length:   {data_len} bytes")
         
         # JPEG data starts at offset 0x36 (54 bytes) - line 15304
-        jpeg_offset = 0x36
+        jpeg_offset = PAYLOAD_OFFSET
         if len(data) > jpeg_offset:
             jpeg_data = data[jpeg_offset:]
             print(f"\nJPEG Data Offset: 0x{jpeg_offset:02X} ({jpeg_offset} bytes)")
@@ -59,27 +58,18 @@ def decode_vga_packet(hex_str):
                     print("  ✗ No JPEG SOI marker")
     
     # Show metadata section (offsets 0x0C to 0x35)
-    if len(data) >= 0x36:
+    if len(data) >= PAYLOAD_OFFSET:
         print(f"\n=== Metadata (offsets 0x0C-0x35) ===")
-        metadata = data[0x0C:0x36]
+        metadata = data[HEADER_LENGTH:PAYLOAD_OFFSET]
         print(f"Hex: {metadata.hex()}")
         
         # Try to decode specific fields if known
-        if len(data) >= 0x2D:
+        if packet.has_video_fields:
+            packet_seq, total_packets, data_len = packet.video_fields()
             print(f"\nKnown fields:")
-            print(f"  Offset 0x27-0x28: {struct.unpack('<H', data[0x27:0x29])[0]:04X} (packet_seq)")
-            print(f"  Offset 0x29-0x2A: {struct.unpack('<H', data[0x29:0x2B])[0]:04X} (total_packets)")
-            print(f"  Offset 0x2B-0x2C: {struct.unpack('<H', data[0x2B:0x2D])[0]:04X} (data_len)")
-
-def get_cmd_name(cmd_type):
-    """Get command type name from C code line 15296-15472"""
-    cmd_names = {
-        0x01: "Heartbeat",
-        0x03: "Multi-packet Video",
-        0x09: "Key Event",
-        0x0B: "Single Video Data"
-    }
-    return cmd_names.get(cmd_type, f"Unknown")
+            print(f"  Offset 0x27-0x28: {packet_seq:04X} (packet_seq)")
+            print(f"  Offset 0x29-0x2A: {total_packets:04X} (total_packets)")
+            print(f"  Offset 0x2B-0x2C: {data_len:04X} (data_len)")
 
 if __name__ == '__main__':
     # Decode the provided packet
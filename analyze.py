@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Vectorised analysis of the 0x6363 headers in a whole capture.
+
+load_packets() walks the capture's record headers once and gathers the
+first HEADER_BYTES bytes of every datagram into one (packets x 54) array.
+Viewed with PACKET_DTYPE, a structured dtype laid out like the wire
+header, every header field is a column (as is each byte of the unknown
+metadata at 0x0C-0x26 and 0x2D-0x35), and NumPy reduces millions of
+packets at once. The reports are computed on those columns:
+
+    field_report   per field and per header byte: distinct values, the
+                   most common ones and their share, entropy, and how often
+                   a byte changes between packets of the same frame
+    timing_report  packet and frame inter-arrival times and jitter
+    frame_report   packets and bytes per frame, frame_type prevalence
+    loss_report    lost, duplicated and reordered packets, missing frames
+
+Frames and loss place each packet as VGAPacket.video_position() does
+(video_positions, over all packets at once): by the 0x27 fields where
+packet_seq < total_packets, else by the drone's own 0x30 triple, else by
+byte 48 alone. A frame with no count is taken to run to its highest packet
+number, so packets lost from its tail are not seen.
+
+Bytes past the end of a shorter datagram read as 0. Frames are grouped by
+frame_id, so a capture in which the drone restarted its frame count mixes
+the frames sharing an id.
+
+Usage:
+    python3 analyze.py drone_raw_video_stream.bin
+    python3 analyze.py drone_raw_video_stream.bin --cmd 0x0B --top 5
+    python3 analyze.py drone_raw_video_stream.bin --json > report.json
+"""
+
+import argparse
+import json
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from capture import CAPTURE_MAGIC, RECORD_HEADER, CaptureReader
+from protocol import (CMD_VIDEO, HEADER_LENGTH, PAYLOAD_OFFSET, PACKET_SEQ_OFFSET, TOTAL_PACKETS_OFFSET,
+                      DATA_LEN_OFFSET, SEQ_BYTE_OFFSET, MAX_VIDEO_PACKETS, cmd_name)
+
+HEADER_BYTES = PAYLOAD_OFFSET
+
+PACKET_DTYPE = np.dtype({
+    'names': ['magic', 'cmd_type', 'seq_id', 'pkt_len', 'frame_type', 'frame_id',
+              'meta', 'packet_seq', 'total_packets', 'data_len', 'meta_tail'],
+    'formats': ['<u2', 'u1', '<u2', '<u2', 'u1', '<u4',
+                ('u1', PACKET_SEQ_OFFSET - HEADER_LENGTH), '<u2', '<u2', '<u2',
+                ('u1', HEADER_BYTES - DATA_LEN_OFFSET - 2)],
+    'offsets': [0, 2, 3, 5, 7, 8, HEADER_LENGTH, PACKET_SEQ_OFFSET, TOTAL_PACKETS_OFFSET,
+                DATA_LEN_OFFSET, DATA_LEN_OFFSET + 2],
+    'itemsize': HEADER_BYTES,
+})
+
+VGA_MAGIC = 0x6363
+
+# Fields reported as a whole, besides every single byte
+FIELDS = ('cmd_type', 'seq_id', 'pkt_len', 'frame_type', 'frame_id', 'packet_seq', 'total_packets', 'data_len')
+VIDEO_FIELDS = ('packet_seq', 'total_packets', 'data_len')
+
+# Datagrams gathered per block, bounds the temporary index arrays
+GATHER_BLOCK = 1 << 16
+
+# frame_id steps larger than this are a restarted count, not missing frames
+MAX_FRAME_GAP = 1000
+
+# Layouts a video packet was placed by (see video_positions)
+LAYOUTS = ('table', 'drone', 'unsized')
+
+# timestamp_ns, length: per datagram in capture order; raw: its first
+# HEADER_BYTES bytes; header: raw viewed as PACKET_DTYPE
+Packets = namedtuple('Packets', 'timestamp_ns length raw header')
+
+# Per packet: packet_seq (0-based), total_packets (0 when unknown), data_len
+# (clamped to the datagram) and the index of its layout in LAYOUTS
+Positions = namedtuple('Positions', 'packet_seq total_packets data_len layout')
+
+
+def load_packets(filename):
+    """Every datagram of a capture as a Packets of arrays"""
+    with CaptureReader(filename) as capture:
+        view = capture.view
+        end = len(view)
+        unpack_from = RECORD_HEADER.unpack_from
+        header_size = RECORD_HEADER.size
+        starts, lengths, timestamps = array('q'), array('q'), array('q')
+        offset = len(CAPTURE_MAGIC)
+        while offset + header_size <= end:
+            length, timestamp_ns = unpack_from(view, offset)
+            start = offset + header_size
+            offset = start + length
+            if offset > end:
+                break
+            starts.append(start)
+            lengths.append(length)
+            timestamps.append(timestamp_ns)
+
+        starts = np.frombuffer(starts, np.int64)
+        lengths = np.frombuffer(lengths, np.int64)
+        raw = np.zeros((len(starts), HEADER_BYTES), np.uint8)
+        if len(starts):
+            data = np.frombuffer(view, np.uint8)
+            columns = np.arange(HEADER_BYTES)
+            for first in range(0, len(starts), GATHER_BLOCK):
+                block = slice(first, first + GATHER_BLOCK)
+                np.take(data, starts[block, None] + columns, out=raw[block], mode='clip')
+                # Those bytes belong to the next record
+                raw[block][columns >= lengths[block, None]] = 0
+            # The mapping can't be closed while an array refers to it
+            del data
+
+    return Packets(np.frombuffer(timestamps, np.int64), lengths, raw, raw.view(PACKET_DTYPE)[:, 0])
+
+
+def select(packets, cmd_type=CMD_VIDEO):
+    """Mask of the 0x6363 datagrams of cmd_type (any cmd_type for None)"""
+    header, length = packets.header, packets.length
+    mask = (header['magic'] == VGA_MAGIC) & (length >= HEADER_LENGTH)
+    if cmd_type is not None:
+        mask &= header['cmd_type'] == cmd_type
+    if cmd_type == CMD_VIDEO:
+        mask &= length >= HEADER_BYTES
+    return mask
+
+
+def _summary(values, scale=1.0):
+    """mean, std, p50, p99 and max of values, multiplied by scale"""
+    if not len(values):
+        return None
+    values = np.asarray(values, np.float64) * scale
+    p50, p99 = np.percentile(values, (50, 99))
+    return {'mean': float(values.mean()), 'std': float(values.std()), 'p50': float(p50),
+            'p99': float(p99), 'max': float(values.max())}
+
+
+def _distribution(values, top):
+    """distinct, entropy (bits) and the top most common values with their share"""
+    values, counts = np.unique(values, return_counts=True)
+    shares = counts / counts.sum()
+    common = np.argsort(counts, kind='stable')[::-1][:top]
+    return {
+        'distinct': int(len(values)),
+        'entropy': _entropy(shares),
+        'top': [(int(values[i]), float(shares[i])) for i in common],
+    }
+
+
+def _entropy(shares):
+    return float(-(shares * np.log2(shares)).sum()) + 0.0  # no -0.0
+
+
+def _groups(keys):
+    """unique keys, the order sorting packets by key and each group's start in that order"""
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    return ordered[starts], order, starts
+
+
+def field_report(packets, mask, top=3):
+    """Value distributions of the known fields and of every header byte"""
+    header, raw = packets.header[mask], packets.raw[mask]
+    if not len(raw):
+        return {'packets': 0, 'fields': {}, 'bytes': []}
+    video = bool(np.all(header['cmd_type'] == CMD_VIDEO))
+    fields = {name: _distribution(header[name], top) for name in FIELDS
+              if video or name not in VIDEO_FIELDS}
+
+    same_frame = header['frame_id'][1:] == header['frame_id'][:-1]
+    within = max(1, int(same_frame.sum()))
+    offsets = []
+    for offset in range(HEADER_BYTES):
+        column = raw[:, offset]
+        counts = np.bincount(column, minlength=256)
+        shares = counts[counts > 0] / len(column)
+        common = np.argsort(counts, kind='stable')[::-1][:top]
+        offsets.append({
+            'offset': offset,
+            'distinct': int(np.count_nonzero(counts)),
+            'entropy': _entropy(shares),
+            'top': [(int(value), float(counts[value] / len(column))) for value in common if counts[value]],
+            # 0 for a per-frame value, about 1 for a per-packet one
+            'changes_within_frame': float(((column[1:] != column[:-1]) & same_frame).sum() / within),
+        })
+    return {'packets': int(len(raw)), 'fields': fields, 'bytes': offsets}
+
+
+def timing_report(packets, mask):
+    """Packet inter-arrival times and, by first packet, frame intervals (ms)"""
+    timestamps = packets.timestamp_ns[mask]
+    if len(timestamps) < 2:
+        return {'packets': int(len(timestamps))}
+    frame_ids = packets.header['frame_id'][mask]
+    ids, first = np.unique(frame_ids, return_index=True)
+    frame_starts = np.sort(timestamps[first])
+    frame_gaps = np.diff(frame_starts)
+
+    # First to last packet of each frame
+    _, order, starts = _groups(frame_ids)
+    ordered = timestamps[order]
+    spread = np.maximum.reduceat(ordered, starts) - np.minimum.reduceat(ordered, starts)
+
+    seconds = (timestamps.max() - timestamps.min()) / 1e9
+    return {
+        'packets': int(len(timestamps)),
+        'seconds': float(seconds),
+        'packet_rate': float(len(timestamps) / seconds) if seconds > 0 else 0.0,
+        'frame_rate': float(len(ids) / seconds) if seconds > 0 else 0.0,
+        'packet_gap_ms': _summary(np.diff(timestamps), 1e-6),
+        'frame_interval_ms': _summary(frame_gaps, 1e-6),
+        'frame_spread_ms': _summary(spread, 1e-6),
+    }
+
+
+def video_positions(packets, mask):
+    """VGAPacket.video_position() over the masked packets, as Positions of arrays"""
+    header, raw = packets.header[mask], packets.raw[mask]
+    available = np.maximum(packets.length[mask] - PAYLOAD_OFFSET, 0)
+    seq = header['packet_seq'].astype(np.int64)
+    total = header['total_packets'].astype(np.int64)
+    data_len = header['data_len'].astype(np.int64)
+    layout = np.zeros(len(header), np.int8)
+
+    drone = seq >= total
+    fields = raw[:, SEQ_BYTE_OFFSET:SEQ_BYTE_OFFSET + 6].astype(np.int64)
+    number, count, length = (fields[:, 0::2] | (fields[:, 1::2] << 8)).T
+    sized = drone & (number > 0) & (number <= count) & (count <= MAX_VIDEO_PACKETS)
+    unsized = drone & ~sized
+    seq[sized], total[sized] = number[sized] - 1, count[sized]
+    data_len[sized] = np.where(length[sized] == 0, available[sized], length[sized])
+    seq[unsized], total[unsized], data_len[unsized] = fields[unsized, 0] - 1, 0, available[unsized]
+    layout[sized], layout[unsized] = 1, 2
+    return Positions(seq, total, np.minimum(data_len, available), layout)
+
+
+def _frame_totals(total, seq, starts):
+    """Packet count of each frame, its highest packet number + 1 where none is given"""
+    given = np.maximum.reduceat(total, starts)
+    return np.where(given > 0, given, np.maximum.reduceat(seq, starts) + 1)
+
+
+def frame_report(packets, mask=None):
+    """Packets and bytes per multi-packet frame and frame_type prevalence"""
+    mask = select(packets) if mask is None else mask
+    header = packets.header[mask]
+    if not len(header):
+        return {'frames': 0}
+    positions = video_positions(packets, mask)
+    _, order, starts = _groups(_packet_keys(header, positions))
+    # keys are unique (frame_id, packet_seq): duplicates are left out
+    kept = order[starts]
+    ordered = header[kept]
+    frame_ids, group_starts, received = np.unique(ordered['frame_id'], return_index=True,
+                                                  return_counts=True)
+    total = _frame_totals(positions.total_packets[kept], positions.packet_seq[kept], group_starts)
+    size = np.add.reduceat(positions.data_len[kept], group_starts)
+    complete = received >= total
+
+    frame_types, type_counts = np.unique(ordered['frame_type'][group_starts], return_counts=True)
+    layouts = np.bincount(positions.layout, minlength=len(LAYOUTS))
+    return {
+        'frames': int(len(frame_ids)),
+        'complete': int(complete.sum()),
+        'packets_per_frame': _summary(received),
+        'total_packets': _distribution(total, 5),
+        'frame_bytes': _summary(size),
+        'complete_frame_bytes': _summary(size[complete]),
+        'frame_types': {f"0x{int(t):02X}": float(c / len(frame_ids)) for t, c in zip(frame_types, type_counts)},
+        'layouts': {name: int(count) for name, count in zip(LAYOUTS, layouts)},
+    }
+
+
+def loss_report(packets, mask=None):
+    """
+    Lost packets of the frames seen, frames never seen (frame_id gaps),
+    duplicates, and adjacent packets out of (frame_id, packet_seq) order.
+    Where seq_id counts packets (steps of 1), the seq_id values never
+    seen give a second loss estimate.
+    """
+    mask = select(packets) if mask is None else mask
+    header = packets.header[mask]
+    if not len(header):
+        return {'packets': 0}
+    positions = video_positions(packets, mask)
+    keys = _packet_keys(header, positions)
+    unique_keys, first = np.unique(keys, return_index=True)
+    frame_ids = unique_keys >> np.uint64(16)
+    ids, group_starts, received = np.unique(frame_ids, return_index=True, return_counts=True)
+    totals = _frame_totals(positions.total_packets[first], positions.packet_seq[first], group_starts)
+    lost = int(np.clip(totals - received, 0, None).sum())
+
+    gaps = np.diff(ids.astype(np.int64))
+    missing_frames = int((gaps[(gaps > 1) & (gaps <= MAX_FRAME_GAP)] - 1).sum())
+
+    report = {
+        'packets': int(len(keys)),
+        'unique': int(len(unique_keys)),
+        'duplicates': int(len(keys) - len(unique_keys)),
+        'lost': lost,
+        'loss_rate': lost / (len(unique_keys) + lost),
+        'reordered': int((keys[1:] < keys[:-1]).sum()),
+        'reorder_rate': float((keys[1:] < keys[:-1]).mean()) if len(keys) > 1 else 0.0,
+        'missing_frames': missing_frames,
+        'seq_id_lost': None,
+    }
+    # Unwrapped from 16 bits, steps back are reordering
+    steps = (np.diff(header['seq_id'].astype(np.int64)) + 32768) % 65536 - 32768
+    if len(steps) and np.median(steps) == 1:
+        seq = np.r_[0, np.cumsum(steps)]
+        report['seq_id_lost'] = int(seq.max() - seq.min() + 1 - len(np.unique(seq)))
+    return report
+
+
+def _packet_keys(header, positions):
+    seq = positions.packet_seq.astype(np.uint64) & np.uint64(0xFFFF)
+    return (header['frame_id'].astype(np.uint64) << np.uint64(16)) | seq
+
+
+def analyze(filename, cmd_type=CMD_VIDEO, top=3):
+    """All reports for the cmd_type datagrams of a capture"""
+    packets = load_packets(filename)
+    vga = select(packets, None)
+    cmd_types, counts = np.unique(packets.header['cmd_type'][vga], return_counts=True)
+    mask = select(packets, cmd_type)
+    report = {
+        'datagrams': int(len(packets.length)),
+        'bytes': int(packets.length.sum()),
+        'vga': int(vga.sum()),
+        'cmd_types': {f"0x{int(c):02X}": int(n) for c, n in zip(cmd_types, counts)},
+        'fields': field_report(packets, mask, top),
+        'timing': timing_report(packets, mask),
+    }
+    if cmd_type == CMD_VIDEO:
+        report['frames'] = frame_report(packets, mask)
+        report['loss'] = loss_report(packets, mask)
+    return report
+
+
+def _print_summary(name, summary, unit=''):
+    if summary:
+        print(f"  {name:<20} mean {summary['mean']:.3f}{unit}  std {summary['std']:.3f}  "
+              f"p50 {summary['p50']:.3f}  p99 {summary['p99']:.3f}  max {summary['max']:.3f}")
+
+
+def print_report(report, cmd_type):
+    print(f"📦 {report['datagrams']} datagrams, {report['bytes'] / (1024 * 1024):.1f} MB, "
+          f"{report['vga']} 0x6363")
+    for cmd, count in report['cmd_types'].items():
+        print(f"  {cmd} {cmd_name(int(cmd, 16)):<20} {count}")
+
+    fields = report['fields']
+    if not fields['packets']:
+        print(f"\nNo cmd 0x{cmd_type:02X} packets")
+        return
+    print(f"\n🔬 Fields of {fields['packets']} cmd 0x{cmd_type:02X} packets")
+    for name, field in fields['fields'].items():
+        top = ', '.join(f"{value} ({share:.1%})" for value, share in field['top'])
+        print(f"  {name:<14} {field['distinct']:>8} distinct  {field['entropy']:5.2f} bits  {top}")
+    print("\n  offset  distinct  entropy  within frame  most common")
+    for byte in fields['bytes']:
+        top = ', '.join(f"{value:02x} ({share:.0%})" for value, share in byte['top'])
+        print(f"  0x{byte['offset']:02X}    {byte['distinct']:>8}  {byte['entropy']:7.2f}  "
+              f"{byte['changes_within_frame']:>12.1%}  {top}")
+
+    timing = report['timing']
+    if 'seconds' in timing:
+        print(f"\n⏱️  {timing['seconds']:.1f} s, {timing['packet_rate']:.0f} packets/s, "
+              f"{timing['frame_rate']:.1f} frames/s (ms)")
+        _print_summary('packet gap', timing['packet_gap_ms'])
+        _print_summary('frame interval', timing['frame_interval_ms'])
+        _print_summary('frame spread', timing['frame_spread_ms'])
+
+    frames = report.get('frames')
+    if frames and frames['frames']:
+        print(f"\n🎞️  {frames['frames']} frames, {frames['complete']} complete")
+        _print_summary('packets/frame', frames['packets_per_frame'])
+        _print_summary('bytes/frame', frames['frame_bytes'])
+        _print_summary('bytes/complete', frames['complete_frame_bytes'])
+        print(f"  frame_type     {', '.join(f'{t} ({s:.1%})' for t, s in frames['frame_types'].items())}")
+        print(f"  placed by      {', '.join(f'{name} {count}' for name, count in frames['layouts'].items())}")
+
+    loss = report.get('loss')
+    if loss and loss['packets']:
+        print(f"\n📉 Lost {loss['lost']} ({loss['loss_rate']:.2%}), missing frames {loss['missing_frames']}, "
+              f"duplicates {loss['duplicates']}, reordered {loss['reordered']} ({loss['reorder_rate']:.2%})")
+        if loss['seq_id_lost'] is not None:
+            print(f"  seq_id gaps: {loss['seq_id_lost']} packets")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Header statistics over a whole drone capture")
+    parser.add_argument('capture', help="capture file written by stream_video.py")
+    parser.add_argument('--cmd', type=lambda v: int(v, 0), default=CMD_VIDEO,
+                        help="cmd_type to analyse (default 0x03)")
+    parser.add_argument('--top', type=int, default=3, help="most common values shown per field")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        report = analyze(args.capture, args.cmd, args.top)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read {args.capture}: {e}")
+        raise SystemExit(1)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.cmd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Seekable frame archive with deduplicated JPEG headers.
+
+Every drone JPEG carries the same tables (SOI, DQT, DHT, SOF, SOS) in front
+of its scan. The archive stores each distinct header once and only the
+entropy-coded scan per frame:
+
+    magic      8 bytes  b'DRNARC01'
+    per record:
+        kind       1 byte   b'H' header or b'F' frame
+        id         4 bytes  uint32, header_id or frame_id
+        timestamp  8 bytes  uint64, nanoseconds (0 for headers)
+        header_id  4 bytes  uint32, header the frame's scan belongs to
+        length     4 bytes  uint32
+        data       length bytes
+
+A sidecar index (archive + '.idx') repeats the record headers with their
+file offsets, so a reader finds any frame by frame_id or timestamp without
+walking the archive, and rebuilds it as header + scan with one join. If the
+index is missing it is rebuilt by walking the records.
+
+Usage:
+    python3 archive.py build drone_raw_video_stream.bin flight.arc
+    python3 archive.py info flight.arc
+    python3 archive.py extract flight.arc --frame 1234 -o frame.jpg
+    python3 archive.py extract flight.arc --all -o frames/
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import struct
+
+from jpeg import scan_offset
+
+ARCHIVE_MAGIC = b'DRNARC01'
+RECORD_HEADER = struct.Struct('<cIQII')
+INDEX_ENTRY = struct.Struct('<cIQIIQ')
+INDEX_SUFFIX = '.idx'
+
+HEADER = b'H'
+FRAME = b'F'
+
+# Records are written through a buffer of this size
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class FrameArchive:
+    """
+    Append-only writer. append() splits a JPEG into header and scan and
+    writes the header only the first time it is seen.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.frames = 0
+        self.bytes_in = 0
+        self._headers = {}
+        self._file = open(filename, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self._index = open(filename + INDEX_SUFFIX, 'wb')
+        self._file.write(ARCHIVE_MAGIC)
+        self._offset = len(ARCHIVE_MAGIC)
+
+    def append(self, frame_id, jpeg, timestamp_ns=0):
+        """Add a frame, False (and nothing written) if it has no scan to split off"""
+        split = scan_offset(jpeg)
+        if split is None:
+            return False
+
+        header = bytes(jpeg[:split])
+        header_id = self._headers.get(header)
+        if header_id is None:
+            header_id = len(self._headers)
+            self._headers[header] = header_id
+            self._record(HEADER, header_id, 0, header_id, header)
+        self._record(FRAME, frame_id, timestamp_ns, header_id, memoryview(jpeg)[split:])
+        self.frames += 1
+        self.bytes_in += len(jpeg)
+        return True
+
+    @property
+    def size(self):
+        return self._offset
+
+    @property
+    def header_count(self):
+        return len(self._headers)
+
+    def flush(self):
+        self._file.flush()
+        self._index.flush()
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _record(self, kind, record_id, timestamp_ns, header_id, data):
+        length = len(data)
+        self._file.write(RECORD_HEADER.pack(kind, record_id, timestamp_ns, header_id, length))
+        self._file.write(data)
+        self._index.write(INDEX_ENTRY.pack(kind, record_id, timestamp_ns, header_id, length,
+                                           self._offset + RECORD_HEADER.size))
+        self._offset += RECORD_HEADER.size + length
+
+
+class ArchiveReader:
+    """
+    Random access to an archive through mmap. Frames are numbered in
+    archive order; frame(frame_id) and at(timestamp_ns) look them up.
+    A frame_id seen more than once (the drone restarted its count) maps
+    to its latest frame.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        if os.fstat(self._file.fileno()).st_size < len(ARCHIVE_MAGIC):
+            self._file.close()
+            raise ValueError(f"{filename} is not a frame archive")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a frame archive")
+
+        self.headers = {}
+        self.frame_ids = []
+        self.timestamps = []
+        self._frames = []
+        self._by_id = {}
+        self._load_index()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, position):
+        """JPEG bytes of the frame at position in archive order"""
+        offset, length, header_id = self._frames[position]
+        return self.headers[header_id] + self._map[offset:offset + length]
+
+    def __iter__(self):
+        """(frame_id, timestamp_ns, jpeg bytes) in archive order"""
+        for position in range(len(self._frames)):
+            yield self.frame_ids[position], self.timestamps[position], self[position]
+
+    def frame(self, frame_id):
+        """JPEG bytes of frame_id, or None"""
+        position = self._by_id.get(frame_id)
+        return None if position is None else self[position]
+
+    def position_at(self, timestamp_ns):
+        """Position of the last frame at or before timestamp_ns (timestamps ascend)"""
+        return max(0, bisect.bisect_right(self.timestamps, timestamp_ns) - 1)
+
+    def at(self, timestamp_ns):
+        """(frame_id, jpeg bytes) of the frame showing at timestamp_ns"""
+        if not self._frames:
+            return None
+        position = self.position_at(timestamp_ns)
+        return self.frame_ids[position], self[position]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_index(self):
+        try:
+            with open(self.filename + INDEX_SUFFIX, 'rb') as f:
+                entries = f.read()
+            usable = len(entries) - len(entries) % INDEX_ENTRY.size
+            records = INDEX_ENTRY.iter_unpack(memoryview(entries)[:usable])
+        except FileNotFoundError:
+            records = self._walk()
+
+        end = len(self._map)
+        for kind, record_id, timestamp_ns, header_id, length, offset in records:
+            if offset + length > end:
+                # Index ahead of the data (writer killed mid-flush)
+                break
+            if kind == HEADER:
+                self.headers[record_id] = self._map[offset:offset + length]
+            elif header_id in self.headers:
+                self._by_id[record_id] = len(self._frames)
+                self._frames.append((offset, length, header_id))
+                self.frame_ids.append(record_id)
+                self.timestamps.append(timestamp_ns)
+
+    def _walk(self):
+        """Index entries recovered from the records themselves"""
+        offset = len(ARCHIVE_MAGIC)
+        end = len(self._map)
+        while offset + RECORD_HEADER.size <= end:
+            kind, record_id, timestamp_ns, header_id, length = RECORD_HEADER.unpack_from(self._map, offset)
+            offset += RECORD_HEADER.size
+            yield kind, record_id, timestamp_ns, header_id, length, offset
+            offset += length
+
+
+def build_archive(capture_file, archive_file):
+    """Archive every complete frame of a capture, returns the FrameArchive"""
+    from capture import CaptureReader, read_frames
+
+    # read_frames doesn't carry timestamps, take each frame's from the index
+    times = {}
+    with CaptureReader(capture_file) as capture:
+        for frame_id, offset in capture.index.items():
+            for timestamp_ns, packet in capture.packets(offset):
+                times[frame_id] = timestamp_ns
+                # Views into the mapping have to go before the capture is closed
+                packet.release()
+                break
+
+    with FrameArchive(archive_file) as archive:
+        for frame_id, frame_type, jpeg in read_frames(capture_file):
+            archive.append(frame_id, jpeg, times.get(frame_id, 0))
+    return archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seekable drone frame archive")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="archive the frames of a capture")
+    build.add_argument('capture')
+    build.add_argument('archive')
+
+    info = commands.add_parser('info', help="frame count, headers and size")
+    info.add_argument('archive')
+
+    extract = commands.add_parser('extract', help="rebuild frames as JPEG files")
+    extract.add_argument('archive')
+    which = extract.add_mutually_exclusive_group(required=True)
+    which.add_argument('--frame', type=int, help="frame_id to extract")
+    which.add_argument('--time', type=float, help="seconds from the first frame")
+    which.add_argument('--all', action='store_true', help="every frame, into a directory")
+    extract.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        archive = build_archive(args.capture, args.archive)
+        saved = 1 - archive.size / archive.bytes_in if archive.bytes_in else 0
+        print(f"🗄️  {archive.frames} frames, {archive.header_count} header(s), "
+              f"{archive.size / (1024 * 1024):.2f} MB ({saved:.1%} smaller than the JPEGs)")
+        return
+
+    with ArchiveReader(args.archive) as archive:
+        if args.command == 'info':
+            size = os.path.getsize(args.archive)
+            print(f"🗄️  {len(archive)} frames, {len(archive.headers)} header(s), {size / (1024 * 1024):.2f} MB")
+            if len(archive):
+                span = (archive.timestamps[-1] - archive.timestamps[0]) / 1e9
+                print(f"   frame_id {archive.frame_ids[0]} .. {archive.frame_ids[-1]}, {span:.1f} s")
+            return
+
+        if args.all:
+            os.makedirs(args.output, exist_ok=True)
+            for frame_id, timestamp_ns, jpeg in archive:
+                with open(os.path.join(args.output, f"frame_{frame_id}.jpg"), 'wb') as f:
+                    f.write(jpeg)
+            print(f"💾 {len(archive)} frames written to {args.output}")
+            return
+
+        if args.frame is not None:
+            jpeg = archive.frame(args.frame)
+            if jpeg is None:
+                print(f"❌ Frame {args.frame} not in {args.archive}")
+                raise SystemExit(1)
+        else:
+            if not len(archive):
+                print(f"❌ {args.archive} is empty")
+                raise SystemExit(1)
+            frame_id, jpeg = archive.at(archive.timestamps[0] + int(args.time * 1e9))
+            print(f"Frame {frame_id}")
+        with open(args.output, 'wb') as f:
+            f.write(jpeg)
+        print(f"💾 Written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Passthrough MJPEG recording to AVI.
+
+The drone already sends complete JPEGs, so frames are stored as they arrive
+('00dc' chunks of an MJPG video stream) with no decode or re-encode.
+
+    RIFF 'AVI '
+        LIST 'hdrl'   avih + LIST 'strl' (strh, strf)
+        LIST 'movi'   one '00dc' chunk per frame slot
+        idx1          one entry per chunk, offsets relative to 'movi'
+
+AVI has a fixed frame rate, so frames are placed in slots of 1/fps by their
+timestamps and skipped slots get empty '00dc' chunks (the usual AVI drop
+frame), which players show as a repeat of the previous frame. That keeps
+playback in step with the wire timing when frames are lost.
+
+Header sizes and counts are patched when a segment is closed. AviRecorder
+rolls over to a new segment by size or duration; AVI 1.0 indexes use 32-bit
+offsets, so segments stay well under 1 GB.
+"""
+
+import struct
+
+from jpeg import jpeg_size
+
+RECORD_FPS = 25.0
+MAX_SEGMENT_BYTES = 512 * 1024 * 1024
+MAX_SEGMENT_SECONDS = 600.0
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+_CHUNK = struct.Struct('<4sI')
+_INDEX_ENTRY = struct.Struct('<4sIII')
+_AVIH = struct.Struct('<IIIIIIIIII16x')
+_STRH = struct.Struct('<4s4sIHHIIIIIIIIhhhh')
+_STRF = struct.Struct('<IiiHH4sIiiII')
+
+
+class AviWriter:
+    """
+    One MJPEG AVI file. width and height come from the first frame when
+    not given; the file is only valid once close() has patched the headers.
+    """
+
+    def __init__(self, filename, fps=RECORD_FPS, width=None, height=None):
+        self.filename = filename
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.frames = 0
+        self.chunks = 0
+        self.max_chunk = 0
+        self.bytes_written = 0
+        self._index = bytearray()
+        self._file = open(filename, 'wb')
+        self._write_headers()
+        self._movi_start = self._file.tell() - 4
+
+    def write(self, jpeg, empty_before=0):
+        """
+        Append a frame, preceded by empty_before drop-frame slots.
+        Returns the file size so far.
+        """
+        if self.width is None:
+            size = jpeg_size(jpeg)
+            if size:
+                self.width, self.height = size
+
+        for _ in range(empty_before):
+            self._chunk(b'', 0)
+        self._chunk(jpeg, AVIIF_KEYFRAME)
+        self.frames += 1
+        return self.bytes_written
+
+    def close(self):
+        if self._file.closed:
+            return
+        f = self._file
+        movi_end = f.tell()
+        f.write(_CHUNK.pack(b'idx1', len(self._index)))
+        f.write(self._index)
+        riff_end = f.tell()
+
+        # Patch the sizes and counts now that they are known
+        f.seek(0)
+        self._write_headers()
+        f.seek(4)
+        f.write(struct.pack('<I', riff_end - 8))
+        f.seek(self._movi_start - 4)
+        f.write(struct.pack('<I', movi_end - self._movi_start))
+        f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _chunk(self, data, flags):
+        f = self._file
+        length = len(data)
+        offset = f.tell() - self._movi_start
+        f.write(_CHUNK.pack(b'00dc', length))
+        if length:
+            f.write(data)
+            if length & 1:
+                f.write(b'\0')
+        self._index += _INDEX_ENTRY.pack(b'00dc', flags, offset, length)
+        self.chunks += 1
+        if length > self.max_chunk:
+            self.max_chunk = length
+        self.bytes_written = f.tell()
+
+    def _write_headers(self):
+        """RIFF/hdrl/movi headers, rewritten in place with final values on close"""
+        width = self.width or 0
+        height = self.height or 0
+        scale, rate = 1000, int(round(self.fps * 1000))
+
+        avih = _AVIH.pack(int(round(1e6 / self.fps)), 0, 0, AVIF_HASINDEX, self.chunks, 0, 1,
+                          self.max_chunk, width, height)
+        strh = _STRH.pack(b'vids', b'MJPG', 0, 0, 0, 0, scale, rate, 0, self.chunks,
+                          self.max_chunk, 0xFFFFFFFF, 0, 0, 0, width, height)
+        strf = _STRF.pack(_STRF.size, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+
+        strl = (b'strl' + _CHUNK.pack(b'strh', len(strh)) + strh
+                + _CHUNK.pack(b'strf', len(strf)) + strf)
+        hdrl = (b'hdrl' + _CHUNK.pack(b'avih', len(avih)) + avih
+                + _CHUNK.pack(b'LIST', len(strl)) + strl)
+
+        f = self._file
+        f.write(_CHUNK.pack(b'RIFF', 0) + b'AVI ')
+        f.write(_CHUNK.pack(b'LIST', len(hdrl)) + hdrl)
+        f.write(_CHUNK.pack(b'LIST', 4) + b'movi')
+
+
+class AviRecorder:
+    """
+    Segmented MJPEG recording: name.avi becomes name_000.avi, name_001.avi,
+    ... with a new segment after max_bytes or max_seconds. write() takes the
+    frame's timestamp in seconds (any time base) to place it in the stream.
+    """
+
+    def __init__(self, filename, fps=RECORD_FPS, max_bytes=MAX_SEGMENT_BYTES,
+                 max_seconds=MAX_SEGMENT_SECONDS):
+        self.base = filename[:-4] if filename.lower().endswith('.avi') else filename
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.segments = []
+        self.frames = 0
+        self._writer = None
+        self._first = None
+        self._slot = -1
+
+    def write(self, jpeg, timestamp=None):
+        if self._writer is None:
+            self._open(timestamp)
+
+        # Slot in the fixed-rate stream, always at least one past the last
+        if timestamp is None or self._first is None:
+            slot = self._slot + 1
+        else:
+            slot = max(self._slot + 1, int(round((timestamp - self._first) * self.fps)))
+        size = self._writer.write(jpeg, slot - self._slot - 1)
+        self._slot = slot
+        self.frames += 1
+
+        if size >= self.max_bytes or (slot + 1) / self.fps >= self.max_seconds:
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self, timestamp):
+        filename = f"{self.base}_{len(self.segments):03d}.avi"
+        self._writer = AviWriter(filename, self.fps)
+        self.segments.append(filename)
+        self._first = timestamp
+        self._slot = -1
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the video receive path.
+
+Micro-benchmarks time the hot functions on synthetic packets and frames:
+header parsing, obfuscation index/deobfuscation, reassembly (VGA and HD),
+capture writes and JPEG decode. Macro-benchmarks run whole sessions, live
+sessions against simulator.py over localhost (multi-packet VGA and HD
+lewei_cmd streams) and a replay of a synthetic capture, and report
+packets/s, frames/s, p50/p99 first-packet-to-display latency and peak RSS.
+
+Results are saved as JSON; --compare flags anything that got slower.
+
+Usage:
+    python3 benchmark.py --output bench.json
+    python3 benchmark.py --quick --compare bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import simulator
+import stream_video
+from capture import CaptureWriter
+from decoders import SCALES, available_decoders
+from jpeg import validate_jpeg
+from obfuscation import decode_vga_obfuscation, deobfuscate_in_place, encode_index, encode_index_array
+from protocol import PACKET_SEQ_OFFSET, HDPacket, VGAPacket
+from reassembly import (BufferPool, FrameReassembler, StreamReassembler, FRAME_BUFFER_SIZE,
+                        HD_FRAME_BUFFER_SIZE)
+from session import DroneSession, SessionThread
+
+# A result slower than the baseline by more than this is a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def measure(fn, number, repeat=5):
+    """Best of repeat runs of fn() called number times, per call"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    per_call = best / number
+    return {'ns_per_op': per_call * 1e9, 'ops_per_sec': 1.0 / per_call if per_call else 0.0}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send the session's console output (status, heartbeats) to /dev/null"""
+    with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+        yield
+
+
+# --- micro-benchmarks ---
+
+def micro_benchmarks(jpeg, scale):
+    packets = simulator.create_video_packets(1, jpeg)
+    packet = packets[len(packets) // 2]
+    frame = bytearray(jpeg)
+    results = {}
+
+    results['decode_packet_header'] = measure(
+        lambda: stream_video.decode_packet_header(packet), 20000 * scale)
+
+    view = VGAPacket()
+    results['packet_view'] = measure(
+        lambda: (view.bind(packet).frame_id, view.video_fields()), 20000 * scale)
+
+    results['encode_index'] = measure(
+        lambda: encode_index(12345, len(jpeg)), 20000 * scale)
+
+    results['decode_vga_obfuscation'] = measure(
+        lambda: decode_vga_obfuscation(frame, 12345, 0x00), 2000 * scale)
+    results['decode_vga_obfuscation_passthrough'] = measure(
+        lambda: decode_vga_obfuscation(frame, 12345, 0x02), 20000 * scale)
+    results['deobfuscate_in_place'] = measure(
+        lambda: deobfuscate_in_place(frame, len(frame), 12345, 0x00), 20000 * scale)
+
+    frame_ids = list(range(10000))
+    lengths = [len(jpeg) + i % 1000 for i in frame_ids]
+    results['encode_index_batch_10k'] = measure(
+        lambda: [encode_index(f, n) for f, n in zip(frame_ids, lengths)], 2 * scale)
+    id_array, length_array = np.array(frame_ids), np.array(lengths)
+    results['encode_index_array_10k'] = measure(
+        lambda: encode_index_array(id_array, length_array), 20 * scale)
+
+    results['reassemble_frame'] = _bench_reassembly(packets, scale)
+    results['reassemble_frame']['packets_per_frame'] = len(packets)
+    hd_packets = simulator.create_hd_packets(jpeg)
+    results['reassemble_frame_hd'] = _bench_hd_reassembly(hd_packets, scale)
+    results['reassemble_frame_hd']['packets_per_frame'] = len(hd_packets)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with CaptureWriter(os.path.join(tmp, 'bench.bin')) as writer:
+            results['capture_write'] = measure(lambda: writer.write(packet, 0), 5000 * scale)
+
+    results['validate_jpeg'] = measure(lambda: validate_jpeg(jpeg), 5000 * scale)
+    truncated = jpeg[:len(jpeg) // 2]
+    results['validate_jpeg_reject'] = measure(lambda: validate_jpeg(truncated), 5000 * scale)
+
+    # decode_frame minus the window and the frames/ directory
+    def decode():
+        img = stream_video.decode_jpeg(jpeg)
+        stream_video.conceal_frame(img)
+    results['decode_frame'] = measure(decode, 20 * scale)
+    results['decode_frame']['jpeg_bytes'] = len(jpeg)
+
+    # Each JPEG backend at each preview scale
+    for factor in SCALES:
+        for decoder in available_decoders(factor):
+            results[f'decode_{decoder.name}_1_{factor}'] = measure(
+                lambda: decoder.decode(jpeg), 20 * scale)
+
+    return results
+
+
+def _bench_reassembly(packets, scale):
+    reassembler = FrameReassembler(BufferPool(FRAME_BUFFER_SIZE, 4))
+    fields = [(int.from_bytes(p[PACKET_SEQ_OFFSET:PACKET_SEQ_OFFSET + 2], 'little'),
+               memoryview(p)[stream_video.PROPRIETARY_HEADER_LENGTH:]) for p in packets]
+    total = len(packets)
+    counter = [0]
+
+    def one_frame():
+        counter[0] += 1
+        frame_id = counter[0]
+        for seq, payload in fields:
+            frame = reassembler.add(frame_id, 2, seq, total, payload, 0.0)
+        reassembler.release(frame)
+
+    return measure(one_frame, 200 * scale)
+
+
+def _bench_hd_reassembly(packets, scale):
+    # Through the packet view, as the receiver sees them
+    reassembler = StreamReassembler(BufferPool(HD_FRAME_BUFFER_SIZE, 2))
+    view = HDPacket()
+
+    def one_frame():
+        for packet in packets:
+            view.bind(packet)
+            frame = reassembler.add(view.payload, view.first, view.last, 0.0)
+        reassembler.release(frame)
+
+    return measure(one_frame, 200 * scale)
+
+
+# --- macro-benchmarks ---
+
+def simulated_session(frames, fps, duration, loss=0.0, reorder=0.0, stream='multi'):
+    """Live session against simulator.py over localhost, headless"""
+    drone = simulator.DroneSimulator(frames, fps=fps, loss=loss, reorder=reorder, seed=1,
+                                     stream=stream)
+    drone_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    drone_sock.bind(('127.0.0.1', 0))
+    stop = threading.Event()
+    drone_thread = threading.Thread(target=drone.run, args=(drone_sock, stop), daemon=True)
+    drone_thread.start()
+
+    receiver = stream_video.create_video_receiver(display=None, record=None)
+    session = DroneSession('127.0.0.1', drone_sock.getsockname()[1], stream_video.START_COMMAND)
+    receiver.attach(session)
+    session.add_timer(receiver.reassembler.timeout, lambda: receiver.expire(time.monotonic()))
+
+    with quiet():
+        receiver.pipeline.start()
+        session_thread = SessionThread(session, 0, rcvbuf=4 * 1024 * 1024)
+        session_thread.start()
+        session_thread.ready.wait()
+        start = time.perf_counter()
+        time.sleep(duration)
+        session_thread.stop()
+        elapsed = time.perf_counter() - start
+        receiver.pipeline.stop(drain=True)
+    stop.set()
+    drone_thread.join()
+    drone_sock.close()
+
+    latency = receiver.pipeline.latency
+    return {
+        'fps_offered': fps,
+        'duration': elapsed,
+        'frames_sent': drone.stats.frames_sent,
+        'packets_sent': drone.stats.packets_sent,
+        'packets_per_sec': session.packets_received / elapsed,
+        'frames_per_sec': receiver.pipeline.frames_decoded / elapsed,
+        'latency_p50_ms': _ms(latency.percentile(0.50)),
+        'latency_p99_ms': _ms(latency.percentile(0.99)),
+        'reassembly': receiver.reassemblers[stream].stats.as_dict(),
+        'kernel_drops': session.receive_stats.kernel_drops,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def replayed_session(frames, count):
+    """Replay of a synthetic capture as fast as possible"""
+    from replay import run_replay
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'bench_capture.bin')
+        with CaptureWriter(filename) as writer:
+            timestamp = 0
+            for frame_id in range(1, count + 1):
+                jpeg = frames[frame_id % len(frames)]
+                for packet in simulator.create_video_packets(frame_id, jpeg):
+                    writer.write(packet, timestamp)
+                    timestamp += 100000
+        with quiet():
+            result = run_replay(filename)
+
+    return {
+        'packets': result['packets'],
+        'frames': result['decoded'],
+        'packets_per_sec': result['packets_per_sec'],
+        'frames_per_sec': result['frames_per_sec'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+# --- reporting ---
+
+# Keys compared between runs (ops_per_sec is just the inverse of ns_per_op)
+_HIGHER_IS_BETTER = ('packets_per_sec', 'frames_per_sec')
+_LOWER_IS_BETTER = ('ns_per_op', 'latency_p50_ms', 'latency_p99_ms', 'peak_rss_mb')
+
+
+def compare(baseline, current, prefix=''):
+    """Yield (name, old, new, change, regressed) for comparable values"""
+    for key, value in current.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from compare(old or {}, value, name + '.')
+        elif key in _HIGHER_IS_BETTER + _LOWER_IS_BETTER and old and value is not None:
+            change = (value - old) / old
+            worse = -change if key in _HIGHER_IS_BETTER else change
+            yield name, old, value, change, worse > REGRESSION_THRESHOLD
+
+
+def print_results(results):
+    for name, result in results['micro'].items():
+        print(f"  {name:38s} {result['ns_per_op']:12.0f} ns/op {result['ops_per_sec']:14.0f} ops/s")
+    for name, result in results['macro'].items():
+        line = f"  {name:38s} {result['packets_per_sec']:10.0f} pkt/s {result['frames_per_sec']:8.1f} fps"
+        if result.get('latency_p50_ms') is not None:
+            line += f"  p50 {result['latency_p50_ms']:.1f} ms  p99 {result['latency_p99_ms']:.1f} ms"
+        line += f"  rss {result['peak_rss_mb']:.0f} MB"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the drone video receive path")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--quick', action='store_true', help="fewer iterations and shorter sessions")
+    parser.add_argument('--only', choices=('micro', 'macro'), help="run one group of benchmarks")
+    parser.add_argument('--fps', type=float, nargs='+', default=[25.0, 100.0],
+                        help="frame rates for the simulated sessions")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per simulated session")
+    parser.add_argument('--streams', nargs='+', default=['multi', 'hd'], choices=simulator.STREAMS,
+                        help="video streams for the simulated sessions")
+    args = parser.parse_args()
+
+    scale = 1 if args.quick else 5
+    duration = min(args.duration, 2.0) if args.quick else args.duration
+    frames = simulator.load_frames(None, (640, 480), 30)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'micro': {},
+        'macro': {},
+    }
+
+    if args.only != 'macro':
+        print("⏱️  Micro-benchmarks")
+        results['micro'] = micro_benchmarks(frames[0], scale)
+    if args.only != 'micro':
+        print("⏱️  Macro-benchmarks")
+        for stream in args.streams:
+            # The multi-packet sessions keep their original names for --compare
+            prefix = 'simulated' if stream == 'multi' else f'simulated_{stream}'
+            for fps in args.fps:
+                results['macro'][f'{prefix}_{fps:g}fps'] = simulated_session(frames, fps, duration,
+                                                                             stream=stream)
+        results['macro']['replay'] = replayed_session(frames, 60 * scale)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print(f"\n📈 Compared with {args.compare}")
+        for name, old, new, change, regressed in compare(baseline, results):
+            flag = '❌' if regressed else '  '
+            print(f"{flag} {name:60s} {old:14.2f} -> {new:14.2f} ({change:+.1%})")
+            regressions += regressed
+        if regressions:
+            print(f"\n❌ {regressions} regression(s) over {REGRESSION_THRESHOLD:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""
+Indexed packet capture format.
+
+A capture file starts with a small header followed by one record per
+datagram:
+
+    magic      8 bytes  b'DRNCAP01'
+    per record:
+        length     4 bytes  uint32, datagram length
+        timestamp  8 bytes  uint64, monotonic receive time in nanoseconds
+        data       length bytes
+
+A sidecar index (capture + '.idx') holds one fixed-size entry per video
+frame, written the first time a frame_id is seen:
+
+    frame_id   4 bytes  uint32
+    offset     8 bytes  uint64, file offset of the frame's first record
+
+CaptureReader maps the file with mmap and yields zero-copy memoryview
+packets, so whole captures can be walked without reading them into memory.
+
+The original stream_video.py wrote every datagram back to back with no
+framing at all. convert_raw_dump() turns such a legacy dump into a capture:
+0x6363 packets are split at their pkt_len (the length of the whole
+datagram) and lewei_cmd packets at HD_PACKET_SIZE, resyncing on the next
+magic wherever that does not line up, and every new frame is stamped
+RAW_FRAME_INTERVAL_NS after the last, as the dump kept no times.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from protocol import (CMD_NAMES, CMD_SINGLE_VIDEO, CMD_VIDEO, HD_MAGIC, HD_PACKET_SIZE, HEADER_LENGTH,
+                      MAGIC, PAYLOAD_OFFSET, HDPacket, VGAPacket, is_hd, is_vga)
+
+CAPTURE_MAGIC = b'DRNCAP01'
+RECORD_HEADER = struct.Struct('<IQ')
+INDEX_ENTRY = struct.Struct('<IQ')
+INDEX_SUFFIX = '.idx'
+
+# Records are gathered in memory and written out in chunks of this size
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Time between frames given to a legacy dump, which has none (25 fps)
+RAW_FRAME_INTERVAL_NS = 40000000
+
+
+class CaptureWriter:
+    """
+    Appends datagrams to a capture file.
+
+    Records are packed into a preallocated buffer and flushed with one
+    write() per WRITE_BUFFER_SIZE instead of one per datagram.
+    """
+
+    def __init__(self, filename, buffer_size=WRITE_BUFFER_SIZE):
+        self.filename = filename
+        self.records = 0
+        self._file = open(filename, 'wb')
+        self._index = open(filename + INDEX_SUFFIX, 'wb')
+        self._buffer = bytearray(buffer_size)
+        self._used = 0
+        self._offset = len(CAPTURE_MAGIC)
+        self._last_frame_id = None
+        self._packet = VGAPacket()
+        self._file.write(CAPTURE_MAGIC)
+
+    def write(self, data, timestamp_ns=None):
+        """Append one datagram, stamped with time.monotonic_ns() by default"""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+
+        length = len(data)
+        size = RECORD_HEADER.size + length
+        if self._used + size > len(self._buffer):
+            self.flush()
+            if size > len(self._buffer):
+                self._buffer = bytearray(size)
+
+        # Index video packets by the offset of their frame's first record
+        if length >= HEADER_LENGTH and is_vga(data) and data[2] == CMD_VIDEO:
+            frame_id = self._packet.bind(data).frame_id
+            if frame_id != self._last_frame_id:
+                self._index.write(INDEX_ENTRY.pack(frame_id, self._offset))
+                self._last_frame_id = frame_id
+
+        RECORD_HEADER.pack_into(self._buffer, self._used, length, timestamp_ns)
+        start = self._used + RECORD_HEADER.size
+        self._buffer[start:start + length] = data
+        self._used += size
+        self._offset += size
+        self.records += 1
+
+    def flush(self):
+        if self._used:
+            self._file.write(memoryview(self._buffer)[:self._used])
+            self._used = 0
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureReader:
+    """
+    Memory-mapped reader for capture files.
+
+    Iterating yields (timestamp_ns, packet) pairs where packet is a
+    memoryview into the mapping; views must be released (or dropped)
+    before close().
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(CAPTURE_MAGIC):
+            self._file.close()
+            raise ValueError(f"{filename} is not a capture file")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a capture file")
+        self.view = memoryview(self._map)
+        self._index = None
+
+    def __iter__(self):
+        return self.packets()
+
+    def packets(self, offset=len(CAPTURE_MAGIC), end=None):
+        """Yield (timestamp_ns, packet) from offset to end (a record offset) or the end of the file"""
+        view = self.view
+        end = len(view) if end is None else min(end, len(view))
+        unpack_from = RECORD_HEADER.unpack_from
+        header_size = RECORD_HEADER.size
+        while offset + header_size <= end:
+            length, timestamp_ns = unpack_from(view, offset)
+            start = offset + header_size
+            offset = start + length
+            if offset > end:
+                # Capture cut short mid-record (e.g. the recorder was killed)
+                break
+            yield timestamp_ns, view[start:offset]
+
+    def frame_offset(self, frame_id):
+        """File offset of the first record of frame_id, or None"""
+        return self.index.get(frame_id)
+
+    def frame_packets(self, frame_id):
+        """Yield the records from the start of frame_id onwards"""
+        offset = self.frame_offset(frame_id)
+        if offset is None:
+            return iter(())
+        return self.packets(offset)
+
+    @property
+    def index(self):
+        """frame_id -> offset, loaded from the sidecar index on first use"""
+        if self._index is None:
+            self._index = load_index(self.filename)
+        return self._index
+
+    def close(self):
+        if getattr(self, 'view', None) is not None:
+            self.view.release()
+            self.view = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_index(filename):
+    """
+    (frame_id, offset) of every sidecar index entry in file order, including
+    repeated frame_ids (a late packet or the drone restarting its count)
+    """
+    try:
+        with open(filename + INDEX_SUFFIX, 'rb') as f:
+            entries = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(entries) - len(entries) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(memoryview(entries)[:usable]))
+
+
+def load_index(filename):
+    """Read the sidecar index of a capture into a dict"""
+    index = {}
+    for frame_id, offset in read_index(filename):
+        index.setdefault(frame_id, offset)
+    return index
+
+
+def is_capture(filename):
+    """True if filename is in the indexed capture format"""
+    with open(filename, 'rb') as f:
+        return f.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+
+
+def is_raw_dump(filename):
+    """True if filename looks like a legacy dump: it starts with a packet, not a capture header"""
+    with open(filename, 'rb') as f:
+        start = f.read(len(HD_MAGIC))
+    return start[:len(MAGIC)] == MAGIC or start == HD_MAGIC
+
+
+def split_raw_dump(data):
+    """Yield the datagrams of a legacy dump held in data (bytes or an mmap)"""
+    end = len(data)
+    position = _next_packet(data, 0)
+    while position < end:
+        stop = position + _packet_length(data, position)
+        if stop > end or (stop < end and not _packet_length(data, stop)):
+            # The length does not lead to the next packet: a short (last) HD
+            # packet, or a datagram cut at the original 2048 byte receive buffer
+            stop = _next_packet(data, position + 1)
+        yield data[position:stop]
+        position = stop
+
+
+def _packet_length(data, position):
+    """Length a packet starting at position claims, 0 if none starts there"""
+    if data[position:position + len(HD_MAGIC)] == HD_MAGIC:
+        return HD_PACKET_SIZE
+    if data[position:position + len(MAGIC)] == MAGIC and position + HEADER_LENGTH <= len(data) and \
+            data[position + 2] in CMD_NAMES:
+        length = int.from_bytes(data[position + 5:position + 7], 'little')
+        return length if length >= HEADER_LENGTH else 0
+    return 0
+
+
+def _next_packet(data, start):
+    """Position of the first packet start from start on, one whose length leads to another"""
+    end = len(data)
+    while True:
+        found = [index for index in (data.find(MAGIC, start), data.find(HD_MAGIC, start)) if index >= 0]
+        if not found:
+            return end
+        position = min(found)
+        length = _packet_length(data, position)
+        if length and (position + length >= end or _packet_length(data, position + length)):
+            return position
+        start = position + 1
+
+
+def convert_raw_dump(source, filename, frame_interval_ns=RAW_FRAME_INTERVAL_NS):
+    """Write the legacy dump source out as a capture (and index), returns the number of datagrams"""
+    view, hd_view = VGAPacket(), HDPacket()
+    timestamp_ns, last_frame_id, records = 0, None, 0
+    with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            CaptureWriter(filename + '.tmp') as writer:
+        for packet in split_raw_dump(data):
+            if len(packet) > PAYLOAD_OFFSET and is_vga(packet) and packet[2] in (CMD_VIDEO, CMD_SINGLE_VIDEO):
+                frame_id = view.bind(packet).frame_id
+                if frame_id != last_frame_id:
+                    timestamp_ns += frame_interval_ns
+                    last_frame_id = frame_id
+            elif is_hd(packet) and hd_view.bind(packet).first:
+                timestamp_ns += frame_interval_ns
+            writer.write(packet, timestamp_ns)
+            records += 1
+    os.replace(filename + '.tmp' + INDEX_SUFFIX, filename + INDEX_SUFFIX)
+    os.replace(filename + '.tmp', filename)
+    return records
+
+
+class FrameExtractor:
+    """
+    The reassemblers for captured datagrams of every video stream. feed()
+    takes one datagram and returns the frame it completed, deobfuscated
+    by its frame_type unless deobfuscate is False, or None; the caller
+    gives the frame back with release(). Multi-packet frames are placed
+    by VGAPacket.video_position() as the live receiver places them, so a
+    capture yields the frames stream_video.py would have; packets cut short
+    of their data_len are clamped and counted in packets_clamped. cmd 0x0B
+    single-packet and HD lewei_cmd frames are read as well (HD frames are
+    numbered in order, they carry no frame_id).
+    """
+
+    def __init__(self, timeout=None, deobfuscate=True):
+        from reassembly import (BufferPool, FrameReassembler, SinglePacketReassembler,
+                                StreamReassembler, FRAME_BUFFER_SIZE, HD_FRAME_BUFFER_SIZE,
+                                FRAME_TIMEOUT, pool_release)
+        from obfuscation import deobfuscate_frame
+
+        self.timeout = timeout or FRAME_TIMEOUT
+        self._deobfuscate = deobfuscate_frame if deobfuscate else None
+        pool, hd_pool = BufferPool(FRAME_BUFFER_SIZE, 4), BufferPool(HD_FRAME_BUFFER_SIZE, 0)
+        self.reassemblers = {
+            'multi': FrameReassembler(pool, timeout=self.timeout),
+            'single': SinglePacketReassembler(pool),
+            'hd': StreamReassembler(hd_pool, timeout=self.timeout),
+        }
+        self.release = pool_release(pool, hd_pool)
+        self.packets_clamped = 0
+        self._view, self._hd_view = VGAPacket(), HDPacket()
+
+    def video_frame_id(self, packet):
+        """frame_id of a multi-packet video datagram, None for anything else"""
+        if len(packet) > PAYLOAD_OFFSET and is_vga(packet) and packet[2] == CMD_VIDEO:
+            return self._view.bind(packet).frame_id
+        return None
+
+    def feed(self, packet, now):
+        """Add one datagram received at now (seconds), returns a completed Frame or None"""
+        if len(packet) > PAYLOAD_OFFSET and is_vga(packet):
+            view = self._view.bind(packet)
+            if packet[2] == CMD_VIDEO:
+                packet_seq, total_packets, payload, clamped = view.video_position()
+                self.packets_clamped += clamped
+                frame = self.reassemblers['multi'].add(
+                    view.frame_id, view.frame_type, packet_seq, total_packets, payload, now)
+            elif packet[2] == CMD_SINGLE_VIDEO:
+                single = view.single_payload()
+                if single is None:
+                    return None
+                payload, clamped = single
+                self.packets_clamped += clamped
+                frame = self.reassemblers['single'].add(view.frame_id, view.frame_type, payload, now)
+            else:
+                return None
+        elif is_hd(packet):
+            hd_view = self._hd_view.bind(packet)
+            frame = self.reassemblers['hd'].add(hd_view.payload, hd_view.first, hd_view.last, now)
+        else:
+            return None
+        if frame is not None and self._deobfuscate is not None:
+            self._deobfuscate(frame)
+        return frame
+
+    def expire(self, now):
+        for reassembler in self.reassemblers.values():
+            reassembler.expire(now)
+
+    @property
+    def inflight(self):
+        return sum(reassembler.inflight for reassembler in self.reassemblers.values())
+
+    def stats(self):
+        """Reassembly counters of the streams that had packets"""
+        return {stream: reassembler.stats.as_dict() for stream, reassembler in self.reassemblers.items()
+                if reassembler.stats.packets}
+
+    def close(self):
+        """Drop the views of the last datagrams, so their capture can be closed"""
+        self._view.bind(b'')
+        self._hd_view.bind(b'')
+
+
+def read_frames(filename, timeout=None, deobfuscate=True):
+    """
+    Yield (frame_id, frame_type, jpeg bytes) for every complete frame in a
+    capture (see FrameExtractor).
+    """
+    extractor = FrameExtractor(timeout, deobfuscate)
+    with CaptureReader(filename) as capture:
+        packet = None
+        for timestamp_ns, packet in capture:
+            frame = extractor.feed(packet, timestamp_ns / 1e9)
+            if frame is not None:
+                yield frame.frame_id, frame.frame_type, bytes(frame.data)
+                extractor.release(frame)
+        del packet
+        extractor.close()
@@ -0,0 +1,264 @@
+"""
+Drone control packets (0x6363 protocol)
+Based on Java_com_lewei_lib_LeweiLib_LW93SendUdpData from liblewei-2.3.so
+
+The app sends one packet every 50ms to port 40000:
+
+    63 63 0a 00 0b 00 00 66 [RX] [RY] [LY] [LX] [TV] [TR] [TL] [CMD] [MODE] 99
+
+ControlState keeps that packet preallocated and patches the stick, trim,
+command and mode bytes in place, so a send allocates nothing. Input from
+other threads (keyboard, gamepad, an API) is queued with submit() and
+applied by the sending thread right before the next send, which also
+measures the achieved rate, send jitter and input-to-wire latency.
+"""
+
+import collections
+import socket
+import threading
+import time
+
+from metrics import Histogram
+
+# Send period of the Java control loop (FlyCtrl.java, Thread.sleep(50))
+CONTROL_INTERVAL = 0.05
+
+CONTROL_PACKET_LENGTH = 18
+
+NEUTRAL = 0x80
+STICK_MIN = 0x2f
+STICK_MAX = 0xd0
+
+COMMAND_NEUTRAL = 0x0c
+COMMAND_TAKEOFF = 0x1c
+COMMAND_LAND = 0x2c
+
+MODE_LOW_SPEED = 0x8c
+MODE_HIGH_SPEED = 0x84
+MODE_HEADLESS_LOW = 0x8e
+MODE_HEADLESS_HIGH = 0x86
+
+# Byte offsets of the control fields, after the 7-byte header and 0x66
+FIELD_OFFSETS = {
+    'right_x': 8,
+    'right_y': 9,
+    'left_y': 10,
+    'left_x': 11,
+    'trim_v': 12,
+    'trim_r': 13,
+    'trim_l': 14,
+    'command': 15,
+    'mode': 16,
+}
+
+STICKS = ('right_x', 'right_y', 'left_y', 'left_x')
+TRIMS = ('trim_v', 'trim_r', 'trim_l')
+
+
+def create_control_packet(right_x=NEUTRAL, right_y=NEUTRAL, left_y=NEUTRAL, left_x=NEUTRAL,
+                          trim_v=NEUTRAL, trim_r=NEUTRAL, trim_l=NEUTRAL,
+                          command=COMMAND_NEUTRAL, mode=MODE_LOW_SPEED):
+    """
+    Create 0x6363 control packet based on native library implementation
+
+    right_x:  Right stick X (aileron) - neutral=0x80
+    right_y:  Right stick Y (elevator) - neutral=0x80
+    left_y:   Left stick Y (throttle) - neutral=0x80
+    left_x:   Left stick X (rudder) - neutral=0x80, range 0x2f-0xd0
+    trim_v:   Trim vertical - base=0x80
+    trim_r:   Trim right - base=0x80
+    trim_l:   Trim left - base=0x80
+    command:  0x0c=neutral, 0x1c=takeoff, 0x2c=land
+    mode:     0x8c=low speed, 0x84=high speed, 0x8e=headless low, 0x86=headless high
+    """
+    control_data = bytearray([
+        0x66,      # Start of frame marker
+        right_x, right_y, left_y, left_x,
+        trim_v, trim_r, trim_l,
+        command,
+        mode,
+        0x99       # End of frame marker
+    ])
+
+    # Wrap with 7-byte 0x6363 header (as done in native code)
+    data_len = len(control_data)
+    packet = bytearray([
+        0x63, 0x63,                    # Header
+        0x0a,                          # Command type
+        0x00,                          # Sequence
+        data_len & 0xff,               # Length low byte
+        0x00,                          # Reserved
+        (data_len >> 8) & 0xff         # Length high byte
+    ])
+    packet.extend(control_data)
+
+    return bytes(packet)
+
+
+def _field(name):
+    offset = FIELD_OFFSETS[name]
+
+    def get(self):
+        return self.buffer[offset]
+
+    def set(self, value):
+        self.buffer[offset] = value
+
+    return property(get, set)
+
+
+class ControlStats:
+    """
+    Achieved send rate, jitter (deviation of each send interval from the
+    nominal one) and input-to-wire latency (submit() to the send that
+    carried the input)
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.send_errors = 0
+        self.first_sent = None
+        self.last_sent = None
+        self.jitter = Histogram()
+        self.input_latency = Histogram()
+
+    @property
+    def rate(self):
+        if self.sent < 2 or self.last_sent == self.first_sent:
+            return 0.0
+        return (self.sent - 1) / (self.last_sent - self.first_sent)
+
+    def summary(self):
+        """Rate in Hz, jitter and input latency percentiles in ms"""
+        ms = lambda seconds: None if seconds is None else seconds * 1000
+        return {
+            'sent': self.sent,
+            'send_errors': self.send_errors,
+            'rate_hz': self.rate,
+            'jitter_p50_ms': ms(self.jitter.percentile(0.50)),
+            'jitter_p99_ms': ms(self.jitter.percentile(0.99)),
+            'jitter_max_ms': ms(max(self.jitter.recent, default=None)),
+            'input_latency_p50_ms': ms(self.input_latency.percentile(0.50)),
+            'input_latency_p99_ms': ms(self.input_latency.percentile(0.99)),
+        }
+
+
+class ControlState:
+    """
+    Current stick, trim, command and mode values, stored directly in the
+    preallocated control packet.
+
+    The fields can be set directly from the sending thread; other threads
+    call submit(), which is thread-safe and applies all its fields in the
+    same packet. Takeoff/land commands are one-shot and fall back to
+    neutral once sent.
+    """
+
+    right_x = _field('right_x')
+    right_y = _field('right_y')
+    left_y = _field('left_y')
+    left_x = _field('left_x')
+    trim_v = _field('trim_v')
+    trim_r = _field('trim_r')
+    trim_l = _field('trim_l')
+    command = _field('command')
+    mode = _field('mode')
+
+    def __init__(self, interval=CONTROL_INTERVAL):
+        self.interval = interval
+        self.buffer = bytearray(create_control_packet())
+        self.stats = ControlStats()
+        # deque append/popleft are atomic, so inputs need no lock
+        self._inputs = collections.deque()
+        self._applied = []
+
+    def reset(self):
+        """Centre the sticks and trims and clear any pending command"""
+        for name in STICKS + TRIMS:
+            setattr(self, name, NEUTRAL)
+        self.command = COMMAND_NEUTRAL
+
+    def submit(self, **fields):
+        """Queue field values for the next send, from any thread"""
+        for name, value in fields.items():
+            if name not in FIELD_OFFSETS:
+                raise ValueError(f"Unknown control field {name}")
+            if not 0 <= value <= 0xff:
+                raise ValueError(f"{name}={value} is not a byte")
+        self._inputs.append((time.monotonic(), fields))
+
+    def packet(self):
+        """Apply queued inputs and return the packet for the next send (not a copy)"""
+        inputs = self._inputs
+        while inputs:
+            timestamp, fields = inputs.popleft()
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._applied.append(timestamp)
+        return self.buffer
+
+    def sent(self, now):
+        """Account for a send that finished at now (time.monotonic())"""
+        stats = self.stats
+        if stats.last_sent is None:
+            stats.first_sent = now
+        else:
+            stats.jitter.observe(abs(now - stats.last_sent - self.interval))
+        stats.last_sent = now
+        stats.sent += 1
+
+        for timestamp in self._applied:
+            stats.input_latency.observe(now - timestamp)
+        self._applied.clear()
+
+        if self.command != COMMAND_NEUTRAL:
+            self.command = COMMAND_NEUTRAL
+
+
+class ControlSender(threading.Thread):
+    """
+    Sends a ControlState's packet every state.interval on a thread of its
+    own, for tools without a DroneSession. Sends are scheduled against
+    absolute monotonic deadlines, so the period does not drift with send
+    time; ticks missed entirely are skipped rather than sent in a burst.
+    """
+
+    def __init__(self, state, address, sock=None):
+        super().__init__(name="control", daemon=True)
+        self.state = state
+        self.address = address
+        self.sock = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        state, interval = self.state, self.state.interval
+        deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sock.sendto(state.packet(), self.address)
+                state.sent(time.monotonic())
+            except OSError:
+                state.stats.send_errors += 1
+
+            deadline += interval
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                deadline += interval * (-delay // interval + 1)
+                delay = deadline - time.monotonic()
+            self._stop_event.wait(delay)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def print_control_summary(stats):
+    summary = stats.summary()
+    line = f"🎮 Control: {summary['sent']} packets @ {summary['rate_hz']:.1f} Hz"
+    if summary['jitter_p50_ms'] is not None:
+        line += (f", jitter p50 {summary['jitter_p50_ms']:.2f} ms p99 {summary['jitter_p99_ms']:.2f} ms"
+                 f" max {summary['jitter_max_ms']:.2f} ms")
+    if summary['input_latency_p50_ms'] is not None:
+        line += (f", input latency p50 {summary['input_latency_p50_ms']:.1f} ms"
+                 f" p99 {summary['input_latency_p99_ms']:.1f} ms")
+    print(line)
@@ -0,0 +1,184 @@
+"""
+Input sources for a ControlState (see control.py).
+
+Each runs on its own thread and hands its values to ControlState.submit(),
+the same queue any other code (an API, a script) can use, so the sending
+thread applies them right before the next packet:
+
+    KeyboardInput   terminal keys, as in WorkInProgress/control_interactive.py
+    GamepadInput    first joystick through pygame (optional dependency)
+"""
+
+import select
+import sys
+import threading
+
+from control import (NEUTRAL, STICK_MIN, STICK_MAX, STICKS, TRIMS, CONTROL_INTERVAL,
+                     COMMAND_NEUTRAL, COMMAND_TAKEOFF, COMMAND_LAND,
+                     MODE_LOW_SPEED, MODE_HIGH_SPEED)
+
+# Stick change per key press
+KEY_STEP = 10
+
+# key -> (stick, direction)
+STICK_KEYS = {
+    'w': ('left_y', 1),     # Throttle up
+    's': ('left_y', -1),    # Throttle down
+    'a': ('left_x', -1),    # Rudder left
+    'd': ('left_x', 1),     # Rudder right
+    'i': ('right_y', 1),    # Pitch forward
+    'k': ('right_y', -1),   # Pitch back
+    'j': ('right_x', -1),   # Roll left
+    'l': ('right_x', 1),    # Roll right
+}
+
+KEY_HELP = """Controls:
+  W/S - Throttle up/down (left stick Y)
+  A/D - Rudder left/right (left stick X)
+  I/K - Pitch forward/back (right stick Y)
+  J/L - Roll left/right (right stick X)
+  T - Takeoff (command=0x1c)
+  G - Land (command=0x2c)
+  H - Toggle speed (0x8c/0x84)
+  R - Reset to neutral
+  Q - Quit"""
+
+# Gamepad axes (SDL layout of most pads) and buttons
+GAMEPAD_AXES = {'left_x': 0, 'left_y': 1, 'right_x': 2, 'right_y': 3}
+GAMEPAD_INVERTED = ('left_y', 'right_y')
+GAMEPAD_TAKEOFF_BUTTON = 0
+GAMEPAD_LAND_BUTTON = 1
+GAMEPAD_SPEED_BUTTON = 2
+GAMEPAD_DEADZONE = 0.05
+
+
+def _clamp(value):
+    return max(STICK_MIN, min(STICK_MAX, value))
+
+
+def axis_to_stick(axis):
+    """Gamepad axis position (-1..1) to a stick byte around NEUTRAL"""
+    if abs(axis) < GAMEPAD_DEADZONE:
+        return NEUTRAL
+    span = (STICK_MAX - NEUTRAL) if axis > 0 else (NEUTRAL - STICK_MIN)
+    return _clamp(NEUTRAL + round(axis * span))
+
+
+class KeyboardInput(threading.Thread):
+    """
+    Single-key terminal control (stdin in cbreak mode). Sticks move
+    KEY_STEP per press and stay there; on_quit is called for Q.
+    """
+
+    def __init__(self, state, on_quit=None):
+        super().__init__(name="keyboard", daemon=True)
+        self.state = state
+        self.on_quit = on_quit
+        self.sticks = dict.fromkeys(STICKS, NEUTRAL)
+        self.mode = MODE_LOW_SPEED
+        self._stop_event = threading.Event()
+
+    def run(self):
+        import termios
+        import tty
+
+        if not sys.stdin.isatty():
+            print("❌ Keyboard control needs a terminal on stdin")
+            return
+        fd = sys.stdin.fileno()
+        old_settings = termios.tcgetattr(fd)
+        try:
+            tty.setcbreak(fd)
+            while not self._stop_event.is_set():
+                if select.select([sys.stdin], [], [], 0.1)[0]:
+                    key = sys.stdin.read(1).lower()
+                    if key == 'q':
+                        if self.on_quit is not None:
+                            self.on_quit()
+                        break
+                    self.press(key)
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+    def press(self, key):
+        """Turn one key into a submit()"""
+        if key in STICK_KEYS:
+            name, direction = STICK_KEYS[key]
+            self.sticks[name] = _clamp(self.sticks[name] + direction * KEY_STEP)
+            self.state.submit(**{name: self.sticks[name]})
+        elif key == 't':
+            self.state.submit(command=COMMAND_TAKEOFF)
+            print("\nTAKEOFF command")
+        elif key == 'g':
+            self.state.submit(command=COMMAND_LAND)
+            print("\nLAND command")
+        elif key == 'h':
+            self.mode = MODE_HIGH_SPEED if self.mode == MODE_LOW_SPEED else MODE_LOW_SPEED
+            self.state.submit(mode=self.mode)
+            print(f"\nSpeed: {'HIGH' if self.mode == MODE_HIGH_SPEED else 'LOW'}")
+        elif key == 'r':
+            self.sticks = dict.fromkeys(STICKS, NEUTRAL)
+            self.state.submit(command=COMMAND_NEUTRAL, **self.sticks, **dict.fromkeys(TRIMS, NEUTRAL))
+            print("\nReset to neutral")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class GamepadInput(threading.Thread):
+    """
+    First joystick found by pygame, polled every interval. Only changed
+    values are submitted, so input latency is measured from the poll that
+    saw the change.
+    """
+
+    def __init__(self, state, interval=CONTROL_INTERVAL / 2, index=0):
+        import pygame
+
+        super().__init__(name="gamepad", daemon=True)
+        self.state = state
+        self.interval = interval
+        self._pygame = pygame
+        pygame.init()
+        pygame.joystick.init()
+        if pygame.joystick.get_count() <= index:
+            raise OSError("No gamepad connected")
+        self.joystick = pygame.joystick.Joystick(index)
+        self.joystick.init()
+        self.device = self.joystick.get_name()
+        self.mode = MODE_LOW_SPEED
+        self._stop_event = threading.Event()
+
+    def run(self):
+        joystick = self.joystick
+        last = {}
+        buttons = {}
+        while not self._stop_event.wait(self.interval):
+            self._pygame.event.pump()
+            changed = {}
+            for name, axis in GAMEPAD_AXES.items():
+                if axis >= joystick.get_numaxes():
+                    continue
+                position = joystick.get_axis(axis)
+                value = axis_to_stick(-position if name in GAMEPAD_INVERTED else position)
+                if last.get(name) != value:
+                    changed[name] = last[name] = value
+
+            # Buttons act on press, not while held
+            for button in (GAMEPAD_TAKEOFF_BUTTON, GAMEPAD_LAND_BUTTON, GAMEPAD_SPEED_BUTTON):
+                pressed = button < joystick.get_numbuttons() and joystick.get_button(button)
+                if pressed and not buttons.get(button):
+                    if button == GAMEPAD_TAKEOFF_BUTTON:
+                        changed['command'] = COMMAND_TAKEOFF
+                    elif button == GAMEPAD_LAND_BUTTON:
+                        changed['command'] = COMMAND_LAND
+                    else:
+                        self.mode = MODE_HIGH_SPEED if self.mode == MODE_LOW_SPEED else MODE_LOW_SPEED
+                        changed['mode'] = self.mode
+                buttons[button] = pressed
+
+            if changed:
+                self.state.submit(**changed)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,204 @@
+"""
+JPEG decoder backends.
+
+    opencv     cv2.imdecode; at scale 2, 4 or 8 it uses IMREAD_REDUCED_COLOR_*,
+               which scales in the DCT domain and skips most of the IDCT work
+    turbojpeg  libjpeg-turbo through PyTurboJPEG (pip install PyTurboJPEG),
+               used when the binding and the shared library are both present
+
+Every backend has decode(jpeg) -> BGR image or None. select_decoder('auto')
+times the available backends on a sample frame and keeps the fastest.
+Scaling only affects the decoded image; recording keeps the original bytes.
+
+ProcessPoolDecoder runs any of them in a process pool shared by several
+streams (see fleet.py), so decoding is not bound to one core by the GIL.
+
+OpenCV and NumPy are only imported once a backend is created, so the names
+here can be used by processes that never decode (stream_video.py --headless).
+"""
+
+import concurrent.futures
+import os
+import signal
+import time
+
+SCALES = (1, 2, 4, 8)
+
+# Sample decodes per backend for the startup benchmark
+AUTO_RUNS = 20
+
+# cv2 imread flag per scale, by name as cv2 is imported on first use
+_REDUCED_FLAGS = {
+    1: 'IMREAD_COLOR',
+    2: 'IMREAD_REDUCED_COLOR_2',
+    4: 'IMREAD_REDUCED_COLOR_4',
+    8: 'IMREAD_REDUCED_COLOR_8',
+}
+
+
+class OpenCVDecoder:
+    """cv2.imdecode, full size or DCT-scaled"""
+
+    name = 'opencv'
+
+    def __init__(self, scale=1):
+        import cv2
+        import numpy as np
+
+        if scale not in _REDUCED_FLAGS:
+            raise ValueError(f"Unsupported scale {scale}")
+        self.scale = scale
+        self._flags = getattr(cv2, _REDUCED_FLAGS[scale])
+        self._cv2, self._np = cv2, np
+
+    def decode(self, jpeg):
+        np = self._np
+        img = self._cv2.imdecode(np.frombuffer(jpeg, np.uint8), self._flags)
+        if img is None or img.size == 0:
+            return None
+        return img
+
+
+class TurboJPEGDecoder:
+    """libjpeg-turbo via PyTurboJPEG, raises ImportError/OSError if unavailable"""
+
+    name = 'turbojpeg'
+
+    def __init__(self, scale=1):
+        from turbojpeg import TurboJPEG
+
+        if scale not in SCALES:
+            raise ValueError(f"Unsupported scale {scale}")
+        self.scale = scale
+        self._turbo = TurboJPEG()
+        self._scaling = None if scale == 1 else (1, scale)
+
+    def decode(self, jpeg):
+        try:
+            img = self._turbo.decode(jpeg, scaling_factor=self._scaling)
+        except (OSError, ValueError):
+            return None
+        if img is None or img.size == 0:
+            return None
+        return img
+
+
+DECODERS = {
+    OpenCVDecoder.name: OpenCVDecoder,
+    TurboJPEGDecoder.name: TurboJPEGDecoder,
+}
+
+
+# Decoder instances of a pool worker process, by (backend, scale)
+_pool_decoders = {}
+
+
+def _pool_init():
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _pool_decode(backend, scale, jpeg, images):
+    """Runs in a pool worker; only the image shape comes back unless images is set"""
+    decoder = _pool_decoders.get((backend, scale))
+    if decoder is None:
+        decoder = _pool_decoders[(backend, scale)] = DECODERS[backend](scale)
+    img = decoder.decode(jpeg)
+    if img is None or images:
+        return img
+    return img.shape
+
+
+def create_decode_pool(workers=None):
+    """
+    Process pool for ProcessPoolDecoder, one worker per core by default.
+    The workers are started right away, before the caller starts any
+    threads of its own.
+    """
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                                  initializer=_pool_init)
+    pool.submit(time.monotonic).result()
+    return pool
+
+
+class ProcessPoolDecoder:
+    """
+    A backend run on a concurrent.futures process pool. decode() sends a
+    copy of the JPEG to a worker and blocks the calling pipeline worker
+    until the image comes back, so each stream keeps its own queues and
+    ordering while the decoding itself spreads over the cores.
+
+    With images=False only the image size is sent back and decode()
+    returns a read-only black image of that size (no memory behind it),
+    for headless runs that decode only to check the frames.
+    """
+
+    def __init__(self, pool, backend='opencv', scale=1, images=True):
+        if backend not in DECODERS:
+            raise ValueError(f"Unknown decoder {backend}, expected one of {', '.join(DECODERS)}")
+        self.pool = pool
+        self.backend = backend
+        self.name = f"{backend} (process pool)"
+        self.scale = scale
+        self.images = images
+
+    def decode(self, jpeg):
+        result = self.pool.submit(_pool_decode, self.backend, self.scale, bytes(jpeg),
+                                  self.images).result()
+        if result is None or self.images:
+            return result
+        import numpy as np
+
+        return np.broadcast_to(np.uint8(0), result)
+
+
+def available_decoders(scale=1):
+    """Instances of every backend that can be loaded here"""
+    decoders = []
+    for factory in DECODERS.values():
+        try:
+            decoders.append(factory(scale))
+        except (ImportError, OSError):
+            pass
+    return decoders
+
+
+def sample_jpeg(width=640, height=480):
+    """A camera-sized test frame for the startup benchmark"""
+    import cv2
+    import numpy as np
+
+    y, x = np.mgrid[0:height, 0:width]
+    img = np.dstack(((x * 255 // width), (y * 255 // height), ((x ^ y) & 0xFF))).astype(np.uint8)
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes()
+
+
+def benchmark_decoders(decoders, jpeg, runs=AUTO_RUNS):
+    """Best seconds per decode for each decoder, by name"""
+    results = {}
+    for decoder in decoders:
+        best = float('inf')
+        for _ in range(runs):
+            start = time.perf_counter()
+            decoder.decode(jpeg)
+            best = min(best, time.perf_counter() - start)
+        results[decoder.name] = best
+    return results
+
+
+def select_decoder(name='auto', scale=1, sample=None):
+    """
+    Backend by name, or with 'auto' the fastest available one on sample
+    (a synthetic 640x480 frame by default)
+    """
+    if name != 'auto':
+        if name not in DECODERS:
+            raise ValueError(f"Unknown decoder {name}, expected one of {', '.join(DECODERS)}")
+        return DECODERS[name](scale)
+
+    decoders = available_decoders(scale)
+    if len(decoders) == 1:
+        return decoders[0]
+    timings = benchmark_decoders(decoders, sample or sample_jpeg())
+    return min(decoders, key=lambda decoder: timings[decoder.name])
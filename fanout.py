@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Local fan-out of the reassembled JPEG frames to any number of viewers.
+
+The receiver publishes each frame once into a FrameHub, which only keeps
+the newest one. Every viewer thread sends that same bytes object straight
+from the hub (sendmsg() with the part header, nothing is joined, copied or
+re-encoded), and a viewer that is still busy sending when newer frames
+arrive simply skips to the newest, so slow clients never build a queue
+and adding viewers adds no decode work.
+
+    MjpegServer       HTTP: /stream.mjpg (multipart/x-mixed-replace, for
+                      browsers, VLC, ffplay), /frame.jpg and an index page
+    FrameFeedServer   raw frames on a TCP port or Unix socket, each as
+                      FEED_HEADER (length, frame_id, timestamp_ns) + JPEG
+
+Usage:
+    python3 stream_video.py --serve 8080 --feed /tmp/drone.sock
+    python3 fanout.py --connect /tmp/drone.sock
+"""
+
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from jpeg import validate_jpeg
+
+MJPEG_PORT = 8080
+
+# Raw feed frame header: JPEG length, frame_id, first packet time (monotonic ns)
+FEED_HEADER = struct.Struct('<IIQ')
+
+# A viewer that cannot take a frame for this long is disconnected
+CLIENT_SEND_TIMEOUT = 10.0
+
+# Kernel send buffer per viewer, a couple of frames. Left to autotuning it
+# grows to megabytes, and a slow viewer would queue there instead of skipping.
+CLIENT_SNDBUF = 64 * 1024
+
+BOUNDARY = b'frame'
+
+_INDEX_PAGE = b"""<!DOCTYPE html>
+<html><head><title>Drone Video</title></head>
+<body style="margin:0;background:#000"><img src="/stream.mjpg" style="width:100%"></body></html>
+"""
+
+
+class FrameHub:
+    """
+    Newest published frame and its sequence number. publish() runs on the
+    receiving thread and only swaps a reference and wakes the viewers;
+    wait() hands each viewer the newest frame it has not seen yet.
+    Frames failing validate_jpeg() are not published.
+    """
+
+    def __init__(self):
+        self.frames_published = 0
+        self.frames_rejected = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.clients = 0
+        self.closed = False
+        self._latest = None
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def publish(self, frame_num, frame):
+        """Pipeline publish stage; frame is a detached copy that is never modified"""
+        jpeg = frame.data
+        if validate_jpeg(jpeg):
+            self.frames_rejected += 1
+            return
+        started = int(frame.started * 1e9) if frame.started else 0
+        with self._cond:
+            self._seq += 1
+            self._latest = (self._seq, frame.frame_id, started, jpeg)
+            self.frames_published += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        """(seq, frame_id, timestamp_ns, jpeg) of the newest frame, None before the first"""
+        return self._latest
+
+    def wait(self, seq, timeout=None):
+        """The newest frame after seq, None on timeout or once closed"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or self._seq > seq, timeout)
+            if self.closed or self._seq <= seq:
+                return None
+            return self._latest
+
+    def frames(self, timeout=1.0):
+        """
+        Frames for one viewer: each time it is ready, the newest one it has
+        not had (anything older is skipped). Ends when the hub is closed.
+        """
+        with self._cond:
+            self.clients += 1
+        try:
+            seq = 0
+            while not self.closed:
+                item = self.wait(seq, timeout)
+                if item is None:
+                    continue
+                with self._cond:
+                    if seq:
+                        self.frames_skipped += item[0] - seq - 1
+                    self.frames_sent += 1
+                seq = item[0]
+                yield item
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            'published': self.frames_published,
+            'rejected': self.frames_rejected,
+            'sent': self.frames_sent,
+            'skipped': self.frames_skipped,
+            'clients': self.clients,
+        }
+
+
+def send_parts(sock, parts):
+    """
+    Send the buffers as one write with sendmsg(), without joining them,
+    and finish a partial send
+    """
+    parts = [memoryview(part) for part in parts]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts[0])
+            parts.pop(0)
+        if parts:
+            parts[0] = parts[0][sent:]
+
+
+def _prepare_client(sock):
+    sock.settimeout(CLIENT_SEND_TIMEOUT)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, CLIENT_SNDBUF)
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class MjpegServer:
+    """
+    Serves the hub's frames over HTTP from a background thread, one thread
+    per viewer. /stream.mjpg is the live stream, /frame.jpg the newest frame.
+    """
+
+    def __init__(self, hub, port=MJPEG_PORT, host='127.0.0.1'):
+        self.hub = hub
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/stream.mjpg':
+                    self.stream()
+                elif self.path == '/frame.jpg':
+                    latest = hub.latest()
+                    if latest is None:
+                        self.send_error(503, "No frame yet")
+                        return
+                    self.reply('image/jpeg', latest[3])
+                elif self.path == '/':
+                    self.reply('text/html', _INDEX_PAGE)
+                else:
+                    self.send_error(404)
+
+            def reply(self, content_type, body):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                send_parts(self.connection, [body])
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 f'multipart/x-mixed-replace; boundary={BOUNDARY.decode()}')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                self.wfile.flush()
+                _prepare_client(self.connection)
+                try:
+                    for seq, frame_id, started, jpeg in hub.frames():
+                        part = (b'--' + BOUNDARY + b'\r\nContent-Type: image/jpeg\r\n'
+                                b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n')
+                        send_parts(self.connection, (part, jpeg, b'\r\n'))
+                except OSError:
+                    pass  # viewer went away or stalled
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mjpeg", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.hub.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def parse_feed_address(text):
+    """host:port (or :port for localhost) to a TCP address, anything else is a Unix socket path"""
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return text
+
+
+class FrameFeedServer:
+    """
+    Raw frames for local consumers (recorders, analysis, other viewers) on
+    a TCP (host, port) or a Unix socket path: FEED_HEADER then the JPEG,
+    for every frame the client keeps up with.
+    """
+
+    def __init__(self, hub, address):
+        self.hub = hub
+        self.address = address
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                _prepare_client(self.request)
+                try:
+                    for seq, frame_id, started, jpeg in hub.frames():
+                        send_parts(self.request, (FEED_HEADER.pack(len(jpeg), frame_id, started), jpeg))
+                except OSError:
+                    pass
+
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = socketserver.ThreadingUnixStreamServer(address, Handler)
+        else:
+            self.server = socketserver.ThreadingTCPServer(address, Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="feed", daemon=True)
+
+    @property
+    def location(self):
+        address = self.server.server_address
+        return address if isinstance(address, str) else f"{address[0]}:{address[1]}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.hub.close()
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+def read_feed(address):
+    """(frame_id, timestamp_ns, jpeg) from a FrameFeedServer until it closes"""
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(address)
+        reader = sock.makefile('rb')
+        while True:
+            header = reader.read(FEED_HEADER.size)
+            if len(header) < FEED_HEADER.size:
+                return
+            length, frame_id, started = FEED_HEADER.unpack(header)
+            jpeg = reader.read(length)
+            if len(jpeg) < length:
+                return
+            yield frame_id, started, jpeg
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the raw frame feed of stream_video.py --feed")
+    parser.add_argument('--connect', required=True, help="host:port or Unix socket path")
+    parser.add_argument('--save', help="write the newest frame to this JPEG file every second")
+    args = parser.parse_args()
+
+    frames = 0
+    last_report = time.monotonic()
+    try:
+        for frame_id, started, jpeg in read_feed(parse_feed_address(args.connect)):
+            frames += 1
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                print(f"\rFrame {frame_id}: {frames / (now - last_report):.1f} fps, {len(jpeg)} bytes",
+                      end='', flush=True)
+                if args.save:
+                    with open(args.save, 'wb') as f:
+                        f.write(jpeg)
+                frames, last_report = 0, now
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"❌ Could not read feed {args.connect}: {e}")
+    print("\n🛑 Feed closed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Several drones from one ground station.
+
+Every drone gets its own DroneSession (socket, heartbeat, reassemblers,
+concealment, capture, recorder and metrics); what they share is:
+
+    one event loop       every drone's socket and timers on a single
+                         SessionLoop thread; receive only reassembles, so
+                         one loop keeps up with several drones
+    one process pool     JPEG decoding for all drones (ProcessPoolDecoder),
+                         one worker per core, so decoding is not held to a
+                         single core by the GIL
+    one metrics server   each drone's metrics labelled drone="name"
+
+Recording writes the drones' own JPEGs (no decode), so it stays on each
+drone's record thread. Drones are given as name=ip[:port][@[bind_ip:]local_port];
+with --simulate N, N simulator.py drones are started on localhost, each in a
+process of its own.
+
+Usage:
+    python3 fleet.py --drone front=192.168.0.1@54321 --drone rear=192.168.1.1@54322
+    python3 fleet.py --simulate 4 --fps 30 --duration 10 --headless
+"""
+
+import argparse
+import collections
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+import simulator
+from avi import AviRecorder
+from capture import CaptureWriter
+from decoders import DECODERS, SCALES, ProcessPoolDecoder, create_decode_pool, select_decoder
+from metrics import MetricsGroup, MetricsServer
+from reassembly import FRAME_TIMEOUT
+from session import DroneSession, SessionLoop
+from stream_video import (DRONE_COMMAND_PORT, START_COMMAND, STATUS_INTERVAL, create_metrics,
+                          create_video_receiver, frame_recorder, print_status)
+
+# Seconds the display loop sleeps when no drone had a frame to show
+DISPLAY_POLL = 0.005
+
+DroneSpec = collections.namedtuple('DroneSpec', 'name drone_ip drone_port local_port bind_ip')
+
+
+def parse_drone(text):
+    """
+    name=ip[:port][@[bind_ip:]local_port] to a DroneSpec. The port defaults
+    to 40000 and local_port to 0 (any free port, the drone answers whichever
+    port the start command came from).
+    """
+    name, sep, rest = text.partition('=')
+    if not sep or not name or not rest:
+        raise ValueError(f"Expected name=ip[:port][@[bind_ip:]local_port], got {text!r}")
+    address, _, local = rest.partition('@')
+    drone_ip, _, port = address.partition(':')
+    bind_ip, _, local_port = local.rpartition(':')
+    return DroneSpec(name, drone_ip, int(port or DRONE_COMMAND_PORT), int(local_port or 0),
+                     bind_ip or '0.0.0.0')
+
+
+class Drone:
+    """One drone of the fleet: its session, receiver, capture, recorder and metrics"""
+
+    def __init__(self, spec, decoder, workers, display=True, record_dir=None, capture_dir=None,
+                 frame_timeout=FRAME_TIMEOUT):
+        self.spec = spec
+        self.name = spec.name
+        self.window = f"Drone {spec.name}"
+        self.error = None
+        self.capture = CaptureWriter(os.path.join(capture_dir, f"{spec.name}.bin")) if capture_dir else None
+        self.recorder = AviRecorder(os.path.join(record_dir, f"{spec.name}.avi")) if record_dir else None
+        record = frame_recorder(self.recorder) if self.recorder else None
+
+        self.receiver = create_video_receiver(frame_timeout, self.capture,
+                                              display=self.show if display else None,
+                                              record=record, record_frames=True, decoder=decoder,
+                                              workers=workers)
+        self.pipeline = self.receiver.pipeline
+        self.session = DroneSession(spec.drone_ip, spec.drone_port, START_COMMAND)
+        self.receiver.attach(self.session)
+        self.session.add_timer(frame_timeout, lambda: self.receiver.expire(time.monotonic()))
+        self.metrics = create_metrics(self.receiver, self.session, labels={'drone': spec.name})
+
+    def show(self, img):
+        import cv2
+        # cv2.waitKey is called once per round by FleetManager.run()
+        cv2.imshow(self.window, img)
+
+    def close(self):
+        self.pipeline.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.capture is not None:
+            self.capture.close()
+
+
+class FleetStatus:
+    """Status line with each drone's decoded frame rate and dropped frames"""
+
+    def __init__(self, drones):
+        self.drones = drones
+        self._last = None
+
+    def __call__(self):
+        now = time.monotonic()
+        decoded = [drone.pipeline.frames_decoded for drone in self.drones]
+        elapsed = now - self._last[0] if self._last else 0
+        parts = []
+        for i, drone in enumerate(self.drones):
+            rate = (decoded[i] - self._last[1][i]) / elapsed if elapsed > 0 else 0.0
+            dropped = sum(reassembler.stats.frames_expired
+                          for reassembler in drone.receiver.reassemblers.values())
+            parts.append(f"{drone.name} {rate:.1f} fps ({dropped} dropped)")
+        self._last = (now, decoded)
+        return " | ".join(parts)
+
+
+class FleetManager:
+    """
+    Runs a Drone per DroneSpec. Each drone's pipeline gets enough decode
+    threads for the drones together to keep the pool's workers busy.
+    rcvbuf fixes every socket's SO_RCVBUF, by default each follows its
+    drone's traffic.
+    """
+
+    def __init__(self, specs, decoder, display=True, record_dir=None, capture_dir=None,
+                 frame_timeout=FRAME_TIMEOUT, rcvbuf=None, pool_workers=1):
+        names = [spec.name for spec in specs]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Drone names must be unique: {', '.join(names)}")
+        workers = max(1, -(-pool_workers // len(specs)))
+        self.display = display
+        self.drones = [Drone(spec, decoder, workers, display, record_dir, capture_dir, frame_timeout)
+                       for spec in specs]
+        self.loop = SessionLoop(rcvbuf)
+        for drone in self.drones:
+            self.loop.add(drone.session, drone.spec.local_port, drone.spec.bind_ip)
+        self.metrics = MetricsGroup(drone.metrics for drone in self.drones)
+
+    @property
+    def active(self):
+        """Drones whose socket is up"""
+        return [drone for drone in self.drones if drone.error is None]
+
+    def start(self):
+        """Start the pipelines and bind every socket, a drone that fails gets its error set"""
+        for drone in self.drones:
+            drone.pipeline.start()
+        self.loop.start()
+        self.loop.ready.wait()
+        for drone in self.drones:
+            drone.error = self.loop.errors.get(drone.session)
+        self.metrics.members = [drone.metrics for drone in self.active]
+        return self.active
+
+    def run(self, duration=None):
+        """
+        Show frames (or just wait, when headless) on the calling thread and
+        print the status line, until every session has closed or duration
+        seconds have passed
+        """
+        active = self.active
+        status = FleetStatus(active)
+        deadline = None if duration is None else time.monotonic() + duration
+        next_status = time.monotonic() + STATUS_INTERVAL
+        if self.display:
+            import cv2
+        while not self.loop.finished.is_set():
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if now >= next_status:
+                print_status(status)
+                next_status += STATUS_INTERVAL
+
+            if self.display:
+                shown = False
+                for drone in active:
+                    shown |= drone.pipeline.show_next(timeout=0)
+                cv2.waitKey(1)
+                if not shown:
+                    time.sleep(DISPLAY_POLL)
+            else:
+                wait = next_status - now if deadline is None else min(next_status, deadline) - now
+                self.loop.finished.wait(max(0, wait))
+
+    def stop(self):
+        self.loop.stop()
+        for drone in self.drones:
+            drone.close()
+
+    def summary(self):
+        """Per drone totals, by name"""
+        results = {}
+        for drone in self.drones:
+            receiver = drone.receiver
+            results[drone.name] = {
+                'error': str(drone.error) if drone.error else None,
+                'bytes': receiver.bytes_received,
+                'frames': receiver.frame_count,
+                'reassembly': {stream: reassembler.stats.as_dict()
+                               for stream, reassembler in receiver.reassemblers.items()
+                               if reassembler.stats.packets},
+                'pipeline': drone.pipeline.stats(),
+                'socket': drone.session.receive_stats.summary(),
+                'clamped': receiver.packets_clamped,
+                'hw_encoded': receiver.frames_hw_encoded,
+                'rejected': dict(receiver.frames_rejected),
+            }
+        return results
+
+
+def _simulate(conn, stop, fps, stream, loss, seed):
+    """A --simulate drone process: binds, sends its port back and streams until stop is set"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    drone = simulator.DroneSimulator(simulator.load_frames(), fps=fps, loss=loss, seed=seed,
+                                     stream=stream)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    conn.send(sock.getsockname()[1])
+    conn.close()
+    try:
+        drone.run(sock, stop)
+    finally:
+        sock.close()
+
+
+def start_simulators(count, fps=25.0, stream='multi', loss=0.0):
+    """
+    count simulated drones on localhost, each in its own process.
+    Returns their DroneSpecs, the Event that stops them and the processes.
+    """
+    stop = multiprocessing.Event()
+    specs, processes = [], []
+    for i in range(count):
+        receive, send = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_simulate, args=(send, stop, fps, stream, loss, i),
+                                          name=f"sim{i}", daemon=True)
+        process.start()
+        send.close()
+        specs.append(DroneSpec(f"sim{i}", '127.0.0.1', receive.recv(), 0, '127.0.0.1'))
+        processes.append(process)
+    return specs, stop, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive video from several drones at once")
+    parser.add_argument('--drone', action='append', default=[], type=parse_drone,
+                        metavar='NAME=IP[:PORT][@[BIND:]LOCAL_PORT]',
+                        help="a drone to connect to, may be repeated")
+    parser.add_argument('--simulate', type=int, default=0, metavar='N',
+                        help="also start N simulated drones on localhost")
+    parser.add_argument('--fps', type=float, default=25.0, help="simulated drone frame rate")
+    parser.add_argument('--stream', default='multi', choices=simulator.STREAMS,
+                        help="simulated drone video stream")
+    parser.add_argument('--loss', type=float, default=0.0, help="simulated packet loss probability")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--headless', action='store_true', help="decode without showing any windows")
+    parser.add_argument('--record-dir', help="record each drone to NAME_000.avi, ... in this directory")
+    parser.add_argument('--capture-dir', help="capture each drone's datagrams to NAME.bin in this directory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="decode processes shared by all drones")
+    parser.add_argument('--decoder', default='auto', choices=('auto',) + tuple(DECODERS),
+                        help="JPEG decoder, auto picks the fastest available at startup")
+    parser.add_argument('--preview-scale', type=int, default=1, choices=SCALES,
+                        help="decode at 1/N size")
+    parser.add_argument('--metrics-port', type=int, help="serve every drone's metrics over HTTP on this port")
+    args = parser.parse_args()
+
+    if not args.drone and not args.simulate:
+        parser.error("give at least one --drone or --simulate N")
+    for directory in (args.record_dir, args.capture_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    try:
+        backend = select_decoder(args.decoder, args.preview_scale)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"❌ Decoder {args.decoder} unavailable: {e}")
+        sys.exit(1)
+
+    # Simulators and decode workers are forked before any thread is started
+    specs, simulators, stop_simulators = list(args.drone), [], None
+    if args.simulate:
+        simulated, stop_simulators, simulators = start_simulators(args.simulate, args.fps, args.stream,
+                                                                  args.loss)
+        specs += simulated
+        print(f"🛸 {args.simulate} simulated drones at {args.fps} fps ({args.stream} stream)")
+    pool = create_decode_pool(args.workers)
+    decoder = ProcessPoolDecoder(pool, backend.name, args.preview_scale, images=not args.headless)
+    print(f"🖼️  Decoder: {backend.name} at 1/{args.preview_scale} scale on {args.workers} processes")
+
+    try:
+        fleet = FleetManager(specs, decoder, display=not args.headless, record_dir=args.record_dir,
+                             capture_dir=args.capture_dir, pool_workers=args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = None
+    if args.metrics_port is not None:
+        try:
+            server = MetricsServer(fleet.metrics, args.metrics_port).start()
+            print(f"📈 Metrics on http://127.0.0.1:{server.port}/metrics")
+        except OSError as e:
+            print(f"❌ Could not start metrics server on port {args.metrics_port}: {e}")
+
+    active = fleet.start()
+    for drone in fleet.drones:
+        if drone.error:
+            print(f"❌ {drone.name}: could not bind port {drone.spec.local_port}: {drone.error}")
+        else:
+            print(f"🔗 {drone.name}: {drone.spec.drone_ip}:{drone.spec.drone_port}")
+    if not args.headless:
+        import cv2
+        for drone in active:
+            cv2.namedWindow(drone.window, cv2.WINDOW_AUTOSIZE)
+
+    print(f"\n📺 Receiving from {len(active)} drones, press Ctrl+C to stop.")
+    try:
+        if active:
+            fleet.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+        pool.shutdown()
+        if server is not None:
+            server.stop()
+        if stop_simulators is not None:
+            stop_simulators.set()
+            for process in simulators:
+                process.join()
+        if not args.headless:
+            cv2.destroyAllWindows()
+
+    print("\n🛑 Fleet stopped.")
+    for name, result in fleet.summary().items():
+        if result['error']:
+            continue
+        print(f"🛸 {name}: {result['bytes'] / (1024 * 1024):.2f} MB, {result['frames']} frames")
+        for stream, stats in result['reassembly'].items():
+            print(f"   Reassembly ({stream}): {stats}")
+        print(f"   Pipeline: {result['pipeline']}")
+        socket_stats = result['socket']
+        print(f"   Socket: rcvbuf {socket_stats['rcvbuf'] // 1024} KB, "
+              f"kernel drops {socket_stats['kernel_drops']}")
+        if result['clamped']:
+            print(f"   Packets cut short of their data_len: {result['clamped']}")
+        if result['hw_encoded']:
+            print(f"   Hardware-encoded (0x81) frames passed through undecoded: {result['hw_encoded']}")
+        if result['rejected']:
+            print(f"   Rejected before decode: {result['rejected']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Decoded frames in a multiprocessing.shared_memory ring, for vision processes
+that need pixels: each frame is decoded once by the pipeline, written once,
+and read in place by any number of consumers.
+
+Layout (all little endian, 64-byte aligned):
+
+    header   magic "DRNRING1", slots, height, width, channels, write_seq
+    meta     per slot: seq, timestamp_ns, frame_id, height, width
+    slots    slots x height x width x channels bytes (BGR)
+
+Frame seq n (from 1) goes to slot n % slots. The writer zeroes the slot's
+seq, writes pixels and metadata, then sets the slot's seq and finally
+write_seq. A reader maps a slot as a NumPy array without copying; the
+array stays valid until the writer laps the ring, which valid() detects
+(the slot's seq no longer matches). A reader that fell more than a ring
+behind skips to the oldest frame still there and counts the overrun.
+timestamp_ns is the frame's first packet on the time.monotonic() clock,
+which is shared by every process on the machine.
+
+Usage:
+    python3 stream_video.py --ring drone_frames
+    python3 frame_ring.py drone_frames
+"""
+
+import argparse
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+RING_SLOTS = 8
+RING_HEIGHT = 480
+RING_WIDTH = 640
+RING_CHANNELS = 3
+
+# Seconds a reader sleeps between checks for a new frame
+RING_POLL = 0.001
+
+MAGIC = b'DRNRING1'
+_ALIGN = 64
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('slots', '<u4'), ('height', '<u4'), ('width', '<u4'),
+                         ('channels', '<u4'), ('write_seq', '<u8')])
+META_DTYPE = np.dtype([('seq', '<u8'), ('timestamp_ns', '<u8'), ('frame_id', '<u4'),
+                       ('height', '<u2'), ('width', '<u2'), ('reserved', 'V8')])
+
+RingFrame = namedtuple('RingFrame', 'seq frame_id timestamp_ns image')
+
+
+def _aligned(size):
+    return -(-size // _ALIGN) * _ALIGN
+
+
+def ring_size(slots, height=RING_HEIGHT, width=RING_WIDTH, channels=RING_CHANNELS):
+    """Bytes of shared memory for a ring"""
+    return _slots_offset(slots) + slots * height * width * channels
+
+
+def _slots_offset(slots):
+    return _aligned(HEADER_DTYPE.itemsize) + _aligned(slots * META_DTYPE.itemsize)
+
+
+class _Ring:
+    """Views of the header, metadata and slots of a ring's shared memory"""
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((), HEADER_DTYPE, shm.buf)
+
+    def _map(self):
+        header = self.header
+        self.slots = int(header['slots'])
+        self.shape = (int(header['height']), int(header['width']), int(header['channels']))
+        self.slot_size = self.shape[0] * self.shape[1] * self.shape[2]
+        meta = np.ndarray((self.slots,), META_DTYPE, self.shm.buf, _aligned(HEADER_DTYPE.itemsize))
+        self.slot_seq = meta['seq']
+        self.slot_timestamp = meta['timestamp_ns']
+        self.slot_frame_id = meta['frame_id']
+        self.slot_height = meta['height']
+        self.slot_width = meta['width']
+        self.pixels = np.ndarray((self.slots, self.slot_size), np.uint8, self.shm.buf,
+                                 _slots_offset(self.slots))
+
+    def _image(self, slot, height, width):
+        return self.pixels[slot, :height * width * self.shape[2]].reshape(height, width, self.shape[2])
+
+    def close(self):
+        # The views must go before the mapping can be closed
+        self.header = self.pixels = None
+        self.slot_seq = self.slot_timestamp = self.slot_frame_id = None
+        self.slot_height = self.slot_width = None
+        self.shm.close()
+
+
+class FrameRingWriter(_Ring):
+    """
+    Creates the ring and writes decoded images into it; the Pipeline's
+    share stage. Images larger than a slot are not shared. Decode workers
+    can finish out of order, so an image older than the last one written
+    is dropped. Thread-safe, but there must be one writer per ring.
+    """
+
+    def __init__(self, name=None, slots=RING_SLOTS, height=RING_HEIGHT, width=RING_WIDTH,
+                 channels=RING_CHANNELS):
+        super().__init__(shared_memory.SharedMemory(name, create=True,
+                                                    size=ring_size(slots, height, width, channels)))
+        self.name = self.shm.name
+        header = self.header
+        header['slots'], header['height'], header['width'], header['channels'] = slots, height, width, channels
+        header['write_seq'] = 0
+        header['magic'] = MAGIC
+        self._map()
+        self.frames_written = 0
+        self.frames_oversized = 0
+        self._last_frame_num = -1
+        self._lock = threading.Lock()
+
+    def write(self, frame_num, frame_id, started, img):
+        """Copy one decoded image into the next slot; started is time.monotonic() or None"""
+        height, width = img.shape[:2]
+        if height > self.shape[0] or width > self.shape[1] or img.size != height * width * self.shape[2]:
+            self.frames_oversized += 1
+            return
+        with self._lock:
+            if frame_num < self._last_frame_num:
+                return
+            self._last_frame_num = frame_num
+            seq = int(self.header['write_seq']) + 1
+            slot = seq % self.slots
+            self.slot_seq[slot] = 0  # readers see the slot as being written
+            np.copyto(self._image(slot, height, width), img)
+            self.slot_timestamp[slot] = int(started * 1e9) if started else 0
+            self.slot_frame_id[slot] = frame_id
+            self.slot_height[slot], self.slot_width[slot] = height, width
+            self.slot_seq[slot] = seq
+            self.header['write_seq'] = seq
+            self.frames_written += 1
+
+    def close(self):
+        """Close and remove the ring; readers that still have it mapped keep their mapping"""
+        super().close()
+        self.shm.unlink()
+
+
+class FrameRingReader(_Ring):
+    """
+    Maps an existing ring by name. next() returns every frame in order
+    (skipping ahead when overrun), latest() only the newest one; images
+    are read-only views of the shared memory, valid() tells whether one
+    has been overwritten since.
+    """
+
+    def __init__(self, name):
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Before Python 3.13 the resource tracker would unlink the
+            # writer's segment when this process exits
+            from multiprocessing import resource_tracker
+            shm = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        super().__init__(shm)
+        if bytes(self.header['magic']) != MAGIC:
+            self.close()
+            raise ValueError(f"{name} is not a frame ring")
+        self._map()
+        self.seq = int(self.header['write_seq'])
+        self.frames_read = 0
+        self.frames_overrun = 0
+
+    @property
+    def write_seq(self):
+        return int(self.header['write_seq'])
+
+    def latest(self):
+        """Newest frame, or None if it has already been read (frames in between are skipped)"""
+        seq = self.write_seq
+        frame = self._get(seq) if seq > self.seq else None
+        if frame is not None:
+            self.seq = seq
+            self.frames_read += 1
+        return frame
+
+    def next(self, timeout=None):
+        """The frame after the last one read, waiting up to timeout for it; None on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            write_seq = self.write_seq
+            if write_seq > self.seq:
+                wanted = self.seq + 1
+                # The slot of anything older than a ring behind has been reused
+                oldest = max(1, write_seq - self.slots + 1)
+                if wanted < oldest:
+                    self.frames_overrun += oldest - wanted
+                    wanted = oldest
+                frame = self._get(wanted)
+                if frame is not None:
+                    self.seq = wanted
+                    self.frames_read += 1
+                    return frame
+                # Overwritten while looking at it, the next pass skips ahead
+                self.frames_overrun += 1
+                self.seq = wanted
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(RING_POLL)
+
+    def valid(self, frame):
+        """True while frame's slot still holds it (its image has not been overwritten)"""
+        return int(self.slot_seq[frame.seq % self.slots]) == frame.seq
+
+    def _get(self, seq):
+        slot = seq % self.slots
+        if int(self.slot_seq[slot]) != seq:
+            return None
+        frame = RingFrame(seq, int(self.slot_frame_id[slot]), int(self.slot_timestamp[slot]),
+                          self._image(slot, int(self.slot_height[slot]), int(self.slot_width[slot])))
+        # Metadata read while the writer was already in this slot
+        if int(self.slot_seq[slot]) != seq:
+            return None
+        frame.image.flags.writeable = False
+        return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow a decoded frame ring (stream_video.py --ring)")
+    parser.add_argument('name', help="shared memory name of the ring")
+    parser.add_argument('--latest', action='store_true', help="only take the newest frame each time")
+    args = parser.parse_args()
+
+    try:
+        reader = FrameRingReader(args.name)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ Could not open frame ring {args.name}: {e}")
+        return
+    print(f"🧩 Frame ring {args.name}: {reader.slots} slots of {'x'.join(map(str, reader.shape))}")
+
+    frames, torn = 0, 0
+    last_report = time.monotonic()
+    latency = 0.0
+    try:
+        while True:
+            frame = reader.latest() if args.latest else reader.next(timeout=1.0)
+            if frame is None:
+                time.sleep(RING_POLL)
+                continue
+            mean = float(frame.image.mean())
+            if not reader.valid(frame):
+                torn += 1
+            frames += 1
+            if frame.timestamp_ns:
+                latency = time.monotonic() - frame.timestamp_ns / 1e9
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                print(f"\rFrame {frame.frame_id} {frame.image.shape[1]}x{frame.image.shape[0]}: "
+                      f"{frames / (now - last_report):.1f} fps, mean {mean:.0f}, "
+                      f"age {latency * 1000:.1f} ms, overrun {reader.frames_overrun}, torn {torn}",
+                      end='', flush=True)
+                frames, last_report = 0, now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frame = None  # its image maps the ring
+        reader.close()
+    print("\n🛑 Reader stopped.")
+
+
+if __name__ == '__main__':
+    main()
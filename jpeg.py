@@ -0,0 +1,128 @@
+"""
+JPEG marker parsing on raw bytes, without decoding.
+
+validate_jpeg() walks the marker segments up to the start of scan and checks
+the end marker, so a frame that cannot decode is rejected in microseconds
+instead of costing an imdecode call:
+
+    FF D8                  SOI, must be first
+    FF xx LL LL ...        segments, LL (big endian) includes itself and must
+                           stay inside the frame
+    FF C0..CF (SOFn)       frame header with non-zero width and height
+    FF DA                  SOS, entropy-coded data follows
+    FF D9                  EOI, at the end (a little padding is allowed)
+"""
+
+import struct
+
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+
+# Bytes allowed after EOI (some encoders pad frames)
+EOI_SLACK = 8
+
+# SOFn markers, C4 (DHT), C8 (JPG) and CC (DAC) share the range but are not frames
+SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                         0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+
+# Markers with no length field (RSTn, TEM)
+_STANDALONE = frozenset(range(0xD0, 0xD8)) | {0x01}
+
+_U16BE = struct.Struct('>H')
+_SOF_SIZE = struct.Struct('>HH')
+
+
+def jpeg_size(data):
+    """(width, height) from a JPEG's SOF segment without decoding, or None"""
+    offset = 2
+    end = len(data)
+    while offset + 4 <= end:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        length, = _U16BE.unpack_from(data, offset + 2)
+        if marker in SOF_MARKERS:
+            if offset + 9 > end:
+                return None
+            height, width = _SOF_SIZE.unpack_from(data, offset + 5)
+            return width, height
+        if marker == SOS:
+            return None
+        offset += 2 + length
+    return None
+
+
+def scan_offset(data):
+    """
+    Offset where the entropy-coded scan starts (just past the SOS segment),
+    or None. Everything before it is the frame's header tables.
+    """
+    offset = 2
+    end = len(data)
+    while offset + 4 <= end:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in _STANDALONE:
+            offset += 2
+            continue
+        length, = _U16BE.unpack_from(data, offset + 2)
+        offset += 2 + length
+        if marker == SOS:
+            return offset if offset <= end else None
+    return None
+
+
+def validate_jpeg(data):
+    """
+    None if data looks like a decodable JPEG, otherwise a short reason
+    ('no SOI', 'bad segment', 'no SOF', 'no SOS', 'no EOI')
+    """
+    end = len(data)
+    if end < 4 or data[0] != 0xFF or data[1] != SOI:
+        return 'no SOI'
+
+    # EOI within the last few bytes
+    tail = bytes(data[max(2, end - EOI_SLACK - 2):end])
+    if b'\xff\xd9' not in tail:
+        return 'no EOI'
+
+    offset = 2
+    seen_sof = False
+    while offset + 4 <= end:
+        if data[offset] != 0xFF:
+            return 'bad segment'
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker in _STANDALONE:
+            offset += 2
+            continue
+        if marker in (SOI, EOI):
+            return 'bad segment'
+
+        length, = _U16BE.unpack_from(data, offset + 2)
+        if length < 2 or offset + 2 + length > end:
+            return 'bad segment'
+
+        if marker in SOF_MARKERS:
+            if length < 8:
+                return 'bad segment'
+            height, width = _SOF_SIZE.unpack_from(data, offset + 5)
+            if not height or not width:
+                return 'no SOF'
+            seen_sof = True
+        elif marker == SOS:
+            # Header walked, the scan runs to EOI
+            return None if seen_sof else 'no SOF'
+        offset += 2 + length
+    return 'no SOS'
@@ -0,0 +1,299 @@
+"""
+Low-overhead metrics and tracing.
+
+Hot-path counters stay plain integer attributes on the objects that own them
+(ReassemblyStats, Pipeline, DroneSession, ...). A Metrics registry reads them
+through callbacks only when a snapshot is taken, so counting costs an integer
+increment and nothing more. Histograms are used for per-frame timings.
+
+Snapshots are exposed three ways:
+
+    StatusLine         periodic one-line status for the terminal
+    MetricsServer      local HTTP endpoint, /metrics (Prometheus text)
+                       and /metrics.json, for a Metrics registry or a
+                       MetricsGroup of labelled ones (one per drone)
+    TraceRing          opt-in ring buffer of per-packet debug records;
+                       when disabled the hot path only tests for None
+"""
+
+import bisect
+import json
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, 50us to ~10s in x2 steps
+TIME_BUCKETS = tuple(0.00005 * 2 ** i for i in range(18))
+
+# Recent observations kept per histogram for exact percentiles
+HISTOGRAM_SAMPLES = 4096
+
+METRICS_PORT = 9108
+
+
+class Histogram:
+    """
+    Cumulative bucket counts (for Prometheus) plus a window of recent
+    samples (for percentiles).
+    """
+
+    def __init__(self, buckets=TIME_BUCKETS, samples=HISTOGRAM_SAMPLES):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        """q-quantile of the recent samples, None if there are none"""
+        samples = sorted(self.recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(0.50),
+            'p99': self.percentile(0.99),
+        }
+
+
+class Metrics:
+    """
+    Registry of named metrics. counter() and gauge() take a callable that
+    returns the current value; histogram() takes a Histogram. labels, e.g.
+    {'drone': 'front'}, are added to every exported sample.
+    """
+
+    def __init__(self, prefix='drone', labels=None):
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, read):
+        self._add(name, 'counter', help, read)
+
+    def gauge(self, name, help, read):
+        self._add(name, 'gauge', help, read)
+
+    def histogram(self, name, help, histogram):
+        self._add(name, 'histogram', help, histogram)
+
+    def snapshot(self):
+        """Current value of every metric, histograms as summaries"""
+        values = {}
+        for name, (kind, help, source) in self._items():
+            values[name] = source.summary() if kind == 'histogram' else source()
+        return values
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for name, (kind, help, source) in self._items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} {kind}")
+            lines.extend(self._samples(full, kind, source))
+        return "\n".join(lines) + "\n"
+
+    def _samples(self, full, kind, source):
+        labels = ''.join(f'{key}="{value}",' for key, value in self.labels.items())
+        if kind != 'histogram':
+            return [f"{full}{{{labels[:-1]}}} {source()}" if labels else f"{full} {source()}"]
+        lines = []
+        cumulative = 0
+        for bound, count in zip(source.buckets, source.counts):
+            cumulative += count
+            lines.append(f'{full}_bucket{{{labels}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{full}_bucket{{{labels}le="+Inf"}} {source.count}')
+        suffix = f"{{{labels[:-1]}}}" if labels else ''
+        lines.append(f"{full}_sum{suffix} {source.sum}")
+        lines.append(f"{full}_count{suffix} {source.count}")
+        return lines
+
+    def _add(self, name, kind, help, source):
+        with self._lock:
+            self._metrics[name] = (kind, help, source)
+
+    def _items(self):
+        with self._lock:
+            return list(self._metrics.items())
+
+
+class MetricsGroup:
+    """
+    Several labelled Metrics (e.g. one per drone) exported as one: each
+    metric family gets its HELP/TYPE once, followed by every member's
+    samples. Can be served by a MetricsServer like a single registry;
+    snapshot() is keyed by the members' label values.
+    """
+
+    def __init__(self, members=()):
+        self.members = list(members)
+
+    def add(self, metrics):
+        self.members.append(metrics)
+
+    def snapshot(self):
+        return {'/'.join(map(str, metrics.labels.values())): metrics.snapshot()
+                for metrics in self.members}
+
+    def prometheus(self):
+        families = {}
+        for metrics in self.members:
+            for name, (kind, help, source) in metrics._items():
+                full = f"{metrics.prefix}_{name}"
+                if full not in families:
+                    families[full] = (kind, help, [])
+                families[full][2].append((metrics, source))
+
+        lines = []
+        for full, (kind, help, sources) in families.items():
+            lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} {kind}")
+            for metrics, source in sources:
+                lines.extend(metrics._samples(full, kind, source))
+        return "\n".join(lines) + "\n"
+
+
+class StatusLine:
+    """
+    One-line terminal status built from a metrics snapshot, with rates
+    computed against the previous call.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._last = None
+
+    def __call__(self):
+        now = time.monotonic()
+        values = self.metrics.snapshot()
+        packets = values.get('packets_received_total', 0)
+        nbytes = values.get('bytes_received_total', 0)
+
+        packet_rate = byte_rate = 0.0
+        if self._last is not None:
+            then, last_packets, last_bytes = self._last
+            elapsed = now - then
+            if elapsed > 0:
+                packet_rate = (packets - last_packets) / elapsed
+                byte_rate = (nbytes - last_bytes) / elapsed
+        self._last = (now, packets, nbytes)
+
+        decode = values.get('decode_seconds') or {}
+        latency = values.get('frame_latency_seconds') or {}
+        status = (f"Bytes: {nbytes / (1024 * 1024):.2f} MB @ {byte_rate / (1024 * 1024):.2f} MB/s "
+                  f"({packet_rate:.0f} pkt/s) | Frames: {values.get('frames_completed_total', 0)} "
+                  f"ok, {values.get('frames_expired_total', 0)} dropped | "
+                  f"Decode p50 {_ms(decode.get('p50'))} | Latency p99 {_ms(latency.get('p99'))} | "
+                  f"Queue {values.get('decode_queue_depth', 0)}")
+        if values.get('kernel_drops_total'):
+            status += f" | Kernel drops {values['kernel_drops_total']}"
+        return status
+
+
+def _ms(seconds):
+    return '-' if seconds is None else f"{seconds * 1000:.1f} ms"
+
+
+class TraceRing:
+    """
+    Fixed-size ring of (monotonic time, record) tuples for per-packet
+    debugging. Callers keep a reference that is None when tracing is off
+    and check it before recording.
+    """
+
+    def __init__(self, size=4096):
+        self._ring = [None] * size
+        self._next = 0
+
+    def record(self, *fields):
+        self._ring[self._next % len(self._ring)] = (time.monotonic(), fields)
+        self._next += 1
+
+    def entries(self):
+        """Records oldest first"""
+        size = len(self._ring)
+        start = max(0, self._next - size)
+        return [self._ring[i % size] for i in range(start, self._next)]
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            for timestamp, fields in self.entries():
+                f.write(f"{timestamp:.6f} " + " ".join(str(field) for field in fields) + "\n")
+
+
+def json_safe(value):
+    """
+    value with NaN and infinite floats (e.g. a startup gauge that has no
+    reading yet) replaced by None, as JSON has no literal for them
+    """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+class MetricsServer:
+    """
+    Serves /metrics (Prometheus text), /metrics.json and, with a TraceRing,
+    /trace.json from a background thread on localhost. Values with no
+    reading (NaN) are null in the JSON.
+    """
+
+    def __init__(self, metrics, port=METRICS_PORT, host='127.0.0.1', trace=None):
+        self.metrics = metrics
+        self.trace = trace
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = server.metrics.prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path in ('/', '/metrics.json'):
+                    body = json.dumps(json_safe(server.metrics.snapshot()), allow_nan=False).encode()
+                    content_type = 'application/json'
+                elif self.path == '/trace.json' and server.trace is not None:
+                    body = json.dumps(json_safe(server.trace.entries()), default=str,
+                                      allow_nan=False).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,97 @@
+"""
+VGA frame deobfuscation (from liblewei-3.2.2.so line 15325-15336).
+
+The frame_type flag of each frame selects what happens to its reassembled
+data before it is a valid JPEG:
+
+    0x02      nothing, plain JPEG
+    0x81      hardware encoded, LW_Decode_New(data + (length >> 1), ...),
+              not recovered: passed through as is
+    other     one byte at encode_index(frame_id, length) is inverted
+
+frame_type is byte 7 of the frame's packets (VGAPacket.frame_type). The
+project notes disagree on where cVar14 comes from. Their text names
+local_7af, and their table puts that at 0x20. The table's offsets drift
+after 0x14, though: by the stack names local_7af is 0x7d8 - 0x7af = 0x29
+past local_7d8. That is a byte the drone fills with 0x5a (see
+protocol/vga.py). Byte 7 is local_7d1, which the table itself calls
+"Frame type/flags", and the original receiver read the flag there. In the
+drone's sample packet byte 7 is 0x03 while 0x20 and 0x29 are 0x5a, so either
+reading selects invert_byte.
+
+The transforms work in place on the frame's buffer, so the receive path
+deobfuscates a reassembled frame once, without copying it, before it is
+decoded, recorded or archived.
+"""
+
+FRAME_TYPE_PLAIN = 0x02
+FRAME_TYPE_HW_ENCODED = 0x81
+
+
+def encode_index(frame_id, data_length):
+    """
+    Calculate obfuscation index (from liblewei-3.2.2.so line 8718)
+    """
+    if data_length == 0:
+        return 0
+    if (data_length & 1) == 0:  # Even
+        val = data_length + 1 + (data_length ^ frame_id) ^ data_length
+        return val % data_length
+    else:  # Odd
+        val = (data_length ^ frame_id) + data_length ^ data_length
+        return val % data_length
+
+
+def encode_index_array(frame_ids, data_lengths):
+    """encode_index over arrays of frame_ids and lengths at once, for offline use"""
+    import numpy as np
+
+    frame_ids = np.asarray(frame_ids, dtype=np.int64)
+    lengths = np.asarray(data_lengths, dtype=np.int64)
+    mixed = lengths ^ frame_ids
+    val = np.where((lengths & 1) == 0,
+                   (lengths + 1 + mixed) ^ lengths,
+                   (mixed + lengths) ^ lengths)
+    # Zero lengths give index 0 (and must not divide by zero)
+    return np.where(lengths > 0, val % np.maximum(lengths, 1), 0)
+
+
+def invert_byte(buffer, length, frame_id):
+    """Simple obfuscation: one byte flipped at the encode_index position"""
+    buffer[encode_index(frame_id, length)] ^= 0xFF
+
+
+# frame_type -> in-place transform(buffer, length, frame_id), None for
+# frames passed through as they are; frame types not listed use invert_byte
+FRAME_TRANSFORMS = {
+    FRAME_TYPE_PLAIN: None,
+    # liblewei calls LW_Decode_New(data + (length >> 1), width, height,
+    # format) on these instead of the byte flip, but its body is not part of
+    # the disassembly in this project. They pass through untransformed (the
+    # receiver counts them as frames_hw_encoded) until it is recovered.
+    FRAME_TYPE_HW_ENCODED: None,
+}
+
+
+def deobfuscate_in_place(buffer, length, frame_id, frame_type):
+    """Apply frame_type's transform to the first length bytes of a writable buffer"""
+    transform = FRAME_TRANSFORMS.get(frame_type, invert_byte)
+    if transform is not None and length:
+        transform(buffer, length, frame_id)
+
+
+def deobfuscate_frame(frame):
+    """Deobfuscate a reassembled Frame in its own (pooled) buffer"""
+    deobfuscate_in_place(frame.buffer, frame.length, frame.frame_id, frame.frame_type)
+
+
+def decode_vga_obfuscation(data, frame_id, frame_type):
+    """
+    Deobfuscated copy of data for callers that don't own a buffer.
+    Plain frames are returned as they are.
+    """
+    if FRAME_TRANSFORMS.get(frame_type, invert_byte) is None or len(data) == 0:
+        return data
+    data = bytearray(data)
+    deobfuscate_in_place(data, len(data), frame_id, frame_type)
+    return data
@@ -0,0 +1,362 @@
+"""
+Staged video pipeline: receive -> decode -> display / record.
+
+The receive thread only reassembles frames and submits them; decoding runs on
+a small worker pool (cv2.imdecode releases the GIL), and the display and disk
+writer stages each have their own bounded queue so a slow window or disk
+never backs up into the socket.
+
+Each queue has an overflow policy:
+
+    block        producer waits for room (nothing is lost)
+    drop_oldest  oldest queued item is discarded to make room
+    spill        overflow is pickled to a temporary file and read back in order
+"""
+
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+
+from metrics import Histogram
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+SPILL = 'spill'
+
+# Decode workers, cv2 already parallelises inside imdecode so keep this small
+DECODE_WORKERS = min(2, os.cpu_count() or 1)
+
+# Queue depths, in frames
+DECODE_QUEUE_DEPTH = 8
+DISPLAY_QUEUE_DEPTH = 2
+RECORD_QUEUE_DEPTH = 64
+
+_SPILL_LENGTH = struct.Struct('<I')
+
+
+class StageQueue:
+    """
+    Bounded FIFO between two pipeline stages.
+
+    get() returns None on timeout or once the queue is closed and drained.
+    on_drop is called with every item discarded by the drop_oldest policy
+    (or still queued at close), so pooled buffers can be given back.
+    """
+
+    def __init__(self, maxsize, policy=BLOCK, on_drop=None):
+        if policy not in (BLOCK, DROP_OLDEST, SPILL):
+            raise ValueError(f"Unknown queue policy {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_drop = on_drop
+        self.dropped = 0
+        self.spilled = 0
+        self.high_water = 0
+        self.closed = False
+        self._items = deque()
+        self._spill = None
+        self._spill_read = 0
+        self._spill_write = 0
+        self._spill_count = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, item):
+        """Queue an item according to the policy, False if the queue is closed"""
+        dropped = None
+        with self._lock:
+            if self.policy == BLOCK:
+                while len(self._items) >= self.maxsize and not self.closed:
+                    self._not_full.wait()
+            if self.closed:
+                return False
+
+            if self._spill_count or len(self._items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                    self._items.append(item)
+                else:
+                    # Once spilling, later items go to disk too to keep FIFO order
+                    self._spill_item(item)
+            else:
+                self._items.append(item)
+
+            depth = len(self._items) + self._spill_count
+            if depth > self.high_water:
+                self.high_water = depth
+            self._not_empty.notify()
+
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped)
+        return True
+
+    def get(self, timeout=None):
+        """Next item, or None on timeout or when closed and empty"""
+        with self._lock:
+            if not self._items and not self._spill_count and not self.closed:
+                self._not_empty.wait(timeout)
+            if self._items:
+                item = self._items.popleft()
+            elif self._spill_count:
+                item = self._unspill_item()
+            else:
+                return None
+            self._not_full.notify()
+            return item
+
+    def close(self, discard=False):
+        """Stop accepting items, optionally discarding whatever is queued"""
+        with self._lock:
+            self.closed = True
+            leftovers = []
+            if discard:
+                leftovers = list(self._items)
+                self._items.clear()
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        if self.on_drop:
+            for item in leftovers:
+                self.on_drop(item)
+
+    def __len__(self):
+        return len(self._items) + self._spill_count
+
+    def _spill_item(self, item):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix='drone_spill_')
+        blob = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        self._spill.seek(self._spill_write)
+        self._spill.write(_SPILL_LENGTH.pack(len(blob)))
+        self._spill.write(blob)
+        self._spill_write = self._spill.tell()
+        self._spill_count += 1
+        self.spilled += 1
+
+    def _unspill_item(self):
+        self._spill.seek(self._spill_read)
+        length, = _SPILL_LENGTH.unpack(self._spill.read(_SPILL_LENGTH.size))
+        item = pickle.loads(self._spill.read(length))
+        self._spill_read = self._spill.tell()
+        self._spill_count -= 1
+        if not self._spill_count:
+            # Drained, start the file over
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read = self._spill_write = 0
+        return item
+
+
+class Pipeline:
+    """
+    Decode, display and record stages fed by submit().
+
+    decode(frame) returns an image or None (failed, as is an exception) and
+    is run on the worker pool; release(frame) is called once the frame is
+    no longer needed. conceal(img) runs serialised after decode.
+    display(img) runs on the thread calling run_display() (OpenCV windows
+    must stay on the main thread) and record(frame_num, img) on a dedicated
+    writer thread. With record_frames set, record(frame_num, frame) gets a
+    detached copy of the reassembled frame from submit() instead, so
+    recording needs no decode at all.
+    publish(frame_num, frame), if given, gets the same detached copy right
+    away on the submitting thread (e.g. FrameHub.publish, which must not
+    block). share(frame_num, frame_id, started, img), if given, gets every
+    decoded (and concealed) image on the decode worker that produced it,
+    e.g. FrameRingWriter.write for other processes. decode=None leaves the
+    decode stage out altogether (no workers, no display or share): frames
+    are only recorded and published, then released.
+
+    Live streams drop the oldest undecoded frame when the decoders fall
+    behind and spill frames to disk when the recorder does, so submit()
+    never waits on either; replay uses decode_policy=BLOCK and
+    record_policy=BLOCK so every frame is decoded and recorded.
+
+    latency is a Histogram of the time from a frame's first packet
+    (frame.started, in clock's time base) to it being displayed, or to being
+    ready for display when there is no display stage. clock=None turns this
+    off. decode_time and record_time time the decode and record stages.
+    """
+
+    def __init__(self, decode, release, display=None, record=None, conceal=None,
+                 workers=DECODE_WORKERS, record_policy=SPILL, decode_policy=DROP_OLDEST,
+                 clock=time.monotonic, record_frames=False, publish=None, share=None):
+        self.decode = decode
+        self.release = release
+        self.display = display
+        self.record = record
+        self.conceal = conceal
+        self.workers = workers
+        self.record_frames = record_frames
+        self.publish = publish
+        self.share = share
+
+        self.decode_queue = StageQueue(DECODE_QUEUE_DEPTH, decode_policy,
+                                       on_drop=lambda item: release(item[1]))
+        self.display_queue = StageQueue(DISPLAY_QUEUE_DEPTH, DROP_OLDEST)
+        self.record_queue = StageQueue(RECORD_QUEUE_DEPTH, record_policy)
+
+        self.frames_decoded = 0
+        self.frames_failed = 0
+        self.frames_displayed = 0
+        self.frames_recorded = 0
+        self.frames_record_failed = 0
+        self.clock = clock
+        self.latency = Histogram()
+        self.decode_time = Histogram()
+        self.record_time = Histogram()
+        self._conceal_lock = threading.Lock()
+        # Decode workers update the counters and histograms together
+        self._stats_lock = threading.Lock()
+        self._last_shown = -1
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers if self.decode else 0):
+            self._spawn(self._decode_worker, f"decode-{i}")
+        if self.record:
+            self._spawn(self._record_worker, "record")
+
+    def submit(self, frame_num, frame, decode=True):
+        """
+        Hand a reassembled frame to the decoders (only blocks under a BLOCK
+        policy). decode=False only records and publishes it, for frames the
+        decoders cannot read.
+        """
+        record_frame = self.record and self.record_frames
+        if record_frame or self.publish:
+            # one copy, shared by the recorder and the viewers
+            detached = frame.detach()
+            if self.publish:
+                self.publish(frame_num, detached)
+            if record_frame:
+                self.record_queue.put((frame_num, detached))
+        if self.decode is None or not decode or not self.decode_queue.put((frame_num, frame)):
+            self.release(frame)
+
+    def run_display(self, stop_event):
+        """Show decoded frames on the calling thread until stop_event is set"""
+        while not stop_event.is_set():
+            self.show_next(timeout=0.1)
+
+    def show_next(self, timeout=None):
+        """
+        Show the next decoded frame on the calling thread, waiting up to
+        timeout for one; False if none was queued. Lets one thread drive
+        the windows of several pipelines.
+        """
+        item = self.display_queue.get(timeout=timeout)
+        if item is None:
+            return False
+        frame_num, img, started = item
+        # Workers can finish out of order, never step backwards
+        if frame_num < self._last_shown:
+            return True
+        self._last_shown = frame_num
+        self.display(img)
+        self.frames_displayed += 1
+        if started is not None:
+            self.latency.observe(self.clock() - started)
+        return True
+
+    def stop(self, drain=False):
+        """
+        Discard undecoded frames (or decode them all if drain is set),
+        then let the recorder drain and exit
+        """
+        self.decode_queue.close(discard=not drain)
+        for thread in self._threads:
+            if thread.name.startswith('decode'):
+                thread.join()
+        self.display_queue.close(discard=True)
+        self.record_queue.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        return {
+            'decoded': self.frames_decoded,
+            'failed': self.frames_failed,
+            'displayed': self.frames_displayed,
+            'recorded': self.frames_recorded,
+            'record_failed': self.frames_record_failed,
+            'decode_dropped': self.decode_queue.dropped,
+            'display_dropped': self.display_queue.dropped,
+            'record_spilled': self.record_queue.spilled,
+            'record_depth': len(self.record_queue),
+        }
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _decode_worker(self):
+        while True:
+            item = self.decode_queue.get()
+            if item is None:
+                if self.decode_queue.closed:
+                    return
+                continue
+
+            frame_num, frame = item
+            started = frame.started if self.clock else None
+            frame_id, first_packet = frame.frame_id, frame.started
+            decode_start = time.perf_counter()
+            try:
+                img = self.decode(frame)
+            except Exception as e:
+                # A bad frame must not take the worker down with it
+                print(f"\n❌ Decode error on frame {frame_num}: {e!r}")
+                img = None
+            finally:
+                self.release(frame)
+            decode_seconds = time.perf_counter() - decode_start
+
+            with self._stats_lock:
+                self.decode_time.observe(decode_seconds)
+                if img is None:
+                    self.frames_failed += 1
+                else:
+                    self.frames_decoded += 1
+            if img is None:
+                continue
+
+            if self.conceal:
+                with self._conceal_lock:
+                    img = self.conceal(img)
+            if self.share:
+                self.share(frame_num, frame_id, first_packet, img)
+
+            if self.display:
+                self.display_queue.put((frame_num, img, started))
+            elif started is not None:
+                with self._stats_lock:
+                    self.latency.observe(self.clock() - started)
+            if self.record and not self.record_frames:
+                self.record_queue.put((frame_num, img))
+
+    def _record_worker(self):
+        while True:
+            item = self.record_queue.get()
+            if item is None:
+                if self.record_queue.closed:
+                    return
+                continue
+            frame_num, img = item
+            record_start = time.perf_counter()
+            try:
+                self.record(frame_num, img)
+            except Exception as e:
+                # Keep draining, a dead writer would leave submit() waiting under BLOCK
+                print(f"\n❌ Record error on frame {frame_num}: {e!r}")
+                self.frames_record_failed += 1
+            else:
+                self.frames_recorded += 1
+            self.record_time.observe(time.perf_counter() - record_start)
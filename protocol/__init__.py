@@ -0,0 +1,20 @@
+"""
+The drone's wire protocols, shared by the receiver, capture tools, the
+simulator and the WorkInProgress decoders.
+
+    protocol.vga       0x6363 header layout, VGAPacket view, struct parsers
+    protocol.hd        HD camera lewei_cmd packets, HDPacket view
+    protocol.dispatch  per-cmd_type dispatch table and protocol detection
+"""
+
+from protocol.vga import (
+    MAGIC, HEADER_LENGTH, BODY_OFFSET, PACKET_SEQ_OFFSET, TOTAL_PACKETS_OFFSET,
+    DATA_LEN_OFFSET, PAYLOAD_OFFSET, SEQ_BYTE_OFFSET, MAX_VIDEO_PACKETS, HEARTBEAT_LENGTH, BASE_HEADER, VIDEO_FIELDS,
+    CMD_HEARTBEAT, CMD_VIDEO, CMD_KEY_EVENT, CMD_CONTROL, CMD_SINGLE_VIDEO, CMD_NAMES,
+    VGAPacket, cmd_name, is_vga, parse_header, pack_header, pack_video_fields,
+)
+from protocol.hd import (
+    HD_MAGIC, HD_PACKET_SIZE, HD_PAYLOAD_OFFSET, HD_CMD_VIDEO, HD_CMD_MJPEG,
+    HDPacket, is_hd, pack_hd_header,
+)
+from protocol.dispatch import PROTOCOL_VGA, PROTOCOL_HD, Dispatcher, detect
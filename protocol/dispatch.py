@@ -0,0 +1,63 @@
+"""
+Dispatch of drone datagrams: 0x6363 packets by cmd_type, lewei_cmd packets
+to a single HD handler.
+"""
+
+from protocol.hd import HDPacket, is_hd
+from protocol.vga import VGAPacket, is_vga
+
+PROTOCOL_VGA = 'vga'
+PROTOCOL_HD = 'hd'
+
+
+def detect(data):
+    """PROTOCOL_VGA or PROTOCOL_HD for a datagram, None if it is neither"""
+    if is_vga(data):
+        return PROTOCOL_VGA
+    if is_hd(data):
+        return PROTOCOL_HD
+    return None
+
+
+class Dispatcher:
+    """
+    Table of cmd_type -> handler(packet, now). Every datagram is wrapped in
+    the same VGAPacket view, so dispatching allocates nothing; handlers that
+    need the packet later must copy what they need. lewei_cmd datagrams go
+    to on_hd(packet, now) with an HDPacket view, if set. Datagrams that are
+    neither or have no handler go to on_unknown(data, now), if set.
+    """
+
+    __slots__ = ('handlers', 'on_hd', 'on_unknown', 'unknown', '_packet', '_hd_packet')
+
+    def __init__(self, handlers=None):
+        self.handlers = dict(handlers or {})
+        self.on_hd = None
+        self.on_unknown = None
+        self.unknown = 0
+        self._packet = VGAPacket()
+        self._hd_packet = HDPacket()
+
+    def on(self, cmd_type, handler):
+        self.handlers[cmd_type] = handler
+
+    def dispatch(self, data, now=None):
+        """Run the handler for one datagram, False if there was none"""
+        if is_vga(data):
+            handler, packet = self.handlers.get(data[2]), self._packet
+        elif self.on_hd is not None and is_hd(data):
+            handler, packet = self.on_hd, self._hd_packet
+        else:
+            handler = None
+        if handler is None:
+            self.unknown += 1
+            if self.on_unknown is not None:
+                self.on_unknown(data, now)
+            return False
+        packet.bind(data)
+        try:
+            handler(packet, now)
+        finally:
+            # Don't keep the datagram alive (it may be a slice of an mmap)
+            packet.data = b''
+        return True
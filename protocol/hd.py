@@ -0,0 +1,81 @@
+"""
+HD camera "lewei_cmd" packets (LW93RecvUdpData, liblewei-3.2.2.so line
+8211, and the frame assembly at line 9780-9980).
+
+    0x00  magic          9  "lewei_cmd"
+    0x0C  cmd            4  0x101 video, 0x103 MJPEG
+    0x10  frame_type     1  0x01 on the first packet of a frame
+    0x20  JPEG data
+
+Packets are read 1024 (0x400) bytes at a time and carry no sequence
+numbers: a frame is the JPEG data of its packets in arrival order, ending
+with a packet shorter than 1024 bytes. save_stream_photo() (line 8581)
+writes it out as is, with 0xFFD9 added when the frame lacks one.
+"""
+
+import struct
+
+HD_MAGIC = b'lewei_cmd'
+HD_PACKET_SIZE = 0x400
+
+HD_CMD_OFFSET = 0x0C
+HD_FRAME_TYPE_OFFSET = 0x10
+HD_PAYLOAD_OFFSET = 0x20
+
+HD_CMD_VIDEO = 0x101
+HD_CMD_MJPEG = 0x103
+
+HD_FIRST_PACKET = 0x01
+
+_U32 = struct.Struct('<I')
+
+
+def is_hd(data):
+    """True if data is a lewei_cmd packet with a complete header"""
+    return len(data) >= HD_PAYLOAD_OFFSET and data[:9] == HD_MAGIC
+
+
+class HDPacket:
+    """Read-only view of one lewei_cmd datagram, reusable like VGAPacket"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data=b''):
+        self.data = data
+
+    def bind(self, data):
+        self.data = data
+        return self
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def valid(self):
+        return is_hd(self.data)
+
+    @property
+    def cmd(self):
+        return _U32.unpack_from(self.data, HD_CMD_OFFSET)[0]
+
+    @property
+    def first(self):
+        """First packet of a frame"""
+        return self.data[HD_FRAME_TYPE_OFFSET] == HD_FIRST_PACKET
+
+    @property
+    def last(self):
+        """Last packet of a frame, the only one shorter than HD_PACKET_SIZE"""
+        return len(self.data) < HD_PACKET_SIZE
+
+    @property
+    def payload(self):
+        return memoryview(self.data)[HD_PAYLOAD_OFFSET:]
+
+
+def pack_hd_header(buffer, cmd=HD_CMD_VIDEO, first=False):
+    """Write a lewei_cmd header into the first HD_PAYLOAD_OFFSET bytes of buffer"""
+    buffer[:HD_PAYLOAD_OFFSET] = bytes(HD_PAYLOAD_OFFSET)
+    buffer[:len(HD_MAGIC)] = HD_MAGIC
+    _U32.pack_into(buffer, HD_CMD_OFFSET, cmd)
+    buffer[HD_FRAME_TYPE_OFFSET] = HD_FIRST_PACKET if first else 0
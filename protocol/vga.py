@@ -0,0 +1,249 @@
+"""
+0x6363 VGA packet layout (vga_read_buffer_thread, liblewei-3.2.2.so line
+15240-15480).
+
+    0x00  magic          2  0x6363                      (local_7d8)
+    0x02  cmd_type       1  0x01/0x03/0x09/0x0B         (local_7d6)
+    0x03  seq_id         2                              (local_7d5)
+    0x05  pkt_len        2                              (local_7d3)
+    0x07  frame_type     1  flags, also body start      (local_7d1)
+    0x08  frame_id       4                              (uStack_7d0)
+    0x27  packet_seq     2  cmd 0x03 only               (local_7a8)
+    0x29  total_packets  2  cmd 0x03 only               (local_7a6)
+    0x2B  data_len       2  cmd 0x03 only               (local_7a4)
+    0x36  JPEG data                                     (auStack_7a2)
+
+The 0x27 offsets are those of the notes' table, which simulator.py writes.
+Packets from the drone itself fill 0x10-0x2E with 0x5a, though, and carry
+the 1-based packet number in byte 48 that the original receiver ordered
+frames by. That matches the stack variable names (local_7a8 is 0x7d8 -
+0x7a8 = 0x30 past local_7d8): in the drone's sample packet 0x30, 0x32 and
+0x34 read packet 6 of 6 with 272 bytes of data. video_position() uses the
+0x27 fields when they are plausible and this layout otherwise.
+
+Bodies that start at offset 7: the 99-byte heartbeat reply carries the
+WiFi SSID, and a key event packs its key code into bytes 7-8
+(CONCAT11(uStack_7d0, local_7d1), line 15460).
+"""
+
+import struct
+
+MAGIC = b'\x63\x63'
+HEADER_LENGTH = 12
+
+CMD_HEARTBEAT = 0x01
+CMD_VIDEO = 0x03
+CMD_KEY_EVENT = 0x09
+CMD_CONTROL = 0x0A
+CMD_SINGLE_VIDEO = 0x0B
+
+# From line 15296-15472
+CMD_NAMES = {
+    0x01: "Heartbeat",
+    0x03: "Multi-packet Video",
+    0x04: "WiFi SSID (Set)",
+    0x06: "WiFi SSID (Get)",
+    0x07: "WiFi Password (Set)",
+    0x09: "Key Event",
+    0x0A: "Control",
+    0x0B: "Single Video Data",
+    0x0C: "Clear WiFi",
+    0x0D: "WiFi Password (Get)",
+    0x0F: "Camera LED On",
+    0x10: "Camera LED Off",
+}
+
+BODY_OFFSET = 0x07
+PACKET_SEQ_OFFSET = 0x27
+TOTAL_PACKETS_OFFSET = 0x29
+DATA_LEN_OFFSET = 0x2B
+PAYLOAD_OFFSET = 0x36
+
+# Packet number (1-based) of the drone's own cmd 0x03 packets, followed by
+# its packet count and data length (see above)
+SEQ_BYTE_OFFSET = 0x30
+
+# Most packets a frame is taken to have by the drone's own 0x30 fields (a
+# VGA JPEG is about 30, their 0x5a filler would read 23130)
+MAX_VIDEO_PACKETS = 1024
+
+HEARTBEAT_LENGTH = 99
+
+# magic, cmd_type, seq_id, pkt_len, frame_type, frame_id
+BASE_HEADER = struct.Struct('<2sBHHBI')
+# packet_seq, total_packets, data_len
+VIDEO_FIELDS = struct.Struct('<HHH')
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+
+
+def cmd_name(cmd_type):
+    return CMD_NAMES.get(cmd_type, f"Unknown (0x{cmd_type:02X})")
+
+
+def is_vga(data):
+    """
+    True if data starts with the 0x6363 magic and a cmd_type. Commands
+    from the app can be shorter than the 12-byte base header (the start
+    command is 7 bytes), so field access still needs a length check.
+    """
+    return len(data) > 2 and data[0] == 0x63 and data[1] == 0x63
+
+
+class VGAPacket:
+    """
+    Read-only view of one datagram. Fields are unpacked from the
+    underlying buffer when accessed, nothing is copied; payload and body
+    are memoryviews. bind() points the view at the next datagram, so a
+    receive loop can reuse one view for every packet (handlers must not
+    keep it past their call).
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data=b''):
+        self.data = data
+
+    def bind(self, data):
+        self.data = data
+        return self
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def valid(self):
+        """0x6363 packet with the whole base header"""
+        return len(self.data) >= HEADER_LENGTH and is_vga(self.data)
+
+    @property
+    def cmd_type(self):
+        return self.data[2]
+
+    @property
+    def seq_id(self):
+        return _U16.unpack_from(self.data, 3)[0]
+
+    @property
+    def pkt_len(self):
+        return _U16.unpack_from(self.data, 5)[0]
+
+    @property
+    def frame_type(self):
+        return self.data[7]
+
+    @property
+    def frame_id(self):
+        return _U32.unpack_from(self.data, 8)[0]
+
+    def header(self):
+        """(magic, cmd_type, seq_id, pkt_len, frame_type, frame_id) in one unpack"""
+        return BASE_HEADER.unpack_from(self.data)
+
+    @property
+    def has_video_fields(self):
+        return len(self.data) >= PACKET_SEQ_OFFSET + VIDEO_FIELDS.size
+
+    def video_fields(self):
+        """(packet_seq, total_packets, data_len) of a cmd 0x03 packet"""
+        return VIDEO_FIELDS.unpack_from(self.data, PACKET_SEQ_OFFSET)
+
+    def video_payload(self, data_len):
+        """The data_len bytes of JPEG data at 0x36, or None if the packet is shorter"""
+        if PAYLOAD_OFFSET + data_len > len(self.data):
+            return None
+        return memoryview(self.data)[PAYLOAD_OFFSET:PAYLOAD_OFFSET + data_len]
+
+    def video_position(self):
+        """
+        (packet_seq, total_packets, payload, clamped) of a cmd 0x03 packet
+        longer than PAYLOAD_OFFSET, packet_seq 0-based. The 0x27 fields are
+        used when plausible: packet_seq < total_packets (the drone's 0x5a
+        filler reads packet 0x5a5a of 0x5a5a). Otherwise the packet is placed
+        by the 1-based number/count/length at 0x30/0x32/0x34 if number <=
+        total_packets <= MAX_VIDEO_PACKETS, or else by the number in byte 48
+        alone (packet_seq -1 if it is 0) with total_packets None: the frame
+        then ends at its EOI and the payload runs to the end of the datagram. A data_len running past the datagram
+        is clamped to what arrived, and clamped is then True.
+        """
+        data = self.data
+        available = len(data) - PAYLOAD_OFFSET
+        packet_seq, total_packets, data_len = VIDEO_FIELDS.unpack_from(data, PACKET_SEQ_OFFSET)
+        if not packet_seq < total_packets:
+            number, total_packets, data_len = VIDEO_FIELDS.unpack_from(data, SEQ_BYTE_OFFSET)
+            if 0 < number <= total_packets <= MAX_VIDEO_PACKETS:
+                packet_seq = number - 1
+                if data_len == 0:
+                    data_len = available
+            else:
+                packet_seq = data[SEQ_BYTE_OFFSET] - 1
+                total_packets, data_len = None, available
+
+        clamped = data_len > available
+        if clamped:
+            data_len = available
+        return packet_seq, total_packets, memoryview(data)[PAYLOAD_OFFSET:PAYLOAD_OFFSET + data_len], clamped
+
+    def single_payload(self):
+        """
+        (payload, clamped): the whole JPEG of a cmd 0x0B packet, or None if
+        the packet has no data past its header. liblewei copies pkt_len - 7
+        bytes from offset 7 (line 15470), but the JPEG itself starts at 0x36
+        as in cmd 0x03 packets, after the same header fields. A pkt_len
+        running past the datagram is clamped to what arrived.
+        """
+        end = self.pkt_len
+        if end <= PAYLOAD_OFFSET or len(self.data) <= PAYLOAD_OFFSET:
+            return None
+        clamped = end > len(self.data)
+        if clamped:
+            end = len(self.data)
+        return memoryview(self.data)[PAYLOAD_OFFSET:end], clamped
+
+    @property
+    def body(self):
+        """Everything from offset 7 (heartbeat, key event and single-packet bodies)"""
+        return memoryview(self.data)[BODY_OFFSET:]
+
+    @property
+    def heartbeat_text(self):
+        """SSID in a heartbeat reply"""
+        return bytes(self.body).split(b'\x00', 1)[0].decode('ascii', 'replace')
+
+    @property
+    def key_code(self):
+        """Key event code from bytes 7-8"""
+        return _U16.unpack_from(self.data, BODY_OFFSET)[0]
+
+    def as_dict(self):
+        """All known fields, for tools that print packets"""
+        magic, cmd_type, seq_id, pkt_len, frame_type, frame_id = self.header()
+        fields = {
+            'header': _U16.unpack_from(magic)[0],
+            'cmd_type': cmd_type,
+            'seq_id': seq_id,
+            'pkt_len': pkt_len,
+            'frame_type': frame_type,
+            'frame_id': frame_id,
+            'payload': self.data[HEADER_LENGTH:],
+        }
+        if cmd_type == CMD_VIDEO and self.has_video_fields:
+            fields['packet_seq'], fields['total_packets'], fields['data_len'] = self.video_fields()
+        return fields
+
+
+def parse_header(data):
+    """Fields of a 0x6363 packet as a dict, None if data is not one"""
+    packet = VGAPacket(data)
+    return packet.as_dict() if packet.valid else None
+
+
+def pack_header(buffer, cmd_type, seq_id, pkt_len, frame_type=0, frame_id=0, offset=0):
+    """Write a base header into buffer (the inverse of VGAPacket.header)"""
+    BASE_HEADER.pack_into(buffer, offset, MAGIC, cmd_type, seq_id & 0xffff, pkt_len & 0xffff,
+                          frame_type, frame_id & 0xffffffff)
+
+
+def pack_video_fields(buffer, packet_seq, total_packets, data_len):
+    VIDEO_FIELDS.pack_into(buffer, PACKET_SEQ_OFFSET, packet_seq, total_packets, data_len)
@@ -0,0 +1,469 @@
+"""
+Zero-copy frame reassembly for the 0x6363 VGA video stream.
+
+Datagrams are received straight into preallocated buffers with recv_into and
+their JPEG payloads are copied through memoryviews into recycled per-frame
+bytearrays, so the steady state allocates nothing per packet.
+
+Multi-packet video (cmd_type 0x03) carries its position in the frame in the
+header (vga_read_buffer_thread line 15298-15299):
+
+    0x27  packet_seq     (local_7a8)
+    0x29  total_packets  (local_7a6)
+    0x2B  data_len       (local_7a4)
+
+FrameReassembler uses these to place payloads by sequence number, so lost,
+duplicated and reordered packets no longer corrupt the frame and a frame is
+emitted as soon as its last packet arrives. The drone's own packets do not
+fill these fields (see protocol/vga.py VGAPacket.video_position); their
+packets are placed by the 1-based number in byte 48, and when the packet
+count is not known either, the frame ends with the packet holding its EOI.
+
+The other video streams have their own reassemblers with the same
+interface (add, expire, release, stats, inflight): SinglePacketReassembler
+for cmd 0x0B, where every packet is a frame, and StreamReassembler for the
+HD lewei_cmd stream, which has no sequence numbers at all.
+"""
+
+import re
+
+from protocol.vga import MAX_VIDEO_PACKETS
+
+# Largest datagram we expect from the drone (vga_recv_udp reads up to 2000)
+RECV_BUFFER_SIZE = 2048
+
+# Initial size of a per-frame buffer, grown on demand for unusually big frames
+FRAME_BUFFER_SIZE = 128 * 1024
+
+# Same for HD frames, which run to about a thousand 1024-byte packets
+HD_FRAME_BUFFER_SIZE = 1024 * 1024
+
+# Value of packet_seq for the first packet of a frame
+PACKET_SEQ_BASE = 0
+
+# Frames still incomplete after this many seconds are dropped
+FRAME_TIMEOUT = 0.25
+
+# Number of frames that can be in flight at once
+MAX_INFLIGHT_FRAMES = 8
+
+# Packets for frame_ids at most this far behind a slot's frame are "late";
+# anything older is taken as the drone restarting its frame counter, as is
+# any frame_id once its slot has sat idle for FRAME_TIMEOUT
+REORDER_WINDOW = 256
+
+# frame_type given to HD frames, which are never obfuscated
+HD_FRAME_TYPE = 0x02
+
+_JPEG_SOI = b'\xff\xd8'
+_JPEG_EOI = b'\xff\xd9'
+# An EOI that ends its packet's payload, or is followed only by a run of one
+# filler byte: a stray FF D9 inside the data does not end an unsized frame
+_JPEG_EOI_PATTERN = re.compile(re.escape(_JPEG_EOI) + rb'(?:(.)\1*)?\Z', re.DOTALL)
+
+# Places an unsized frame starts with, grown as higher packet numbers arrive
+UNSIZED_PLACES = 64
+
+
+class BufferPool:
+    """
+    Pool of fixed-size bytearrays that are handed out and given back
+    instead of being reallocated for every packet or frame.
+    """
+
+    def __init__(self, size, count):
+        self.size = size
+        self._free = [bytearray(size) for _ in range(count)]
+
+    def acquire(self):
+        """Take a buffer from the pool, allocating only if it is empty"""
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, buffer):
+        """Return a buffer to the pool for reuse"""
+        if len(buffer) == self.size:
+            self._free.append(buffer)
+
+    def __len__(self):
+        return len(self._free)
+
+
+def pool_release(*pools):
+    """
+    release(frame) for frames coming from reassemblers with pools of
+    different buffer sizes: each buffer goes back to the pool of its size
+    (grown buffers are dropped, as in BufferPool.release)
+    """
+    by_size = {pool.size: pool for pool in pools}
+
+    def release(frame):
+        pool = by_size.get(len(frame.buffer))
+        if pool is not None:
+            pool.release(frame.buffer)
+        frame.buffer = None
+    return release
+
+
+class Frame:
+    """
+    A reassembled JPEG frame living in a pooled buffer.
+    started is the arrival time of its first packet.
+    """
+
+    __slots__ = ('frame_id', 'frame_type', 'buffer', 'length', 'started')
+
+    def __init__(self, frame_id, frame_type, buffer, length, started=None):
+        self.frame_id = frame_id
+        self.frame_type = frame_type
+        self.buffer = buffer
+        self.length = length
+        self.started = started
+
+    @property
+    def data(self):
+        """Zero-copy view of the JPEG bytes"""
+        return memoryview(self.buffer)[:self.length]
+
+    def detach(self):
+        """Copy of the frame that owns its bytes, for use after release()"""
+        return Frame(self.frame_id, self.frame_type, bytes(self.data), self.length, self.started)
+
+
+class ReassemblyStats:
+    """
+    Packet and frame counters kept by FrameReassembler.
+
+    packets_lost counts the missing packets of expired frames, packets_late
+    those arriving after their frame was already emitted or expired.
+    packets_unsized counts packets of frames with no packet count, which
+    end at their EOI.
+    """
+
+    __slots__ = ('packets', 'frames_completed', 'frames_expired',
+                 'packets_lost', 'packets_duplicate', 'packets_late',
+                 'packets_invalid', 'packets_unsized')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Slot:
+    """Reassembly state for one in-flight frame"""
+
+    __slots__ = ('frame_id', 'frame_type', 'sized', 'total', 'count', 'buffer',
+                 'write', 'offsets', 'lengths', 'in_order', 'started',
+                 'retired_id', 'retired_at')
+
+    def __init__(self):
+        self.frame_id = None
+        self.buffer = None
+        self.retired_id = None
+        self.retired_at = None
+
+
+class FrameReassembler:
+    """
+    Slot-indexed reassembler for multi-packet frames.
+
+    Each in-flight frame_id owns the slot frame_id % max_frames. Payloads are
+    appended to the slot's pooled buffer in arrival order and their offsets
+    recorded by packet_seq, so an in-order frame is already contiguous and is
+    emitted without a further copy; a reordered one is gathered into sequence
+    order once on completion.
+
+    add() returns a Frame as soon as all total_packets have arrived. The
+    caller gives the buffer back with release() when done with it.
+
+    total_packets None means the count is unknown and packet_seq is the
+    0-based packet number: the first packet has to start with the JPEG SOI,
+    and the packet whose payload ends in the EOI (cut just after it,
+    dropping any padding) sets the count, as the original byte 48 receiver
+    read frames.
+    """
+
+    def __init__(self, pool, max_frames=MAX_INFLIGHT_FRAMES,
+                 timeout=FRAME_TIMEOUT, seq_base=PACKET_SEQ_BASE):
+        self.pool = pool
+        self.timeout = timeout
+        self.seq_base = seq_base
+        self.stats = ReassemblyStats()
+        self._slots = [_Slot() for _ in range(max_frames)]
+
+    def add(self, frame_id, frame_type, packet_seq, total_packets, payload, now):
+        """
+        Place one packet payload in its frame.
+        Returns the completed Frame or None.
+        """
+        stats = self.stats
+        stats.packets += 1
+
+        if total_packets is None:
+            stats.packets_unsized += 1
+            index = packet_seq
+            if not 0 <= index < MAX_VIDEO_PACKETS or \
+                    (index == 0 and payload[:2] != _JPEG_SOI):
+                stats.packets_invalid += 1
+                return None
+            eoi = _JPEG_EOI_PATTERN.search(payload)
+            if eoi is not None:
+                payload = payload[:eoi.start() + len(_JPEG_EOI)]
+        else:
+            index = packet_seq - self.seq_base
+            if total_packets == 0 or not 0 <= index < total_packets:
+                stats.packets_invalid += 1
+                return None
+
+        slot = self._slots[frame_id % len(self._slots)]
+
+        if slot.frame_id != frame_id:
+            if slot.retired_id is not None and now - slot.retired_at > self.timeout:
+                # Idle for a whole frame timeout: a packet that late is lost
+                # anyway, and the drone may have restarted its frame counter
+                slot.retired_id = None
+            if self._is_behind(frame_id, slot.frame_id) or \
+                    self._is_behind(frame_id, slot.retired_id):
+                stats.packets_late += 1
+                return None
+            if slot.frame_id is not None:
+                # An older frame still holds the slot, it will never finish
+                self._drop(slot, now)
+            self._open(slot, frame_id, frame_type, total_packets, now)
+        elif (total_packets is None) == slot.sized or (slot.sized and total_packets != slot.total):
+            stats.packets_invalid += 1
+            return None
+        elif not slot.sized and slot.total is not None and index >= slot.total:
+            # Past the packet that ended the frame
+            stats.packets_invalid += 1
+            return None
+
+        if index >= len(slot.lengths):
+            # Unsized frames grow to their highest packet number
+            grow = index + 1 - len(slot.lengths)
+            slot.offsets.extend([0] * grow)
+            slot.lengths.extend([-1] * grow)
+        if slot.lengths[index] >= 0:
+            stats.packets_duplicate += 1
+            return None
+
+        end = slot.write + len(payload)
+        if end > len(slot.buffer):
+            slot.buffer = _grow(self.pool, slot.buffer, slot.write, end)
+        slot.buffer[slot.write:end] = payload
+
+        slot.offsets[index] = slot.write
+        slot.lengths[index] = len(payload)
+        if index != slot.count:
+            slot.in_order = False
+        slot.write = end
+        slot.count += 1
+        if total_packets is None and eoi is not None:
+            slot.total = index + 1
+
+        if slot.count == slot.total:
+            return self._complete(slot, now)
+        return None
+
+    def expire(self, now):
+        """Drop frames that have been incomplete for longer than the timeout"""
+        for slot in self._slots:
+            if slot.frame_id is not None and now - slot.started > self.timeout:
+                self._drop(slot, now)
+
+    def release(self, frame):
+        """Give a finished frame's buffer back to the pool"""
+        self.pool.release(frame.buffer)
+        frame.buffer = None
+
+    @property
+    def inflight(self):
+        return sum(1 for slot in self._slots if slot.frame_id is not None)
+
+    def _open(self, slot, frame_id, frame_type, total_packets, now):
+        # Sweep stale frames whenever a new one starts, so a stream with
+        # steady traffic needs no separate timer to expire them
+        self.expire(now)
+
+        slot.frame_id = frame_id
+        slot.frame_type = frame_type
+        slot.sized = total_packets is not None
+        slot.total = total_packets
+        slot.count = 0
+        slot.write = 0
+        slot.in_order = True
+        slot.started = now
+        if slot.buffer is None:
+            slot.buffer = self.pool.acquire()
+        # Unsized frames grow their places as packets arrive, their count comes with the EOI
+        places = total_packets if slot.sized else UNSIZED_PLACES
+        slot.offsets = [0] * places
+        slot.lengths = [-1] * places
+
+    def _complete(self, slot, now):
+        buffer, length = slot.buffer, slot.write
+        if not slot.in_order:
+            # Gather the chunks into sequence order in a fresh buffer
+            ordered = self.pool.acquire()
+            if length > len(ordered):
+                ordered = bytearray(length)
+            source = memoryview(buffer)
+            position = 0
+            for offset, size in zip(slot.offsets[:slot.total], slot.lengths[:slot.total]):
+                ordered[position:position + size] = source[offset:offset + size]
+                position += size
+            source.release()
+            self.pool.release(buffer)
+            buffer = ordered
+
+        frame = Frame(slot.frame_id, slot.frame_type, buffer, length, slot.started)
+        self.stats.frames_completed += 1
+        self._retire(slot, now)
+        slot.buffer = None
+        return frame
+
+    def _drop(self, slot, now):
+        self.stats.frames_expired += 1
+        if slot.sized:
+            self.stats.packets_lost += slot.total - slot.count
+        else:
+            # Missing packets up to the highest one seen (or the EOI's)
+            seen = [index for index, size in enumerate(slot.lengths) if size >= 0]
+            self.stats.packets_lost += max(slot.total or 0, seen[-1] + 1 if seen else 0) - slot.count
+        self._retire(slot, now)
+
+    def _retire(self, slot, now):
+        slot.retired_id = slot.frame_id
+        slot.retired_at = now
+        slot.frame_id = None
+
+    @staticmethod
+    def _is_behind(frame_id, reference):
+        return reference is not None and 0 <= reference - frame_id <= REORDER_WINDOW
+
+
+def _grow(pool, buffer, used, needed):
+    # Oversized buffers are not returned to the pool (see BufferPool.release)
+    size = len(buffer)
+    while size < needed:
+        size *= 2
+    grown = bytearray(size)
+    grown[:used] = memoryview(buffer)[:used]
+    pool.release(buffer)
+    return grown
+
+
+class SinglePacketReassembler:
+    """
+    cmd 0x0B single-packet video: every packet is a whole frame, which
+    add() copies out of the datagram into a pooled buffer.
+    """
+
+    inflight = 0
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.stats = ReassemblyStats()
+
+    def add(self, frame_id, frame_type, payload, now):
+        self.stats.packets += 1
+        length = len(payload)
+        buffer = self.pool.acquire()
+        if length > len(buffer):
+            buffer = _grow(self.pool, buffer, 0, length)
+        buffer[:length] = payload
+        self.stats.frames_completed += 1
+        return Frame(frame_id, frame_type, buffer, length, now)
+
+    def expire(self, now):
+        pass
+
+    def release(self, frame):
+        self.pool.release(frame.buffer)
+        frame.buffer = None
+
+
+class StreamReassembler:
+    """
+    Reassembler for the HD lewei_cmd stream (see protocol/hd.py).
+
+    Packets carry no frame id or sequence number, so payloads are appended
+    in arrival order: a first packet (or one starting with 0xFFD8) opens a
+    frame, and a last packet or a trailing 0xFFD9 completes it. A frame cut
+    short by the next one is counted as expired, packets between frames as
+    late. The missing EOI is appended as save_stream_photo() does. Frames
+    are numbered in the order they start.
+    """
+
+    def __init__(self, pool, timeout=FRAME_TIMEOUT):
+        self.pool = pool
+        self.timeout = timeout
+        self.stats = ReassemblyStats()
+        self.frame_id = 0
+        self._buffer = None
+        self._write = 0
+        self._started = None
+
+    def add(self, payload, first, last, now):
+        """
+        Append one packet payload to the current frame.
+        Returns the completed Frame or None.
+        """
+        stats = self.stats
+        stats.packets += 1
+
+        length = len(payload)
+        if first or (length > 1 and payload[0] == 0xFF and payload[1] == 0xD8):
+            if self._buffer is not None:
+                # The previous frame lost its last packet
+                self._drop()
+            self._buffer = self.pool.acquire()
+            self._write = 0
+            self._started = now
+            self.frame_id += 1
+        elif self._buffer is None:
+            stats.packets_late += 1
+            return None
+
+        # Room for the payload and an EOI that may have to be appended
+        end = self._write + length
+        if end + 2 > len(self._buffer):
+            self._buffer = _grow(self.pool, self._buffer, self._write, end + 2)
+        self._buffer[self._write:end] = payload
+        self._write = end
+
+        buffer = self._buffer
+        if last or (end > 1 and buffer[end - 2] == 0xFF and buffer[end - 1] == 0xD9):
+            return self._complete()
+        return None
+
+    def expire(self, now):
+        if self._buffer is not None and now - self._started > self.timeout:
+            self._drop()
+
+    def release(self, frame):
+        self.pool.release(frame.buffer)
+        frame.buffer = None
+
+    @property
+    def inflight(self):
+        return 0 if self._buffer is None else 1
+
+    def _complete(self):
+        buffer, length = self._buffer, self._write
+        if buffer[length - 2:length] != _JPEG_EOI:
+            buffer[length:length + 2] = _JPEG_EOI
+            length += 2
+        self._buffer = None
+        self.stats.frames_completed += 1
+        return Frame(self.frame_id, HD_FRAME_TYPE, buffer, length, self._started)
+
+    def _drop(self):
+        self.stats.frames_expired += 1
+        self.pool.release(self._buffer)
+        self._buffer = None
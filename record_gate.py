@@ -0,0 +1,154 @@
+"""
+Content-aware recording gate.
+
+While the drone hovers or sits on the ground most frames are nearly the
+same. A RecordGate in front of the record stage (stream_video.frame_recorder,
+so the AVI recording and the frame archive) passes on a frame only when its
+signature differs from that of the last frame it kept by more than a
+threshold, and keeps a keyframe every keyframe_interval seconds whatever the
+content. The signatures are cheap compared with a full decode:
+
+    thumb   1/8 scale grayscale decode (cv2.IMREAD_REDUCED_GRAYSCALE_8),
+            which libjpeg builds from the DC coefficients alone, with no
+            IDCT; the distance is the fraction of the thumbnail's pixels
+            (8x8 blocks of the frame) that moved by more than PIXEL_DELTA
+    size    no decode at all: the entropy-coded size of each restart
+            interval, or of the whole scan if the frame has no restart
+            markers; the distance is the relative L1 difference of the sizes.
+            Catches panning, exposure and scene changes, but an object
+            moving across a still background barely changes the sizes
+
+Skipped frames leave gaps in the timestamps that AviRecorder fills with
+drop-frame chunks, so a recording keeps its timing and holds the last kept
+frame through a static period. The live preview and the viewers still get
+every frame; the gate only sits on the record stage.
+"""
+
+import re
+import time
+
+from jpeg import scan_offset
+from metrics import Histogram
+
+# Default threshold of each signature's distance (0..1)
+GATE_THRESHOLDS = {'thumb': 0.005, 'size': 0.05}
+
+# A frame is kept at least this often (seconds), changed or not
+KEYFRAME_INTERVAL = 2.0
+
+# Gray levels a thumbnail pixel has to move by to count as changed
+# (leaves sensor noise and requantisation out)
+PIXEL_DELTA = 12
+
+# Buckets of the distance histogram, 0.001 to ~1
+DISTANCE_BUCKETS = tuple(0.001 * 2 ** i for i in range(11))
+
+_RESTART_MARKER = re.compile(rb'\xff[\xd0-\xd7]')
+
+
+class ThumbSignature:
+    """1/8 scale grayscale thumbnail via OpenCV, raises ImportError without it"""
+
+    name = 'thumb'
+
+    def __init__(self, pixel_delta=PIXEL_DELTA):
+        import cv2
+        import numpy as np
+
+        self.pixel_delta = pixel_delta
+        self._cv2, self._np = cv2, np
+
+    def __call__(self, jpeg):
+        np = self._np
+        img = self._cv2.imdecode(np.frombuffer(jpeg, np.uint8), self._cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if img is None or img.size == 0:
+            return None
+        return img
+
+    def distance(self, kept, signature):
+        if kept.shape != signature.shape:
+            return 1.0
+        changed = self._cv2.absdiff(kept, signature) > self.pixel_delta
+        return float(changed.mean())
+
+
+class SizeSignature:
+    """Entropy-coded bytes per restart interval, from the markers alone"""
+
+    name = 'size'
+
+    def __call__(self, jpeg):
+        start = scan_offset(jpeg)
+        if start is None:
+            return None
+        edges = [start]
+        edges.extend(match.start() for match in _RESTART_MARKER.finditer(jpeg, start))
+        edges.append(len(jpeg))
+        return [end - begin for begin, end in zip(edges, edges[1:])]
+
+    def distance(self, kept, signature):
+        if len(kept) != len(signature):
+            return 1.0
+        return sum(abs(a - b) for a, b in zip(kept, signature)) / max(sum(kept), 1)
+
+
+SIGNATURES = {
+    ThumbSignature.name: ThumbSignature,
+    SizeSignature.name: SizeSignature,
+}
+
+
+class RecordGate:
+    """
+    record(frame_num, frame) stage for Pipeline(record_frames=True) that
+    only calls the wrapped record for frames that changed (see above).
+    threshold defaults to GATE_THRESHOLDS of the signature. Frames whose
+    signature cannot be taken are always kept. Times come from frame.started,
+    or clock for frames without one. distances is a Histogram of every
+    distance measured, for tuning the threshold.
+    """
+
+    def __init__(self, record, signature, threshold=None, keyframe_interval=KEYFRAME_INTERVAL,
+                 clock=time.monotonic):
+        self.record = record
+        self.signature = signature
+        self.threshold = GATE_THRESHOLDS.get(signature.name, 0.0) if threshold is None else threshold
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self.frames_kept = 0
+        self.frames_skipped = 0
+        self.keyframes = 0
+        self.bytes_skipped = 0
+        self.distances = Histogram(DISTANCE_BUCKETS)
+        self._kept = None
+        self._kept_at = None
+
+    def __call__(self, frame_num, frame):
+        jpeg = frame.data
+        now = frame.started if frame.started is not None else self.clock()
+        signature = self.signature(jpeg)
+
+        if self._kept is None or signature is None or now - self._kept_at >= self.keyframe_interval:
+            self.keyframes += 1
+        else:
+            distance = self.signature.distance(self._kept, signature)
+            self.distances.observe(distance)
+            if distance <= self.threshold:
+                self.frames_skipped += 1
+                self.bytes_skipped += len(jpeg)
+                return
+
+        if signature is not None:
+            self._kept, self._kept_at = signature, now
+        self.frames_kept += 1
+        self.record(frame_num, frame)
+
+    def stats(self):
+        return {
+            'signature': self.signature.name,
+            'threshold': self.threshold,
+            'kept': self.frames_kept,
+            'skipped': self.frames_skipped,
+            'keyframes': self.keyframes,
+            'bytes_skipped': self.bytes_skipped,
+        }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded capture through the live receive path.
+
+Packets from a capture (see capture.py) are dispatched through the same
+DroneSession handlers, header parsing, reassembly, deobfuscation and decode
+pipeline as a live stream, either at the original wire timing or as fast as
+possible. The reassembler is driven by the recorded timestamps and every
+frame is decoded, so repeated runs give the same result.
+
+Usage:
+    python3 replay.py drone_raw_video_stream.bin
+    python3 replay.py drone_raw_video_stream.bin --realtime --display
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from avi import AviRecorder
+from capture import CaptureReader
+from decoders import DECODERS, SCALES, select_decoder
+from pipeline import BLOCK
+from session import DroneSession
+from stream_video import (DRONE_IP, DRONE_COMMAND_PORT, START_COMMAND, FRAME_TIMEOUT,
+                          frame_recorder, create_video_receiver, show_frame)
+
+
+def replay_capture(filename, receiver, realtime=False, speed=1.0, stop_event=None):
+    """
+    Dispatch every datagram of a capture to the receiver's handlers.
+    With realtime set, packets are paced by their recorded timestamps
+    (scaled by speed). Returns the number of packets replayed.
+    """
+    # The session is never connected, it only provides the cmd_type dispatch
+    session = DroneSession(DRONE_IP, DRONE_COMMAND_PORT, START_COMMAND)
+    receiver.attach(session)
+
+    packets = 0
+    with CaptureReader(filename) as capture:
+        packet = None
+        start = time.perf_counter()
+        first_ns = None
+        for timestamp_ns, packet in capture:
+            if stop_event is not None and stop_event.is_set():
+                break
+            if first_ns is None:
+                first_ns = timestamp_ns
+
+            if realtime:
+                delay = start + (timestamp_ns - first_ns) / 1e9 / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            session.dispatch(packet, timestamp_ns / 1e9)
+            packets += 1
+        # Views into the mapping have to go before the capture is closed
+        del packet
+    return packets
+
+
+def run_replay(filename, realtime=False, speed=1.0, display=False, record=None,
+               frame_timeout=FRAME_TIMEOUT, decoder=None):
+    """
+    Replay a capture through a full video pipeline and return throughput
+    figures (packets/s counts replay time, frames/s includes decoding).
+    record names an MJPEG AVI to write the frames to, decoder is the JPEG
+    backend (see decoders.py).
+    """
+    recorder = AviRecorder(record) if record else None
+    receiver = create_video_receiver(frame_timeout,
+                                     display=show_frame if display else None,
+                                     record=frame_recorder(recorder) if recorder else None,
+                                     decode_policy=BLOCK, record_policy=BLOCK, clock=None,
+                                     record_frames=True, decoder=decoder)
+    pipeline = receiver.pipeline
+    pipeline.start()
+
+    start = time.perf_counter()
+    if display:
+        # OpenCV windows have to be driven from the main thread
+        done = threading.Event()
+        result = {}
+
+        def feed():
+            try:
+                result['packets'] = replay_capture(filename, receiver, realtime, speed, done)
+            finally:
+                done.set()
+
+        feeder = threading.Thread(target=feed, name="replay")
+        feeder.start()
+        try:
+            pipeline.run_display(done)
+        except KeyboardInterrupt:
+            done.set()
+        feeder.join()
+        packets = result.get('packets', 0)
+    else:
+        packets = replay_capture(filename, receiver, realtime, speed)
+    replayed = time.perf_counter() - start
+
+    pipeline.stop(drain=True)
+    if recorder is not None:
+        recorder.close()
+    elapsed = time.perf_counter() - start
+
+    decoded = pipeline.frames_decoded
+    return {
+        'packets': packets,
+        'bytes': receiver.bytes_received,
+        'frames': receiver.frame_count,
+        'decoded': decoded,
+        'replay_seconds': replayed,
+        'total_seconds': elapsed,
+        'packets_per_sec': packets / replayed if replayed > 0 else 0.0,
+        'frames_per_sec': decoded / elapsed if elapsed > 0 else 0.0,
+        'reassembly': {stream: reassembler.stats.as_dict()
+                       for stream, reassembler in receiver.reassemblers.items()
+                       if reassembler.stats.packets},
+        'pipeline': pipeline.stats(),
+        'clamped': receiver.packets_clamped,
+        'hw_encoded': receiver.frames_hw_encoded,
+        'rejected': dict(receiver.frames_rejected),
+        'recorded': recorder.segments if recorder else [],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a drone capture through the video pipeline")
+    parser.add_argument('capture', help="capture file written by stream_video.py")
+    parser.add_argument('--realtime', action='store_true', help="pace packets by their recorded timestamps")
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed factor for --realtime")
+    parser.add_argument('--display', action='store_true', help="show frames in a window")
+    parser.add_argument('--record', action='store_true', help="save the frames as an MJPEG AVI next to the capture")
+    parser.add_argument('--decoder', default='opencv', choices=('auto',) + tuple(DECODERS),
+                        help="JPEG decoder, auto picks the fastest available")
+    parser.add_argument('--scale', type=int, default=1, choices=SCALES, help="decode at 1/N size")
+    args = parser.parse_args()
+    decoder = select_decoder(args.decoder, args.scale)
+    record = os.path.splitext(args.capture)[0] + '.avi' if args.record else None
+
+    if args.display:
+        import cv2
+        cv2.namedWindow('Drone Video Stream', cv2.WINDOW_AUTOSIZE)
+
+    print(f"▶️  Replaying {args.capture} ({'realtime x' + str(args.speed) if args.realtime else 'as fast as possible'})")
+    result = run_replay(args.capture, args.realtime, args.speed, args.display, record,
+                        decoder=decoder)
+
+    print(f"\n📊 {result['packets']} packets, {result['frames']} frames, {result['decoded']} decoded")
+    print(f"   {result['packets_per_sec']:.0f} packets/s, {result['frames_per_sec']:.1f} frames/s "
+          f"({result['total_seconds']:.2f} s)")
+    print(f"Reassembly: {result['reassembly']}")
+    print(f"Pipeline: {result['pipeline']}")
+    if result['clamped']:
+        print(f"Packets cut short of their data_len: {result['clamped']}")
+    if result['hw_encoded']:
+        print(f"Hardware-encoded (0x81) frames passed through undecoded: {result['hw_encoded']}")
+    if result['rejected']:
+        print(f"Rejected before decode: {result['rejected']}")
+    if result['recorded']:
+        print(f"🎞️  Recorded to {', '.join(result['recorded'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+asyncio session engine for the drone's command port (40000).
+
+A single DatagramProtocol owns the UDP socket. The start/heartbeat command
+(vga_send_command_thread, every 1000ms) and the control packets (every 50ms)
+run as timers on the event loop, independent of whether anything is being
+received, and incoming 0x6363 datagrams are dispatched to per-cmd_type
+handlers (and HD lewei_cmd datagrams to on_hd) through a protocol.Dispatcher.
+
+On Linux the socket is driven by a socket_stats.KernelDatagramTransport,
+which adds kernel drop counts and arrival timestamps, and SO_RCVBUF follows
+the traffic (RcvbufSizer) unless a fixed size is given.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+
+from protocol import Dispatcher
+from socket_stats import (RCVBUF_INTERVAL, RCVBUF_MIN, KernelDatagramTransport, RcvbufSizer,
+                          ReceiveStats, enable_kernel_stats, set_receive_buffer)
+
+# Start/heartbeat period (vga_send_command_thread line 15003)
+HEARTBEAT_INTERVAL = 1.0
+
+class DroneSession(asyncio.DatagramProtocol):
+    """
+    Owns the socket talking to one drone.
+
+    handlers maps cmd_type to a callable(packet, now) run for each matching
+    datagram, with packet a protocol.VGAPacket view that is reused for the
+    next datagram; on_hd(packet, now) gets lewei_cmd datagrams the same way
+    as HDPacket views. on_datagram(data, now), if set, sees every raw
+    datagram first (e.g. for capture) and on_unknown(data, now) the ones no
+    handler takes. now is the event loop's monotonic time at arrival. Handlers run
+    on the event loop and must not block.
+
+    first_sent and first_received are the monotonic times of the first
+    datagram sent (the start command, sent as soon as the socket is up) and
+    received, None until then.
+    """
+
+    def __init__(self, drone_ip, drone_port, command, control=None,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, control_interval=None):
+        self.address = (drone_ip, drone_port)
+        self.command = command
+        self.control = control
+        self.dispatcher = Dispatcher()
+        self.handlers = self.dispatcher.handlers
+        self.on_datagram = None
+
+        self.transport = None
+        self.closed = None
+        self.receive_stats = ReceiveStats()
+        self.packets_received = 0
+        self.bytes_received = 0
+        self.packets_sent = 0
+        self.send_errors = 0
+        self.first_sent = None
+        self.first_received = None
+
+        self._timers = [(heartbeat_interval, self.send_heartbeat)]
+        if control is not None:
+            self._timers.append((control_interval or control.interval, self.send_control))
+        self._tasks = []
+
+    def on(self, cmd_type, handler):
+        """Register the handler for a cmd_type"""
+        self.handlers[cmd_type] = handler
+
+    @property
+    def on_hd(self):
+        return self.dispatcher.on_hd
+
+    @on_hd.setter
+    def on_hd(self, handler):
+        self.dispatcher.on_hd = handler
+
+    @property
+    def on_unknown(self):
+        return self.dispatcher.on_unknown
+
+    @on_unknown.setter
+    def on_unknown(self, handler):
+        self.dispatcher.on_unknown = handler
+
+    @property
+    def packets_unknown(self):
+        return self.dispatcher.unknown
+
+    def add_timer(self, interval, callback):
+        """Run callback every interval seconds while the session is open"""
+        self._timers.append((interval, callback))
+        if self.transport is not None:
+            self._start_timer(interval, callback)
+
+    # --- asyncio.DatagramProtocol ---
+
+    def connection_made(self, transport):
+        loop = asyncio.get_running_loop()
+        self.transport = transport
+        self.closed = loop.create_future()
+        for interval, callback in self._timers:
+            self._start_timer(interval, callback)
+
+    def datagram_received(self, data, addr):
+        self.dispatch(data, asyncio.get_running_loop().time())
+
+    # --- dispatch ---
+
+    def dispatch(self, data, now):
+        """Route one datagram to its handlers (also used to replay captures)"""
+        self.packets_received += 1
+        self.bytes_received += len(data)
+        if self.first_received is None:
+            self.first_received = now
+
+        if self.on_datagram is not None:
+            self.on_datagram(data, now)
+        self.dispatcher.dispatch(data, now)
+
+    def error_received(self, exc):
+        # ICMP port unreachable and friends, e.g. while the drone boots
+        self.send_errors += 1
+
+    def connection_lost(self, exc):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(exc)
+
+    # --- sending ---
+
+    def send(self, packet):
+        if self.transport is None or self.transport.is_closing():
+            return
+        if self.first_sent is None:
+            self.first_sent = time.monotonic()
+        self.transport.sendto(packet, self.address)
+        self.packets_sent += 1
+
+    def send_heartbeat(self):
+        """Start video / keepalive command"""
+        self.send(self.command)
+
+    def send_control(self):
+        """Control packet, patched in place with any inputs queued since the last one"""
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.send(self.control.packet())
+        self.control.sent(asyncio.get_running_loop().time())
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def _start_timer(self, interval, callback):
+        task = asyncio.get_running_loop().create_task(_every(interval, callback))
+        self._tasks.append(task)
+
+
+async def _every(interval, callback):
+    """
+    Call callback now and then every interval seconds against absolute
+    deadlines, so the period does not drift with callback time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    while True:
+        callback()
+        deadline += interval
+        delay = deadline - loop.time()
+        if delay < 0:
+            # Fell behind (e.g. a slow handler), skip the missed ticks
+            deadline += interval * (-delay // interval + 1)
+            delay = deadline - loop.time()
+        await asyncio.sleep(delay)
+
+
+async def run_session(session, local_port, rcvbuf=None, bind_ip='0.0.0.0'):
+    """
+    Bind local_port, run the session until it is closed. rcvbuf fixes
+    SO_RCVBUF; by default it starts at RCVBUF_MIN and grows with the traffic.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        set_receive_buffer(sock, rcvbuf or RCVBUF_MIN, session.receive_stats)
+        sock.bind((bind_ip, local_port))
+    except OSError:
+        sock.close()
+        raise
+    if enable_kernel_stats(sock):
+        sock.setblocking(False)
+        KernelDatagramTransport(loop, sock, session)
+    else:
+        await loop.create_datagram_endpoint(lambda: session, sock=sock)
+    if not rcvbuf:
+        session.add_timer(RCVBUF_INTERVAL, RcvbufSizer(sock, session).update)
+    try:
+        await session.closed
+    finally:
+        session.close()
+
+
+class SessionLoop(threading.Thread):
+    """
+    Runs the event loop of one or more sessions on a background thread,
+    leaving the main thread free for the OpenCV windows. Every session
+    has its own socket; they share the loop, which only reassembles, so
+    one thread keeps up with several drones.
+
+    Sessions are added before start(). ready is set once every socket is
+    bound or failed to bind (errors maps those sessions to the exception),
+    finished once every session has closed.
+    """
+
+    def __init__(self, rcvbuf=None):
+        super().__init__(name="session", daemon=True)
+        self.rcvbuf = rcvbuf
+        self.sessions = []
+        self.errors = {}
+        self.ready = threading.Event()
+        self.finished = threading.Event()
+        self._loop = None
+
+    def add(self, session, local_port, bind_ip='0.0.0.0'):
+        self.sessions.append((session, local_port, bind_ip))
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except Exception as e:
+            for session, local_port, bind_ip in self.sessions:
+                self.errors.setdefault(session, e)
+        finally:
+            self.ready.set()
+            self.finished.set()
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        tasks = [self._loop.create_task(run_session(session, local_port, self.rcvbuf, bind_ip))
+                 for session, local_port, bind_ip in self.sessions]
+        # Signal once every socket is up (or binding it failed)
+        pending = list(zip(self.sessions, tasks))
+        while any(not task.done() and session.transport is None for (session, _, _), task in pending):
+            await asyncio.sleep(0)
+        for (session, _, _), task in pending:
+            if task.done() and task.exception() is not None:
+                self.errors[session] = task.exception()
+        self.ready.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for (session, _, _), result in zip(self.sessions, results):
+            if isinstance(result, Exception):
+                self.errors.setdefault(session, result)
+
+    def stop(self):
+        """Close every session from any thread and wait for the loop to finish"""
+        if self._loop is not None and self._loop.is_running():
+            for session, _, _ in self.sessions:
+                self._loop.call_soon_threadsafe(session.close)
+        self.join()
+
+
+class SessionThread(SessionLoop):
+    """A SessionLoop running a single session"""
+
+    def __init__(self, session, local_port, rcvbuf=None):
+        super().__init__(rcvbuf)
+        self.session = session
+        self.add(session, local_port)
+
+    @property
+    def error(self):
+        return self.errors.get(self.session)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Local drone simulator and load generator for the 0x6363 protocol.
+
+Binds a UDP port like the drone's port 40000, answers the start/heartbeat
+command (63 63 01 ...) with a 99-byte heartbeat reply and streams video to
+whoever sent it, until the heartbeats stop: cmd 0x03 multi-packet video by
+default, cmd 0x0B single-packet video or the HD camera's lewei_cmd stream
+with --stream. Control packets (cmd 0x0a) are counted and their arrival
+rate and jitter reported.
+
+Frames come from a directory of JPEG files, a single JPEG, a capture file
+(see capture.py) or, with no source, are generated. Frame rate, resolution,
+packet size, loss, reordering, duplication and burstiness are configurable,
+so the receive path can be pushed well past the drone's nominal rate.
+
+Usage:
+    python3 simulator.py --fps 30
+    python3 simulator.py --source frames/ --fps 120 --loss 0.01 --reorder 0.02
+    python3 stream_video.py --drone-ip 127.0.0.1
+"""
+
+import argparse
+import glob
+import os
+import random
+import select
+import socket
+import time
+from collections import deque
+
+from capture import is_capture, read_frames
+from obfuscation import decode_vga_obfuscation
+from protocol import (CMD_CONTROL, CMD_HEARTBEAT, CMD_SINGLE_VIDEO, CMD_VIDEO, HEARTBEAT_LENGTH,
+                      PAYLOAD_OFFSET, BODY_OFFSET, SEQ_BYTE_OFFSET, HD_PACKET_SIZE, HD_PAYLOAD_OFFSET,
+                      VIDEO_FIELDS, is_vga, pack_header, pack_hd_header, pack_video_fields)
+
+SIMULATOR_PORT = 40000
+
+# JPEG bytes per video packet
+PACKET_PAYLOAD_SIZE = 1400
+
+# Streaming stops when no heartbeat arrives for this long
+CLIENT_TIMEOUT = 3.0
+
+HEARTBEAT_REPLY_LENGTH = HEARTBEAT_LENGTH
+SIMULATOR_SSID = b'HASAKEE-WiFi-SIM'
+
+# Video streams the simulator can send (see stream_video.STREAM_*)
+STREAMS = ('multi', 'single', 'hd')
+
+# cmd 0x03 header layouts: the notes' table (0x27) or the drone's own (0x30)
+LAYOUTS = ('table', 'drone')
+
+# Bytes the drone fills with 0x5a in its cmd 0x03 packets
+DRONE_FILLER = slice(0x10, SEQ_BYTE_OFFSET)
+
+# Largest JPEG a cmd 0x0B packet can carry (pkt_len is 16 bits)
+MAX_SINGLE_PAYLOAD = 0xffff - PAYLOAD_OFFSET
+
+
+def create_video_packets(frame_id, jpeg, frame_type=0x02, payload_size=PACKET_PAYLOAD_SIZE,
+                         packet_counter=0, layout='table'):
+    """
+    Split a JPEG into cmd 0x03 packets with the header fields the receiver
+    uses: frame_type (7), frame_id (8), packet_seq/total_packets/data_len
+    (0x27-0x2B) and the 1-based packet number at byte 48. With layout
+    'drone' the packets look like the drone's own instead: 0x5a filler up
+    to 0x2F, then the 1-based number, count and length at 0x30-0x35 (see
+    protocol/vga.py). Frames are obfuscated as frame_type says (the byte
+    flip is its own inverse).
+    """
+    jpeg = decode_vga_obfuscation(jpeg, frame_id & 0xffffffff, frame_type)
+    total = max(1, -(-len(jpeg) // payload_size))
+    packets = []
+    for index in range(total):
+        chunk = jpeg[index * payload_size:(index + 1) * payload_size]
+        packet = bytearray(PAYLOAD_OFFSET + len(chunk))
+        pack_header(packet, CMD_VIDEO, packet_counter + index, len(packet), frame_type, frame_id)
+        if layout == 'drone':
+            packet[DRONE_FILLER] = b'\x5a' * len(packet[DRONE_FILLER])
+            VIDEO_FIELDS.pack_into(packet, SEQ_BYTE_OFFSET, index + 1, total, len(chunk))
+        else:
+            pack_video_fields(packet, index, total, len(chunk))
+            packet[SEQ_BYTE_OFFSET] = (index + 1) & 0xff
+        packet[PAYLOAD_OFFSET:] = chunk
+        packets.append(bytes(packet))
+    return packets
+
+
+def create_single_packet(frame_id, jpeg, frame_type=0x02, packet_counter=0):
+    """A whole (obfuscated) JPEG in one cmd 0x0B packet, laid out like cmd 0x03"""
+    if len(jpeg) > MAX_SINGLE_PAYLOAD:
+        raise ValueError(f"{len(jpeg)} byte frame does not fit a single packet")
+    jpeg = decode_vga_obfuscation(jpeg, frame_id & 0xffffffff, frame_type)
+    packet = bytearray(PAYLOAD_OFFSET + len(jpeg))
+    pack_header(packet, CMD_SINGLE_VIDEO, packet_counter, len(packet), frame_type, frame_id)
+    packet[PAYLOAD_OFFSET:] = jpeg
+    return bytes(packet)
+
+
+def create_hd_packets(jpeg):
+    """
+    Split a JPEG into HD lewei_cmd packets: full 1024-byte packets, the
+    first one flagged, and a shorter last one
+    """
+    size = HD_PACKET_SIZE - HD_PAYLOAD_OFFSET
+    # A frame that fills its last packet gets an empty one to end it
+    total = len(jpeg) // size + 1
+    packets = []
+    for index in range(total):
+        chunk = jpeg[index * size:(index + 1) * size]
+        packet = bytearray(HD_PAYLOAD_OFFSET + len(chunk))
+        pack_hd_header(packet, first=index == 0)
+        packet[HD_PAYLOAD_OFFSET:] = chunk
+        packets.append(bytes(packet))
+    return packets
+
+
+def create_heartbeat_reply(ssid=SIMULATOR_SSID):
+    """99-byte cmd 0x01 reply carrying the WiFi SSID, as seen from the drone"""
+    packet = bytearray(HEARTBEAT_REPLY_LENGTH)
+    pack_header(packet, CMD_HEARTBEAT, 0, HEARTBEAT_REPLY_LENGTH)
+    packet[BODY_OFFSET:BODY_OFFSET + len(ssid)] = ssid
+    return bytes(packet)
+
+
+def load_frames(source=None, resolution=None, count=60):
+    """
+    JPEG frames from a directory, a JPEG file or a capture; generated test
+    frames when source is None. resolution=(width, height) re-encodes them
+    once up front.
+    """
+    if source is None:
+        return _generate_frames(resolution or (640, 480), count)
+
+    if os.path.isdir(source):
+        files = sorted(glob.glob(os.path.join(source, '*.jpg')) +
+                       glob.glob(os.path.join(source, '*.jpeg')))
+        frames = [open(name, 'rb').read() for name in files]
+    elif is_capture(source):
+        frames = [jpeg for frame_id, frame_type, jpeg in read_frames(source)]
+    else:
+        frames = [open(source, 'rb').read()]
+
+    if not frames:
+        raise ValueError(f"No frames found in {source}")
+    if resolution:
+        frames = [_resize(jpeg, resolution) for jpeg in frames]
+    return frames
+
+
+def _generate_frames(resolution, count):
+    import cv2
+    import numpy as np
+
+    width, height = resolution
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    frames = []
+    for n in range(count):
+        img = np.empty((height, width, 3), np.uint8)
+        img[:, :, 0] = np.roll(x, n * width // count)[None, :]
+        img[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+        img[:, :, 2] = (n * 255) // count
+        cv2.putText(img, f"SIM {n}", (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    height / 160, (255, 255, 255), 2)
+        ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(encoded.tobytes())
+    return frames
+
+
+def _resize(jpeg, resolution):
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    if img is None or (img.shape[1], img.shape[0]) == tuple(resolution):
+        return jpeg
+    ok, encoded = cv2.imencode('.jpg', cv2.resize(img, tuple(resolution)),
+                               [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes()
+
+
+class SimulatorStats:
+    """Counters reported by the simulator"""
+
+    def __init__(self):
+        self.frames_sent = 0
+        self.packets_sent = 0
+        self.packets_lost = 0
+        self.packets_duplicated = 0
+        self.packets_reordered = 0
+        self.heartbeats = 0
+        self.control_packets = 0
+        self.control_gaps = []
+
+    def control_summary(self):
+        """Control rate and inter-arrival jitter percentiles (ms)"""
+        gaps = sorted(self.control_gaps)
+        if not gaps:
+            return {'packets': self.control_packets}
+        pick = lambda q: gaps[min(len(gaps) - 1, int(q * len(gaps)))] * 1000
+        return {
+            'packets': self.control_packets,
+            'rate_hz': len(gaps) / sum(gaps) if sum(gaps) > 0 else 0.0,
+            'gap_p50_ms': pick(0.50),
+            'gap_p99_ms': pick(0.99),
+            'gap_max_ms': gaps[-1] * 1000,
+        }
+
+
+class DroneSimulator:
+    """
+    Stand-in drone: one client, identified by the address sending the
+    start/heartbeat command.
+
+    spread is the fraction of the frame interval over which a frame's
+    packets are paced (0 sends each frame as a single burst). stream is
+    one of STREAMS; the HD camera's own start command is not known, so an
+    HD stream is started by the 0x6363 one as well.
+    """
+
+    def __init__(self, frames, fps=25.0, frame_type=0x02, payload_size=PACKET_PAYLOAD_SIZE,
+                 loss=0.0, reorder=0.0, duplicate=0.0, spread=0.5, seed=None, stream='multi',
+                 layout='table'):
+        if stream not in STREAMS:
+            raise ValueError(f"Unknown stream {stream}, expected one of {STREAMS}")
+        self.frames = frames
+        self.stream = stream
+        self.layout = layout
+        self.interval = 1.0 / fps
+        self.frame_type = frame_type
+        self.payload_size = payload_size
+        self.loss = loss
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.stats = SimulatorStats()
+        self.heartbeat_reply = create_heartbeat_reply()
+
+        self._client = None
+        self._last_heartbeat = 0.0
+        self._last_control = None
+        self._frame_id = 1
+        self._packet_counter = 0
+        self._queue = deque()
+
+    def run(self, sock, stop_event=None, duration=None, report=None):
+        """
+        Serve on a bound socket until stop_event is set or duration elapses.
+        report(stats) is called about once a second.
+        """
+        sock.setblocking(False)
+        start = time.perf_counter()
+        next_frame = None
+        next_report = start + 1.0
+
+        while not (stop_event is not None and stop_event.is_set()):
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+
+            if self._client and now - self._last_heartbeat > CLIENT_TIMEOUT:
+                print(f"💤 No heartbeat from {self._client}, stopping stream")
+                self._client = None
+                self._queue.clear()
+
+            if self._client:
+                if next_frame is None:
+                    next_frame = now
+                if now >= next_frame:
+                    self._queue_frame(next_frame)
+                    next_frame += self.interval
+                    if now - next_frame > self.interval:
+                        # Can't keep up, don't try to catch up with a burst
+                        next_frame = now + self.interval
+            else:
+                next_frame = None
+
+            while self._queue and self._queue[0][0] <= now:
+                due, packet = self._queue.popleft()
+                self._send(sock, packet)
+
+            if report and now >= next_report:
+                report(self.stats)
+                next_report += 1.0
+
+            wait = 0.1
+            if self._queue:
+                wait = min(wait, self._queue[0][0] - now)
+            if next_frame is not None:
+                wait = min(wait, next_frame - now)
+            if wait > 0:
+                readable, _, _ = select.select([sock], [], [], wait)
+                if not readable:
+                    continue
+            self._receive(sock)
+
+    def _send(self, sock, packet):
+        try:
+            sock.sendto(packet, self._client)
+            self.stats.packets_sent += 1
+        except BlockingIOError:
+            self.stats.packets_lost += 1
+        except OSError:
+            pass
+
+    def _receive(self, sock):
+        while True:
+            try:
+                data, address = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # e.g. ICMP port unreachable from a receiver that went away
+                continue
+            if not is_vga(data):
+                continue
+            now = time.perf_counter()
+            if data[2] == CMD_HEARTBEAT:
+                self.stats.heartbeats += 1
+                if self._client != address:
+                    print(f"📡 Start command from {address[0]}:{address[1]}, streaming")
+                self._client = address
+                self._last_heartbeat = now
+                sock.sendto(self.heartbeat_reply, address)
+            elif data[2] == CMD_CONTROL:
+                self.stats.control_packets += 1
+                if self._last_control is not None:
+                    self.stats.control_gaps.append(now - self._last_control)
+                self._last_control = now
+
+    def _queue_frame(self, frame_start):
+        jpeg = self.frames[self._frame_id % len(self.frames)]
+        if self.stream == 'single':
+            packets = [create_single_packet(self._frame_id, jpeg, self.frame_type, self._packet_counter)]
+        elif self.stream == 'hd':
+            packets = create_hd_packets(jpeg)
+        else:
+            packets = create_video_packets(self._frame_id, jpeg, self.frame_type,
+                                           self.payload_size, self._packet_counter, self.layout)
+        self._packet_counter += len(packets)
+        self._frame_id += 1
+        self.stats.frames_sent += 1
+
+        rand = self.random.random
+        wire = []
+        for packet in packets:
+            if rand() < self.loss:
+                self.stats.packets_lost += 1
+                continue
+            wire.append(packet)
+            if rand() < self.duplicate:
+                wire.append(packet)
+                self.stats.packets_duplicated += 1
+        for i in range(len(wire) - 1):
+            if rand() < self.reorder:
+                wire[i], wire[i + 1] = wire[i + 1], wire[i]
+                self.stats.packets_reordered += 1
+
+        step = self.interval * self.spread / max(1, len(wire))
+        for i, packet in enumerate(wire):
+            self._queue.append((frame_start + i * step, packet))
+
+
+def _print_report(stats):
+    control = stats.control_summary()
+    line = (f"\rFrames: {stats.frames_sent} | Packets: {stats.packets_sent} "
+            f"(lost {stats.packets_lost}, dup {stats.packets_duplicated}, "
+            f"reordered {stats.packets_reordered}) | Heartbeats: {stats.heartbeats} | "
+            f"Control: {control['packets']}")
+    if 'rate_hz' in control:
+        line += f" @ {control['rate_hz']:.1f} Hz (p99 gap {control['gap_p99_ms']:.1f} ms)"
+    print(line, end='', flush=True)
+
+
+def _resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a 0x6363 drone on a local UDP port")
+    parser.add_argument('--bind', default='127.0.0.1', help="address to bind")
+    parser.add_argument('--port', type=int, default=SIMULATOR_PORT, help="UDP port (drone uses 40000)")
+    parser.add_argument('--source', help="JPEG directory, JPEG file or capture file")
+    parser.add_argument('--resolution', type=_resolution, help="re-encode frames to WIDTHxHEIGHT")
+    parser.add_argument('--fps', type=float, default=25.0)
+    parser.add_argument('--packet-size', type=int, default=PACKET_PAYLOAD_SIZE, help="JPEG bytes per packet")
+    parser.add_argument('--frame-type', type=lambda v: int(v, 0), default=0x02)
+    parser.add_argument('--stream', default='multi', choices=STREAMS,
+                        help="cmd 0x03 multi-packet, cmd 0x0B single-packet or HD lewei_cmd video")
+    parser.add_argument('--layout', default='table', choices=LAYOUTS,
+                        help="cmd 0x03 header: fields at 0x27 (table) or as the drone sends them (drone)")
+    parser.add_argument('--loss', type=float, default=0.0, help="packet loss probability")
+    parser.add_argument('--reorder', type=float, default=0.0, help="probability of swapping adjacent packets")
+    parser.add_argument('--duplicate', type=float, default=0.0, help="packet duplication probability")
+    parser.add_argument('--spread', type=float, default=0.5,
+                        help="fraction of the frame interval packets are paced over (0 = burst)")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--seed', type=int, help="random seed for loss/reorder/duplication")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.resolution)
+    simulator = DroneSimulator(frames, args.fps, args.frame_type, args.packet_size,
+                               args.loss, args.reorder, args.duplicate, args.spread, args.seed,
+                               args.stream, args.layout)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    sock.bind((args.bind, args.port))
+    print(f"🛸 Simulated drone on {args.bind}:{args.port}, {len(frames)} frames at {args.fps} fps "
+          f"({args.stream} stream)")
+
+    try:
+        simulator.run(sock, duration=args.duration, report=_print_report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+    print("\n🛑 Simulator stopped.")
+    print(f"Control: {simulator.stats.control_summary()}")
+
+
+if __name__ == '__main__':
+    main()
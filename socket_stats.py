@@ -0,0 +1,274 @@
+"""
+Receive path health of a session socket.
+
+asyncio's datagram transport reads with recvfrom(), which throws away the
+ancillary data. On Linux the session socket gets a KernelDatagramTransport
+instead, which reads with recvmsg_into() into one preallocated buffer, with
+two socket options on:
+
+    SO_RXQ_OVFL     count of datagrams the kernel dropped because the socket
+                    buffer was full, carried in the next datagram's cmsg
+    SO_TIMESTAMPNS  kernel arrival time of each datagram
+
+so datagrams lost on the network (reassembly's packets_lost) can be told
+apart from those we were too slow to read (kernel_drops), and the time a
+datagram waited in the socket buffer (queue delay) from the time we took
+to handle it (processing). Handlers also get the kernel arrival time as
+their now. Each wakeup drains up to MAX_BATCH datagrams; the histograms are
+observed once per batch (the longest wait and the mean processing time),
+not per datagram. Elsewhere asyncio's own transport is used.
+
+RcvbufSizer resizes SO_RCVBUF from the measured bitrate and burst size.
+"""
+
+import asyncio
+import socket
+import struct
+import sys
+import time
+
+from metrics import Histogram
+
+# Linux values, for Python builds that do not export them
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+
+KERNEL_STATS = sys.platform.startswith('linux') and hasattr(socket.socket, 'recvmsg_into')
+
+# Datagrams read per wakeup before yielding to the control and heartbeat timers
+MAX_BATCH = 64
+
+# Largest UDP payload
+DATAGRAM_BUFFER_SIZE = 65536
+
+# Receive buffer sizing: at least RCVBUF_SECONDS of the stream and
+# RCVBUF_BURSTS of the largest burst, within RCVBUF_MIN..RCVBUF_MAX
+RCVBUF_MIN = 256 * 1024
+RCVBUF_MAX = 32 * 1024 * 1024
+RCVBUF_SECONDS = 0.25
+RCVBUF_BURSTS = 4
+RCVBUF_INTERVAL = 1.0
+
+_U32 = struct.Struct('=I')
+_TIMESPEC = struct.Struct('@ll')
+_ANCBUF_SIZE = socket.CMSG_SPACE(_U32.size) + socket.CMSG_SPACE(_TIMESPEC.size)
+
+
+class ReceiveStats:
+    """
+    Socket level counters of one session. kernel_drops is the kernel's own
+    running count. Per batch, queue_delay gets the longest wait from kernel
+    arrival to recvmsg and processing the mean time per datagram from
+    recvmsg to its handlers being done.
+    """
+
+    def __init__(self):
+        self.kernel_stats = False
+        self.kernel_drops = 0
+        self.timestamped = 0
+        self.batches = 0
+        self.batch_high_water = 0
+        self.burst_bytes = 0
+        self.queue_delay = Histogram()
+        self.processing = Histogram()
+        self.rcvbuf = 0
+        self.rcvbuf_requested = 0
+        self.rcvbuf_limited = False
+
+    def summary(self):
+        ms = lambda seconds: None if seconds is None else seconds * 1000
+        return {
+            'kernel_stats': self.kernel_stats,
+            'kernel_drops': self.kernel_drops,
+            'rcvbuf': self.rcvbuf,
+            'rcvbuf_limited': self.rcvbuf_limited,
+            'batch_high_water': self.batch_high_water,
+            'queue_delay_p50_ms': ms(self.queue_delay.percentile(0.50)),
+            'queue_delay_p99_ms': ms(self.queue_delay.percentile(0.99)),
+            'processing_p50_ms': ms(self.processing.percentile(0.50)),
+            'processing_p99_ms': ms(self.processing.percentile(0.99)),
+        }
+
+
+def set_receive_buffer(sock, size, stats):
+    """
+    Ask for an SO_RCVBUF of size bytes, past net.core.rmem_max with
+    SO_RCVBUFFORCE where permitted. stats.rcvbuf is what the kernel
+    reports back (Linux doubles the request for its own overhead).
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if KERNEL_STATS and granted < size * 2:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, size)
+            granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        except OSError:
+            pass  # needs CAP_NET_ADMIN
+    stats.rcvbuf_requested = size
+    stats.rcvbuf = granted
+    stats.rcvbuf_limited = granted < (size * 2 if KERNEL_STATS else size)
+    return granted
+
+
+def enable_kernel_stats(sock):
+    """Turn on SO_RXQ_OVFL and SO_TIMESTAMPNS, False if neither is available"""
+    if not KERNEL_STATS:
+        return False
+    enabled = False
+    for option in (SO_RXQ_OVFL, SO_TIMESTAMPNS):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, 1)
+            enabled = True
+        except OSError:
+            pass
+    return enabled
+
+
+class KernelDatagramTransport(asyncio.DatagramTransport):
+    """
+    Datagram transport over a bound, non-blocking socket for a
+    DroneSession. Each datagram is handed to session.dispatch() as a
+    memoryview of a buffer that is reused for the next one (handlers
+    already copy what they keep). Sends that would block are dropped and
+    reported through error_received(), as a late heartbeat or control
+    packet is of no use anyway.
+    """
+
+    def __init__(self, loop, sock, session):
+        super().__init__()
+        self.loop = loop
+        self.sock = sock
+        self.session = session
+        self.stats = session.receive_stats
+        self.stats.kernel_stats = True
+        self._buffer = bytearray(DATAGRAM_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._closing = False
+        session.connection_made(self)
+        loop.add_reader(sock.fileno(), self._read_ready)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'socket':
+            return self.sock
+        if name == 'sockname':
+            return self.sock.getsockname()
+        return default
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self.loop.remove_reader(self.sock.fileno())
+        self.loop.call_soon(self._connection_lost)
+
+    def abort(self):
+        self.close()
+
+    def _connection_lost(self):
+        try:
+            self.session.connection_lost(None)
+        finally:
+            self.sock.close()
+
+    def sendto(self, data, addr=None):
+        if self._closing:
+            return
+        try:
+            self.sock.sendto(data, addr)
+        except OSError as exc:
+            self.session.error_received(exc)
+
+    def _read_ready(self):
+        sock, view, stats, session = self.sock, self._view, self.stats, self.session
+        count = nbytes = 0
+        longest_wait = 0
+        started = time.perf_counter()
+        while count < MAX_BATCH and not self._closing:
+            try:
+                length, ancdata, flags, addr = sock.recvmsg_into((view,), _ANCBUF_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as exc:
+                session.error_received(exc)
+                break
+
+            now = time.monotonic()
+            for level, kind, data in ancdata:
+                if level != socket.SOL_SOCKET:
+                    continue
+                if kind == SCM_TIMESTAMPNS:
+                    seconds, nanoseconds = _TIMESPEC.unpack_from(data)
+                    wait = max(0, time.time_ns() - (seconds * 1_000_000_000 + nanoseconds)) / 1e9
+                    if wait > longest_wait:
+                        longest_wait = wait
+                    # Arrival on the monotonic clock the handlers use
+                    now -= wait
+                    stats.timestamped += 1
+                elif kind == SO_RXQ_OVFL:
+                    stats.kernel_drops = _U32.unpack_from(data)[0]
+
+            session.dispatch(view[:length], now)
+            count += 1
+            nbytes += length
+
+        if count:
+            stats.batches += 1
+            if count > stats.batch_high_water:
+                stats.batch_high_water = count
+            if nbytes > stats.burst_bytes:
+                stats.burst_bytes = nbytes
+            stats.queue_delay.observe(longest_wait)
+            stats.processing.observe((time.perf_counter() - started) / count)
+
+
+class RcvbufSizer:
+    """
+    Periodic SO_RCVBUF update (a session timer): enough for RCVBUF_SECONDS
+    at the measured byte rate and RCVBUF_BURSTS of the largest burst read
+    in one wakeup, doubled after any kernel drop. The buffer only grows.
+    """
+
+    def __init__(self, sock, session, minimum=RCVBUF_MIN, maximum=RCVBUF_MAX):
+        self.sock = sock
+        self.session = session
+        self.minimum = minimum
+        self.maximum = maximum
+        self.resizes = 0
+        self._last = None
+
+    def update(self):
+        session, stats = self.session, self.session.receive_stats
+        now = time.monotonic()
+        last, self._last = self._last, (now, session.bytes_received, stats.kernel_drops)
+        if last is None:
+            return
+        then, last_bytes, last_drops = last
+        rate = (session.bytes_received - last_bytes) / max(now - then, 1e-3)
+        burst, stats.burst_bytes = stats.burst_bytes, 0
+
+        wanted = max(self.minimum, rate * RCVBUF_SECONDS, burst * RCVBUF_BURSTS)
+        if stats.kernel_drops > last_drops:
+            wanted = max(wanted, stats.rcvbuf_requested * 2)
+        wanted = min(int(wanted), self.maximum)
+        if wanted > stats.rcvbuf_requested:
+            set_receive_buffer(self.sock, wanted, stats)
+            self.resizes += 1
+
+
+def print_receive_summary(stats):
+    summary = stats.summary()
+    line = f"📥 Socket: rcvbuf {summary['rcvbuf'] // 1024} KB"
+    if summary['rcvbuf_limited']:
+        line += " (capped, raise net.core.rmem_max)"
+    if summary['kernel_stats']:
+        line += (f", kernel drops {summary['kernel_drops']}, batch max {summary['batch_high_water']}")
+        if summary['queue_delay_p50_ms'] is not None:
+            line += (f", queue delay p50 {summary['queue_delay_p50_ms']:.2f} ms"
+                     f" p99 {summary['queue_delay_p99_ms']:.2f} ms, processing p50"
+                     f" {summary['processing_p50_ms']:.3f} ms p99 {summary['processing_p99_ms']:.3f} ms")
+    print(line)
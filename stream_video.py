@@ -1,79 +1,64 @@
+import collections
+import functools
 import socket
 import time
 import sys
-import cv2
-import numpy as np
+
+# Startup is timed from here; OpenCV and NumPy are only imported by the
+# code that needs them, so a --headless run loads neither
+PROCESS_STARTED = time.monotonic()
+
+from reassembly import (BufferPool, FrameReassembler, SinglePacketReassembler, StreamReassembler,
+                        pool_release, FRAME_BUFFER_SIZE, HD_FRAME_BUFFER_SIZE, FRAME_TIMEOUT)
+from protocol import (BODY_OFFSET, CMD_HEARTBEAT, CMD_KEY_EVENT, CMD_SINGLE_VIDEO, CMD_VIDEO,
+                      PAYLOAD_OFFSET, cmd_name, is_vga, parse_header)
+from pipeline import (Pipeline, DROP_OLDEST, SPILL, DECODE_WORKERS, DISPLAY_QUEUE_DEPTH,
+                      RECORD_QUEUE_DEPTH)
+from session import DroneSession, SessionThread
+from capture import CaptureWriter
+from archive import FrameArchive
+from avi import AviRecorder
+from decoders import DECODERS, SCALES, select_decoder
+from jpeg import validate_jpeg
+from obfuscation import FRAME_TYPE_HW_ENCODED, deobfuscate_frame
+from metrics import Metrics, MetricsServer, StatusLine, TraceRing
+from control import ControlState, print_control_summary
+from socket_stats import print_receive_summary
+from fanout import FrameHub, FrameFeedServer, MjpegServer, parse_feed_address
+from record_gate import GATE_THRESHOLDS, KEYFRAME_INTERVAL, SIGNATURES, RecordGate
 
 # --- CONSTANTS (Defined outside for use in both functions) ---
 DRONE_IP = "192.168.0.1"
 DRONE_COMMAND_PORT = 40000
 LOCAL_SOURCE_PORT = 54321
 START_COMMAND = bytes.fromhex("63630100000000") 
-PROPRIETARY_HEADER_LENGTH = 54
+PROPRIETARY_HEADER_LENGTH = PAYLOAD_OFFSET
 JPEG_SOI = bytes.fromhex("FFD8")
 JPEG_EOI = bytes.fromhex("FFD9")
 JPEG_SOS = bytes.fromhex("FFDA")
 SOS_PARAM_LENGTH = 12 # SOS marker (FF DA) is followed by 12 bytes of parameters
 
-# Path to save the raw video data
+# Path to save the captured datagrams (see capture.py for the format)
 OUTPUT_FILE = "drone_raw_video_stream.bin" 
 
-# --- FUNCTIONS ---
+# Recorded video, written as name_000.avi, name_001.avi, ... (see avi.py)
+RECORD_FILE = "drone_video.avi"
 
-def encode_index(frame_id, data_length):
-    """
-    Calculate obfuscation index (from liblewei-3.2.2.so line 8718)
-    """
-    if data_length == 0:
-        return 0
-    if (data_length & 1) == 0:  # Even
-        val = data_length + 1 + (data_length ^ frame_id) ^ data_length
-        return val % data_length
-    else:  # Odd
-        val = (data_length ^ frame_id) + data_length ^ data_length
-        return val % data_length
-
-def decode_vga_obfuscation(data, frame_id, frame_type):
-    """
-    Decode VGA data obfuscation (from liblewei-3.2.2.so line 15325-15327)
-    Only applies if frame_type != 0x02
-    """
-    if frame_type == 0x02 or len(data) == 0:
-        return data
-    
-    data = bytearray(data)
-    index = encode_index(frame_id, len(data))
-    if 0 <= index < len(data):
-        data[index] = (~data[index]) & 0xFF
-        print(f"Decoded obfuscation at index {index}")
-    return bytes(data)
+# Seconds between status line updates
+STATUS_INTERVAL = 1.0
+
+# Where the trace ring is written on exit when --trace is given
+TRACE_FILE = "drone_trace.log"
+
+# --- FUNCTIONS ---
 
 def decode_packet_header(data):
     """
     Decode 0x6363 packet header (from liblewei-3.2.2.so line 15240-15266)
-    Returns dict with parsed fields
+    Returns dict with parsed fields; the receive path uses VGAPacket views
+    instead (see protocol/vga.py)
     """
-    import struct
-    
-    if len(data) < 12:
-        return None
-    
-    header = struct.unpack('<H', data[0:2])[0]
-    if header != 0x6363:
-        return None
-    
-    # print the header
-    print(f"Header: {data[0:60].hex()}")
-
-    return {
-        'header': header,
-        'cmd_type': data[2],
-        'seq_id': struct.unpack('<H', data[3:5])[0],
-        'pkt_len': struct.unpack('<H', data[5:7])[0],
-        'frame_type': data[7],
-        'frame_id': struct.unpack('<I', data[8:12])[0],
-        'payload': data[12:]
-    }
+    return parse_header(data)
 
 def send_command(sock, drone_ip, drone_port, command):
     """Send command to drone"""
@@ -82,33 +67,125 @@ def send_command(sock, drone_ip, drone_port, command):
     except socket.error as e:
         print(f"❌ Error sending command: {e}")
 
-# Global to store previous frame for blending
-_previous_frame = None
+def decode_jpeg(jpeg_data):
+    """
+    Decode JPEG bytes (bytes, bytearray or memoryview) with OpenCV.
+    Returns the image or None if it could not be decoded.
+    """
+    import cv2
+    import numpy as np
+
+    nparr = np.frombuffer(jpeg_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None or img.size == 0:
+        return None
+    return img
+
+class FrameConcealer:
+    """
+    Pads short (corrupted) images with the bottom of the previous frame.
+
+    Full images pass through untouched and become the reference for the
+    next frame (decoded images are never modified, so no copy is needed).
+    A short image is patched into the next of a ring of buffers allocated
+    once, at the size of the first full frame, so concealment allocates
+    nothing per frame. The ring must be larger than the number of images
+    downstream stages can hold at once, or a queued image gets overwritten.
+    """
+
+    def __init__(self, buffers=DISPLAY_QUEUE_DEPTH + 2):
+        self.count = buffers
+        self.frames_concealed = 0
+        self._buffers = None
+        self._next = 0
+        self._previous = None
+
+    def __call__(self, img):
+        previous = self._previous
+        # If image is shorter than expected (464 vs 480), pad bottom with previous frame
+        if (previous is not None and img.shape[0] < previous.shape[0]
+                and img.shape[1:] == previous.shape[1:]):
+            if self._buffers is None or self._buffers[0].shape != previous.shape:
+                import numpy as np
+
+                self._buffers = [np.empty_like(previous) for _ in range(self.count)]
+            target = self._buffers[self._next]
+            self._next = (self._next + 1) % self.count
+            rows = img.shape[0]
+            target[:rows] = img  # Copy decoded part
+            target[rows:] = previous[rows:]  # Fill bottom from previous
+            img = target
+            self.frames_concealed += 1
+
+        self._previous = img  # Reference for the next frame
+        return img
+
+# Concealment for decode_frame()
+conceal_frame = FrameConcealer()
+
+def show_frame(img):
+    """Display an image in the video window"""
+    import cv2
+
+    cv2.imshow('Drone Video Stream', img)
+    cv2.waitKey(1)
+
+def record_frame(frame_num, img):
+    """Save an image to the frames directory"""
+    import cv2
+
+    cv2.imwrite(f"frames/frame_{frame_num}.jpg", img)
+
+def frame_recorder(recorder=None, archive=None):
+    """
+    record stage writing the drone's own JPEGs to an AviRecorder and/or a
+    FrameArchive, for Pipeline(record_frames=True); frames arrive
+    deobfuscated and are never decoded
+    """
+    def record(frame_num, frame):
+        jpeg = frame.data
+        if recorder is not None:
+            recorder.write(jpeg, frame.started)
+        if archive is not None:
+            archive.append(frame.frame_id, jpeg, int(frame.started * 1e9) if frame.started else 0)
+    return record
+
+def decode_video_frame(frame, decoder=None, rejected=None):
+    """
+    Decode a reassembled (and already deobfuscated) Frame, used by the
+    decode workers. decoder is a backend from decoders.py, full-size OpenCV by default.
+    Frames failing validate_jpeg() are not decoded; the reason is counted
+    in the rejected Counter, if given.
+    """
+    try:
+        jpeg_data = frame.data
+        reason = validate_jpeg(jpeg_data)
+        if reason:
+            if rejected is not None:
+                rejected[reason] += 1
+            return None
+        img = decoder.decode(jpeg_data) if decoder else decode_jpeg(jpeg_data)
+        if img is None:
+            sys.stdout.write(f"\r⚠️ Frame {frame.frame_id} decode failed")
+            sys.stdout.flush()
+        return img
+    except Exception as e:
+        sys.stdout.write(f"\r❌ Error: {e}")
+        sys.stdout.flush()
+        return None
 
 def decode_frame(jpeg_data, frame_num):
     """
     Decode a JPEG frame using OpenCV and display it.
     Blends with previous frame if corruption detected.
     """
-    global _previous_frame
-    
     try:
-        nparr = np.frombuffer(jpeg_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if img is not None and img.size > 0:
-            # If image is shorter than expected (464 vs 480), pad bottom with previous frame
-            if img.shape[0] < 480 and _previous_frame is not None:
-                # Create full-size image
-                full_img = np.zeros((480, 640, 3), dtype=np.uint8)
-                full_img[:img.shape[0], :] = img  # Copy decoded part
-                full_img[img.shape[0]:, :] = _previous_frame[img.shape[0]:, :]  # Fill bottom from previous
-                img = full_img
-            
-            _previous_frame = img.copy()  # Store for next frame
-            cv2.imshow('Drone Video Stream', img)
-            cv2.imwrite(f"frames/frame_{frame_num}.jpg", img)
-            cv2.waitKey(1)
+        img = decode_jpeg(jpeg_data)
+
+        if img is not None:
+            img = conceal_frame(img)
+            show_frame(img)
+            record_frame(frame_num, img)
         else:
             sys.stdout.write(f"\r⚠️ Frame {frame_num} decode failed")
             sys.stdout.flush()
@@ -117,154 +194,606 @@ def decode_frame(jpeg_data, frame_num):
         sys.stdout.write(f"\r❌ Error: {e}")
         sys.stdout.flush()
 
-def stream_manager(drone_ip, drone_port, local_port, command, filename):
+# Video streams the receiver tells apart, by the reassembler that takes them
+STREAM_MULTI = 'multi'
+STREAM_SINGLE = 'single'
+STREAM_HD = 'hd'
+
+STREAM_NAMES = {
+    STREAM_MULTI: "VGA multi-packet (0x6363 cmd 0x03)",
+    STREAM_SINGLE: "VGA single-packet (0x6363 cmd 0x0B)",
+    STREAM_HD: "HD (lewei_cmd)",
+}
+
+class VideoReceiver:
+    """
+    Datagram handlers for the video session: capture, heartbeat
+    replies, key events and frame reassembly. Completed frames are handed
+    to the pipeline, so nothing here waits on decoding, display or recording.
+    capture may be None (e.g. when replaying a capture).
+
+    Every video stream has its own reassembler in reassemblers (keyed by
+    STREAM_*); reassembler is the multi-packet one. Whichever stream the
+    drone sends is picked up without configuration, and stream is the one
+    that last completed a frame.
+
+    trace is an optional TraceRing that gets one record per video packet;
+    with the default of None the only per-packet cost is the None check.
+    on_key(code, now), if set, is called for each new key event.
+    first_frame is the monotonic time the first frame was completed.
+    """
+
+    def __init__(self, reassembler, pipeline, capture=None, trace=None, frames_rejected=None,
+                 single=None, hd=None):
+        self.reassembler = reassembler
+        self.reassemblers = {STREAM_MULTI: reassembler}
+        if single is not None:
+            self.reassemblers[STREAM_SINGLE] = single
+        if hd is not None:
+            self.reassemblers[STREAM_HD] = hd
+        self.pipeline = pipeline
+        self.capture = capture
+        self.trace = trace
+        self.stream = None
+        self.bytes_received = 0
+        self.frame_count = 0
+        self.heartbeats = 0
+        self.heartbeat_text = None
+        self.key_events = 0
+        self.key_code = None
+        self.on_key = None
+        self._key_seq = None
+        self.packets_truncated = 0
+        self.packets_clamped = 0
+        self.frames_hw_encoded = 0
+        self.first_frame = None
+        # Validation failures by reason, filled in by the decode workers
+        self.frames_rejected = collections.Counter() if frames_rejected is None else frames_rejected
+
+    def attach(self, session):
+        """Register the handlers on a DroneSession"""
+        session.on_datagram = self.on_datagram
+        session.on_unknown = self.on_unknown
+        session.on(CMD_HEARTBEAT, self.on_heartbeat)
+        session.on(CMD_KEY_EVENT, self.on_key_event)
+        session.on(CMD_VIDEO, self.on_video)
+        if STREAM_SINGLE in self.reassemblers:
+            session.on(CMD_SINGLE_VIDEO, self.on_single_video)
+        if STREAM_HD in self.reassemblers:
+            session.on_hd = self.on_hd_video
+
+    def expire(self, now):
+        """Drop incomplete frames of every stream that have timed out"""
+        for reassembler in self.reassemblers.values():
+            reassembler.expire(now)
+
+    def on_datagram(self, data, now):
+        """Every datagram: capture and byte count (the status line is periodic)"""
+        if self.capture is not None:
+            self.capture.write(data, int(now * 1e9))
+        self.bytes_received += len(data)
+
+    def on_heartbeat(self, packet, now):
+        """cmd_type 0x01: Heartbeat/ACK carrying the SSID, printed when it changes"""
+        self.heartbeats += 1
+        payload_text = packet.heartbeat_text
+        if payload_text != self.heartbeat_text:
+            self.heartbeat_text = payload_text
+            print(f"\n📦 Heartbeat: {payload_text or 'received'}")
+
+    def on_key_event(self, packet, now):
+        """
+        cmd_type 0x09: a button on the drone/camera. The packet repeats
+        until seq_id changes, so repeats are ignored (line 15460).
+        """
+        if len(packet) < BODY_OFFSET + 2:
+            return
+        seq_id = packet.seq_id
+        if seq_id == self._key_seq:
+            return
+        self._key_seq = seq_id
+        self.key_events += 1
+        self.key_code = packet.key_code
+        print(f"\n🔘 Key event 0x{self.key_code:04X}")
+        if self.on_key is not None:
+            self.on_key(self.key_code, now)
+
+    def on_video(self, packet, now):
+        """cmd_type 0x03: one packet of a multi-packet frame"""
+        if len(packet) <= PROPRIETARY_HEADER_LENGTH:
+            print(f"❌ Short video packet ({len(packet)} bytes)")
+            return
+
+        frame_type = packet.frame_type
+        frame_sequence = packet.frame_id
+        # packet_seq/total_packets/data_len at 0x27 if they make sense,
+        # else the drone's layout with byte 48 (see protocol/vga.py)
+        packet_seq, total_packets, payload, clamped = packet.video_position()
+        if clamped:
+            # data_len runs past the datagram: place what arrived, the frame
+            # is still worth concealing
+            self.packets_clamped += 1
+
+        if self.trace is not None:
+            self.trace.record('video', frame_sequence, frame_type, packet_seq, total_packets, len(payload))
+
+        # place the payload by packet_seq, a frame comes back as soon as all
+        # total_packets have arrived (or, with no count, at its EOI)
+        frame = self.reassembler.add(frame_sequence, frame_type, packet_seq, total_packets,
+                                     payload, now)
+        if frame:
+            self._submit(frame, STREAM_MULTI)
+
+    def on_single_video(self, packet, now):
+        """cmd_type 0x0B: a whole frame in one packet"""
+        single = packet.single_payload()
+        if single is None:
+            self.packets_truncated += 1
+            return
+        payload, clamped = single
+        if clamped:
+            self.packets_clamped += 1
+        frame_type, frame_id = packet.frame_type, packet.frame_id
+        if self.trace is not None:
+            self.trace.record('single', frame_id, frame_type, len(payload))
+        self._submit(self.reassemblers[STREAM_SINGLE].add(frame_id, frame_type, payload, now),
+                     STREAM_SINGLE)
+
+    def on_hd_video(self, packet, now):
+        """HD lewei_cmd: 1024-byte packets of JPEG data, in order"""
+        payload, first, last = packet.payload, packet.first, packet.last
+        if self.trace is not None:
+            self.trace.record('hd', packet.cmd, first, last, len(payload))
+        frame = self.reassemblers[STREAM_HD].add(payload, first, last, now)
+        if frame:
+            self._submit(frame, STREAM_HD)
+
+    def _submit(self, frame, stream):
+        if stream != self.stream:
+            self.stream = stream
+            print(f"\n🔎 Video stream: {STREAM_NAMES[stream]}")
+
+        if self.first_frame is None:
+            self.first_frame = time.monotonic()
+
+        hw_encoded = frame.frame_type == FRAME_TYPE_HW_ENCODED
+        if hw_encoded:
+            # LW_Decode_New is not recovered: recorded and published as they
+            # came, never handed to the JPEG decoders
+            if not self.frames_hw_encoded:
+                print("\n⚠️ Hardware-encoded (0x81) frames, passed through undecoded")
+            self.frames_hw_encoded += 1
+
+        # flags of this frame, applied once in its own buffer
+        deobfuscate_frame(frame)
+
+        # decoding happens on the pipeline workers, which
+        # give the frame buffer back when done with it
+        self.pipeline.submit(self.frame_count, frame, decode=not hw_encoded)
+
+        # increment the frame count
+        self.frame_count += 1
+
+    def on_unknown(self, data, now):
+        if is_vga(data):
+            print(f"Unknown message type {cmd_name(data[2])}")
+        else:
+            print(f"❌ Packet does not start with proprietary header. Dumping 200 bytes: {data[:200].hex()}")
+
+def create_video_receiver(frame_timeout=FRAME_TIMEOUT, capture=None, display=show_frame,
+                          record=record_frame, record_policy=SPILL, decode_policy=DROP_OLDEST,
+                          clock=time.monotonic, trace=None, record_frames=False, decoder=None,
+                          workers=DECODE_WORKERS, publish=None, share=None, decode=True):
+    """
+    Build the reassemblers, pipeline and VideoReceiver for one video stream.
+    display and record may be None to leave those stages out; clock is the
+    time base of the packet timestamps (None when they are not live).
+    record_frames hands record the reassembled frames instead of images.
+    decoder is the JPEG backend (see decoders.py), run on workers threads.
+    publish gets every reassembled frame as is (e.g. a fanout.FrameHub),
+    share every decoded image (e.g. a frame_ring.FrameRingWriter).
+    decode=False leaves the decode stage out, for runs that only record
+    and publish frames (display and share then get nothing).
+    """
+    # HD buffers are only allocated if an HD stream shows up
+    pool, hd_pool = BufferPool(FRAME_BUFFER_SIZE, 16), BufferPool(HD_FRAME_BUFFER_SIZE, 0)
+    reassembler = FrameReassembler(pool, timeout=frame_timeout)
+    single = SinglePacketReassembler(pool)
+    hd = StreamReassembler(hd_pool, timeout=frame_timeout)
+    rejected = collections.Counter()
+    # Concealed images may sit in the display queue, and the record queue
+    # unless recording takes the frames
+    buffers = DISPLAY_QUEUE_DEPTH + 2
+    if record and not record_frames:
+        buffers += RECORD_QUEUE_DEPTH
+    pipeline = Pipeline(decode=functools.partial(decode_video_frame, decoder=decoder, rejected=rejected)
+                        if decode else None,
+                        release=pool_release(pool, hd_pool),
+                        display=display, record=record, conceal=FrameConcealer(buffers) if decode else None,
+                        workers=workers, record_policy=record_policy, decode_policy=decode_policy,
+                        clock=clock, record_frames=record_frames, publish=publish, share=share)
+    return VideoReceiver(reassembler, pipeline, capture, trace, rejected, single, hd)
+
+def create_metrics(receiver, session=None, labels=None):
+    """
+    Metrics registry over a VideoReceiver's counters, reassembly stats,
+    pipeline stage timings and queue depths (and a DroneSession's, if given).
+    Values are read when a snapshot is taken, never per packet. labels tell
+    the drones of a fleet apart (see fleet.py).
+    """
+    metrics = Metrics(labels=labels)
+    reassemblers = list(receiver.reassemblers.values())
+    pipeline = receiver.pipeline
+
+    def reassembly_total(name):
+        return lambda: sum(getattr(reassembler.stats, name) for reassembler in reassemblers)
+
+    metrics.counter('bytes_received_total', "Datagram bytes received", lambda: receiver.bytes_received)
+    metrics.counter('heartbeats_total', "Heartbeat replies received", lambda: receiver.heartbeats)
+    metrics.counter('key_events_total', "Key events received", lambda: receiver.key_events)
+    if session is not None:
+        metrics.counter('packets_received_total', "Datagrams received", lambda: session.packets_received)
+        metrics.counter('packets_sent_total', "Datagrams sent", lambda: session.packets_sent)
+        metrics.counter('packets_unknown_total', "Datagrams with no handler", lambda: session.packets_unknown)
+        metrics.counter('send_errors_total', "Socket errors", lambda: session.send_errors)
+        receive = session.receive_stats
+        metrics.counter('kernel_drops_total', "Datagrams dropped by the kernel, socket buffer full",
+                        lambda: receive.kernel_drops)
+        metrics.gauge('rcvbuf_bytes', "Socket receive buffer (SO_RCVBUF)", lambda: receive.rcvbuf)
+        metrics.gauge('receive_batch_max', "Most datagrams read in one wakeup",
+                      lambda: receive.batch_high_water)
+        metrics.histogram('socket_queue_delay_seconds', "Kernel arrival to read, longest per wakeup",
+                          receive.queue_delay)
+        metrics.histogram('receive_processing_seconds', "Read to handlers done, per datagram",
+                          receive.processing)
+        metrics.gauge('time_to_first_packet_seconds', "Start command to the first datagram",
+                      lambda: elapsed(session.first_sent, session.first_received))
+        metrics.gauge('time_to_first_frame_seconds', "Start command to the first complete frame",
+                      lambda: elapsed(session.first_sent, receiver.first_frame))
+        if session.control is not None:
+            control = session.control.stats
+            metrics.counter('control_packets_total', "Control packets sent", lambda: control.sent)
+            metrics.gauge('control_rate_hz', "Achieved control send rate", lambda: control.rate)
+            metrics.histogram('control_jitter_seconds', "Control send interval deviation", control.jitter)
+            metrics.histogram('control_input_latency_seconds', "Control input to wire",
+                              control.input_latency)
+    else:
+        metrics.counter('packets_received_total', "Video packets reassembled", reassembly_total('packets'))
+
+    for name in ('frames_completed', 'frames_expired', 'packets_lost', 'packets_duplicate',
+                 'packets_late', 'packets_invalid'):
+        metrics.counter(f'{name}_total', f"Reassembly {name.replace('_', ' ')}", reassembly_total(name))
+    metrics.gauge('frames_inflight', "Frames being reassembled",
+                  lambda: sum(reassembler.inflight for reassembler in reassemblers))
+
+    metrics.counter('frames_decoded_total', "Frames decoded", lambda: pipeline.frames_decoded)
+    metrics.counter('frames_failed_total', "Frames that failed to decode", lambda: pipeline.frames_failed)
+    metrics.counter('frames_displayed_total', "Frames displayed", lambda: pipeline.frames_displayed)
+    metrics.counter('frames_recorded_total', "Frames recorded", lambda: pipeline.frames_recorded)
+    metrics.counter('frames_record_failed_total', "Frames the recorder raised on",
+                    lambda: pipeline.frames_record_failed)
+    metrics.counter('frames_rejected_total', "Frames failing JPEG validation",
+                    lambda: sum(receiver.frames_rejected.values()))
+    metrics.counter('frames_concealed_total', "Short frames padded from the previous frame",
+                    lambda: pipeline.conceal.frames_concealed if pipeline.conceal else 0)
+    metrics.counter('packets_truncated_total', "Single-packet video packets with no JPEG data",
+                    lambda: receiver.packets_truncated)
+    metrics.counter('frames_hw_encoded_total', "Hardware-encoded (0x81) frames passed through undecoded",
+                    lambda: receiver.frames_hw_encoded)
+    metrics.counter('packets_clamped_total', "Video packets cut short of their data_len, placed as received",
+                    lambda: receiver.packets_clamped)
+    for stage in ('decode', 'display', 'record'):
+        queue = getattr(pipeline, f'{stage}_queue')
+        metrics.gauge(f'{stage}_queue_depth', f"Frames queued for {stage}", queue.__len__)
+        metrics.counter(f'{stage}_queue_dropped_total', f"Frames dropped from the {stage} queue",
+                        lambda queue=queue: queue.dropped)
+    metrics.counter('record_queue_spilled_total', "Frames spilled to disk by the record queue",
+                    lambda: pipeline.record_queue.spilled)
+
+    metrics.histogram('decode_seconds', "Deobfuscate and decode time per frame", pipeline.decode_time)
+    metrics.histogram('record_seconds', "Record time per frame", pipeline.record_time)
+    metrics.histogram('frame_latency_seconds', "First packet to display", pipeline.latency)
+    return metrics
+
+def elapsed(start, end):
+    """Seconds from start to end, NaN while either is unknown (None)"""
+    if start is None or end is None:
+        return float('nan')
+    return end - start
+
+def print_status(status):
+    """Overwrite the terminal status line"""
+    sys.stdout.write(f"\r{status()}")
+    sys.stdout.flush()
+
+def stream_manager(drone_ip, drone_port, local_port, command, filename, frame_timeout=FRAME_TIMEOUT,
+                   record_policy=SPILL, control=None, metrics_port=None, trace_size=0,
+                   record_file=RECORD_FILE, decoder=None, archive_file=None, control_input=None,
+                   serve_port=None, feed_address=None, ring_name=None, ring_slots=None,
+                   headless=False, gate_signature=None, gate_threshold=None,
+                   keyframe_interval=KEYFRAME_INTERVAL):
     """
     Manages both command sending and stream reception using a single socket 
     bound to a specific local port, and processes MJPEG frames.
+    Frames still incomplete after frame_timeout seconds are dropped.
+
+    The socket is owned by an asyncio DroneSession on a background thread,
+    which sends the start/heartbeat command every second and, if a
+    ControlState is given, control packets every 50ms. control_input is
+    'keyboard' or 'gamepad' to drive it from control_input.py (a neutral
+    ControlState is created if none is given). Decoding, display
+    and recording are separate pipeline stages (record_policy is SPILL or
+    DROP_OLDEST, never BLOCK: the recorder is fed from the receive loop).
+    Frames are recorded as received to MJPEG AVI segments named after
+    record_file, or not at all if it is None, and to a FrameArchive
+    if archive_file is given. decoder is the JPEG
+    backend for the preview (see decoders.py); recording is unaffected.
+
+    A status line is printed every STATUS_INTERVAL; metrics_port serves the
+    same metrics over HTTP and trace_size > 0 keeps a ring of per-packet
+    records that is written to TRACE_FILE on exit.
+
+    serve_port publishes the frames as an MJPEG stream over HTTP and
+    feed_address (a (host, port) or Unix socket path) as a raw frame feed
+    (see fanout.py); viewers share each frame and add no decode work.
+    ring_name writes the decoded images to a shared memory ring of
+    ring_slots frames for other processes (see frame_ring.py).
+
+    headless runs without a window, for recording and relaying: frames are
+    not decoded at all unless a ring needs the images, so neither OpenCV
+    nor NumPy is loaded. startup_seconds (process start to the start
+    command) and the time to the first packet and frame are reported as
+    metrics and in the summary.
+
+    gate_signature (a record_gate signature instance) puts a RecordGate in
+    front of the recorder and archive: only frames that changed by more than
+    gate_threshold, and one every keyframe_interval seconds, are recorded.
     """
-    print(f"🔗 Binding local socket to port {local_port}...")
-    
-    # 1. Create and bind the socket to the specific local port
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind(('0.0.0.0', local_port)) 
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
-    except socket.error as e:
-        print(f"❌ Error binding socket to port {local_port}: {e}")
-        print("Note: Port is likely in use. Try changing LOCAL_SOURCE_PORT.")
-        return
-
-    # 2. Send initial command
-    print(f"📡 Sending initial command...")
-    send_command(sock, drone_ip, drone_port, command)
-    time.sleep(1)
-
-    # 3. Listen for the video stream
-    print(f"\n📺 Starting video listener on port {local_port}...")
-    print(f"Listening for video data and decoding frames...")
-    print("Press Ctrl+C to stop the listener.")
-    
-    bytes_received = 0
-    start_time = time.time()
-    last_command_time = time.time()
-    frame_count = 0
-    keyframe_data = b'' # This is the reusable JPEG header template
-
-    running_frame=None
-    current_frame_sequence=None
-
-    with open(filename, 'wb') as f:
-        while True:
+    trace = TraceRing(trace_size) if trace_size else None
+    if control_input and control is None:
+        control = ControlState()
+    recorder = AviRecorder(record_file) if record_file else None
+    archive = FrameArchive(archive_file) if archive_file else None
+    record = frame_recorder(recorder, archive) if recorder or archive else None
+    gate = None
+    if record is not None and gate_signature is not None:
+        gate = record = RecordGate(record, gate_signature, gate_threshold, keyframe_interval)
+    hub = FrameHub() if serve_port is not None or feed_address is not None else None
+    ring = None
+    if ring_name:
+        from frame_ring import RING_SLOTS, FrameRingWriter
+
+        ring_slots = ring_slots or RING_SLOTS
+        try:
+            ring = FrameRingWriter(ring_name, ring_slots)
+            print(f"🧩 Decoded frames shared in ring {ring.name} ({ring_slots} slots)")
+        except (FileExistsError, OSError, ValueError) as e:
+            print(f"❌ Could not create frame ring {ring_name}: {e}")
+    with CaptureWriter(filename) as capture:
+        receiver = create_video_receiver(frame_timeout, capture, display=None if headless else show_frame,
+                                         record=record, record_policy=record_policy, trace=trace,
+                                         record_frames=True, decoder=decoder,
+                                         publish=hub.publish if hub else None,
+                                         share=ring.write if ring else None,
+                                         decode=not headless or ring is not None)
+        pipeline = receiver.pipeline
+        session = DroneSession(drone_ip, drone_port, command, control=control)
+        receiver.attach(session)
+        session.add_timer(frame_timeout, lambda: receiver.expire(time.monotonic()))
+
+        metrics = create_metrics(receiver, session)
+        metrics.gauge('startup_seconds', "Process start to the start command",
+                      lambda: elapsed(PROCESS_STARTED, session.first_sent))
+        status = StatusLine(metrics)
+        session.add_timer(STATUS_INTERVAL, lambda: print_status(status))
+        server = None
+        if metrics_port is not None:
             try:
-                # Send heartbeat command every 1 second (line 15003)
-                current_time = time.time()
-                if current_time - last_command_time >= 1.0:
-                    send_command(sock, drone_ip, drone_port, command)
-                    last_command_time = current_time
-                
-                data, address = sock.recvfrom(2048)
-                f.write(data)
-                bytes_received += len(data)
-                
-                # Process each UDP packet individually
-                if len(data) > PROPRIETARY_HEADER_LENGTH and data[:2] == b'\x63\x63':
-                    
-                    # Decode packet header
-                    hdr = decode_packet_header(data)
-                    if not hdr:
-                        print(f"❌ Invalid packet header")
-                        continue
-                    
-                    message_type = hdr['cmd_type']
-                    frame_sequence = hdr['frame_id']
-                    sequence_id = data[48] if len(data) > 48 else 0
-                    
-                    print(f"cmd={message_type:02X} frame={frame_sequence} seq={sequence_id}")
-
-                    if message_type == 0x01:
-                        # Heartbeat/ACK
-                        try:
-                            payload_text = hdr['payload'].rstrip(b'\x00').decode('ascii')
-                            print(f"📦 Heartbeat: {payload_text}")
-                        except:
-                            print("📦 Heartbeat received")
-
-                    # test for type 3, video frame
-                    elif message_type == 0x03:
-                    
-                        # test for new frame
-                        if current_frame_sequence!=frame_sequence:
-                            # ok, we have a new frame
-                            if running_frame:
-                                # Apply VGA obfuscation decode if needed
-                                frame_type_flag = data[7]  # offset 7 is frame type
-                                running_frame = decode_vga_obfuscation(running_frame, current_frame_sequence, frame_type_flag)
-                                
-                                print(f"Frame size {len(running_frame)}")
-                                decode_frame(running_frame, frame_count)
-
-                                # increment the frame count
-                                frame_count += 1
-
-                                # reset the running frame
-                                running_frame = None
-
-                        current_frame_sequence=frame_sequence
-
-                        payload = data[PROPRIETARY_HEADER_LENGTH:]
-
-                        # print the start of payload
-                        #print(f"🔍 Payload starts with: {payload.hex()}")
-                        
-                        # --- I-Frame (keyframe) Logic: Contains JPEG SOI (FFD8) ---
-                        if sequence_id==1 and payload.startswith(JPEG_SOI):
-
-                            #print("JPEG_SOI detected")
-                            
-                            # set running_frame to payload, new frame
-                            running_frame = payload
-                        
-                            #if frame_count>2:
-                            #    sys.exit(0)
-
-                        
-                        elif sequence_id>1:
-                            print("Append to frame")
-                            # append the payload to the running frame
-                            running_frame += payload
-                        else:
-                            # dump frame 200 bytes
-                            print(f"❌ I-Frame does not start with JPEG SOI. Dumping 200 bytes: {data[:200].hex()}")
-                            raise Exception(f"I-Frame does not start with JPEG SOI") 
-
-                    else:
-                        print(f"Unknown message type {message_type}") 
-                        raise Exception(f"Unknown message type {message_type}") 
-                else:
-                    print(f"❌ Packet does not start with proprietary header. Dumping 200 bytes: {data[:200].hex()}")
-                    # throw exception we want to see this
-                    raise Exception("Packet does not start with proprietary header")
-                
-                # Print status update
-                if bytes_received % (1024 * 100) < 2048: 
-                    elapsed = time.time() - start_time
-                    rate = (bytes_received / (1024 * 1024)) / elapsed if elapsed > 0 else 0
-                    sys.stdout.write(f"\rBytes: {bytes_received / (1024*1024):.2f} MB @ {rate:.2f} MB/s | Frames: {frame_count}")
-                    sys.stdout.flush()
-
-            except KeyboardInterrupt:
-                break
+                server = MetricsServer(metrics, metrics_port, trace=trace).start()
+                print(f"📈 Metrics on http://127.0.0.1:{server.port}/metrics")
+            except OSError as e:
+                print(f"❌ Could not start metrics server on port {metrics_port}: {e}")
+
+        viewers = []
+        if hub is not None:
+            metrics.gauge('viewers', "Connected MJPEG and feed viewers", lambda: hub.clients)
+            metrics.counter('frames_published_total', "Frames published to viewers",
+                            lambda: hub.frames_published)
+            metrics.counter('frames_skipped_total', "Frames slow viewers skipped",
+                            lambda: hub.frames_skipped)
+        if gate is not None:
+            metrics.counter('frames_gated_total', "Frames the recording gate left out",
+                            lambda: gate.frames_skipped)
+            metrics.histogram('record_gate_distance', "Frame change against the last recorded frame",
+                              gate.distances)
+        if ring is not None:
+            metrics.counter('frames_shared_total', "Decoded frames written to the frame ring",
+                            lambda: ring.frames_written)
+        if serve_port is not None:
+            try:
+                viewers.append(MjpegServer(hub, serve_port).start())
+                print(f"🌐 MJPEG stream on http://127.0.0.1:{viewers[-1].port}/stream.mjpg")
+            except OSError as e:
+                print(f"❌ Could not start MJPEG server on port {serve_port}: {e}")
+        if feed_address is not None:
+            try:
+                viewers.append(FrameFeedServer(hub, feed_address).start())
+                print(f"🔌 Frame feed on {viewers[-1].location}")
+            except OSError as e:
+                print(f"❌ Could not start frame feed on {feed_address}: {e}")
+
+        # 1. Bind the socket and start sending the start command right away
+        print(f"🔗 Binding local socket to port {local_port}...")
+        print(f"📡 Sending initial command...")
+        session_thread = SessionThread(session, local_port)
+        session_thread.start()
+        session_thread.ready.wait()
+        if session_thread.error:
+            print(f"❌ Error binding socket to port {local_port}: {session_thread.error}")
+            print("Note: Port is likely in use. Try changing LOCAL_SOURCE_PORT.")
+            return
+
+        inputs = None
+        if control_input == 'keyboard':
+            from control_input import KEY_HELP, KeyboardInput
+            inputs = KeyboardInput(control, on_quit=session_thread.stop)
+            print(f"\n🎮 Keyboard control\n{KEY_HELP}")
+        elif control_input == 'gamepad':
+            from control_input import GamepadInput
+            try:
+                inputs = GamepadInput(control)
+                print(f"\n🎮 Gamepad control: {inputs.device}")
+            except (ImportError, OSError) as e:
+                print(f"❌ Gamepad unavailable ({e}), sending neutral control")
+        if inputs is not None:
+            inputs.start()
+
+        # 2. Listen for the video stream
+        print(f"\n📺 Starting video listener on port {local_port}...")
+        if headless:
+            print(f"Listening for video data, headless{' (decoding for the ring)' if ring else ''}...")
+        else:
+            print(f"Listening for video data and decoding frames...")
+        print("Press Ctrl+C to stop the listener.")
+
+        pipeline.start()
+        try:
+            if headless:
+                session_thread.finished.wait()
+            else:
+                # OpenCV windows have to be driven from the main thread
+                pipeline.run_display(session_thread.finished)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if inputs is not None:
+                inputs.stop()
+            session_thread.stop()
+            pipeline.stop()
+            if recorder is not None:
+                recorder.close()
+            if archive is not None:
+                archive.close()
+            if server is not None:
+                server.stop()
+            for viewer in viewers:
+                viewer.stop()
+            if ring is not None:
+                ring.close()
+
+    if trace is not None:
+        trace.dump(TRACE_FILE)
+        print(f"\n🧾 Trace written to {TRACE_FILE}")
 
     print("\n🛑 Listener stopped.")
-    print(f"Total data saved: {bytes_received / (1024*1024):.2f} MB")
-    print(f"Total frames processed: {frame_count}")
-    sock.close()
+    print(f"Total data saved: {receiver.bytes_received / (1024*1024):.2f} MB")
+    print(f"Total frames processed: {receiver.frame_count}")
+    print_startup_summary(session, receiver)
+    if recorder is not None and recorder.segments:
+        print(f"Recorded {recorder.frames} frames to {', '.join(recorder.segments)}")
+    if archive is not None:
+        print(f"Archived {archive.frames} frames to {archive_file} ({archive.size / (1024*1024):.2f} MB)")
+    if gate is not None:
+        print(f"🚦 Recording gate ({gate.signature.name} > {gate.threshold:g}): kept {gate.frames_kept} "
+              f"({gate.keyframes} keyframes), skipped {gate.frames_skipped} "
+              f"({gate.bytes_skipped / (1024*1024):.2f} MB not written)")
+    for stream, reassembler in receiver.reassemblers.items():
+        if reassembler.stats.packets:
+            print(f"Reassembly ({stream}): {reassembler.stats.as_dict()}")
+    print(f"Pipeline: {pipeline.stats()}")
+    print_receive_summary(session.receive_stats)
+    if hub is not None:
+        print(f"Viewers: {hub.stats()}")
+    if ring is not None:
+        print(f"Frame ring: {ring.frames_written} written, {ring.frames_oversized} too large for a slot")
+    if control is not None:
+        print_control_summary(control.stats)
+    if receiver.packets_clamped:
+        print(f"Packets cut short of their data_len: {receiver.packets_clamped}")
+    if receiver.frames_hw_encoded:
+        print(f"Hardware-encoded (0x81) frames passed through undecoded: {receiver.frames_hw_encoded}")
+    if receiver.frames_rejected:
+        print(f"Rejected before decode: {dict(receiver.frames_rejected)}")
+
+
+def print_startup_summary(session, receiver):
+    if session.first_sent is None:
+        return  # never got as far as the start command
+    line = f"⏱️  Startup: start command after {(session.first_sent - PROCESS_STARTED) * 1000:.0f} ms"
+    for what, at in (('packet', session.first_received), ('frame', receiver.first_frame)):
+        if at is not None:
+            line += f", first {what} {elapsed(session.first_sent, at) * 1000:.1f} ms later"
+    print(line)
 
 
 # --- MAIN EXECUTION ---
 if __name__ == '__main__':
-    try:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Receive and display the drone video stream")
+    parser.add_argument('--drone-ip', default=DRONE_IP, help="drone address (127.0.0.1 for simulator.py)")
+    parser.add_argument('--drone-port', type=int, default=DRONE_COMMAND_PORT)
+    parser.add_argument('--local-port', type=int, default=LOCAL_SOURCE_PORT)
+    parser.add_argument('--output', default=OUTPUT_FILE, help="capture file")
+    parser.add_argument('--record', default=RECORD_FILE, help="MJPEG AVI recording, segments are numbered")
+    parser.add_argument('--no-record', dest='record', action='store_const', const=None,
+                        help="do not record video")
+    parser.add_argument('--archive', help="also keep a seekable frame archive (see archive.py)")
+    parser.add_argument('--metrics-port', type=int, help="serve metrics over HTTP on this local port")
+    parser.add_argument('--trace', type=int, default=0, metavar='N',
+                        help=f"keep the last N per-packet trace records and write them to {TRACE_FILE}")
+    parser.add_argument('--decoder', default='auto', choices=('auto',) + tuple(DECODERS),
+                        help="JPEG decoder, auto picks the fastest available at startup")
+    parser.add_argument('--preview-scale', type=int, default=1, choices=SCALES,
+                        help="decode the preview at 1/N size (recording keeps full frames)")
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help="serve the video as MJPEG over HTTP on this local port")
+    parser.add_argument('--feed', type=parse_feed_address, metavar='ADDRESS',
+                        help="serve raw frames on host:port or a Unix socket path (see fanout.py)")
+    parser.add_argument('--ring', metavar='NAME',
+                        help="share decoded frames with other processes in this shared memory ring")
+    parser.add_argument('--ring-slots', type=int, help="frames the ring holds (frame_ring.RING_SLOTS by default)")
+    parser.add_argument('--control', choices=('keyboard', 'gamepad'),
+                        help="send control packets every 50ms, driven from the terminal or a gamepad")
+    parser.add_argument('--gate', choices=tuple(SIGNATURES),
+                        help="only record frames that changed: thumb (1/8 scale DC decode) or size "
+                             "(restart interval sizes, no decode)")
+    parser.add_argument('--gate-threshold', type=float,
+                        help="change needed to record a frame, 0..1 (default "
+                             + ", ".join(f"{name} {value:g}" for name, value in GATE_THRESHOLDS.items()) + ")")
+    parser.add_argument('--keyframe-interval', type=float, default=KEYFRAME_INTERVAL,
+                        help="with --gate, record a frame at least every this many seconds")
+    parser.add_argument('--headless', action='store_true',
+                        help="no window and no decoding (except for --ring): record and relay only")
+    args = parser.parse_args()
+
+    decoder = None
+    if not args.headless or args.ring:
+        try:
+            decoder = select_decoder(args.decoder, args.preview_scale)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"❌ Decoder {args.decoder} unavailable: {e}")
+            sys.exit(1)
+        print(f"🖼️  Decoder: {decoder.name} at 1/{decoder.scale} scale")
+
+    gate_signature = None
+    if args.gate:
+        try:
+            gate_signature = SIGNATURES[args.gate]()
+        except ImportError as e:
+            print(f"❌ Recording gate {args.gate} unavailable: {e}")
+            sys.exit(1)
+
+    if not args.headless:
+        import cv2
         cv2.namedWindow('Drone Video Stream', cv2.WINDOW_AUTOSIZE)
-        stream_manager(DRONE_IP, DRONE_COMMAND_PORT, LOCAL_SOURCE_PORT, START_COMMAND, OUTPUT_FILE)
+    try:
+        stream_manager(args.drone_ip, args.drone_port, args.local_port, START_COMMAND, args.output,
+                       metrics_port=args.metrics_port, trace_size=args.trace, record_file=args.record,
+                       decoder=decoder, archive_file=args.archive, control_input=args.control,
+                       serve_port=args.serve, feed_address=args.feed, ring_name=args.ring,
+                       ring_slots=args.ring_slots, headless=args.headless, gate_signature=gate_signature,
+                       gate_threshold=args.gate_threshold, keyframe_interval=args.keyframe_interval)
     finally:
-        cv2.destroyAllWindows()
\ No newline at end of file
+        if not args.headless:
+            cv2.destroyAllWindows()
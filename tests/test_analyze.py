@@ -0,0 +1,58 @@
+"""
+Header analytics over a capture of the drone's own packet layout.
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analyze import analyze
+from capture import CaptureWriter
+from simulator import create_video_packets
+from test_reassembly import JPEG, drone_packets
+
+
+def write_capture(filename, layout):
+    """20 frames of 5 packets: frame 10 missing, packet 2 of frame 3 lost, one duplicate"""
+    packets = []
+    for frame_id in range(1, 21):
+        if frame_id == 10:
+            continue
+        frame = create_video_packets(frame_id, JPEG, payload_size=700, layout=layout)
+        if frame_id == 3:
+            del frame[2]
+        if frame_id == 5:
+            frame.append(frame[0])
+        packets.extend(frame)
+    with CaptureWriter(filename) as writer:
+        for index, packet in enumerate(packets):
+            writer.write(packet, index * 1000000)
+
+
+def test_drone_layout_frames_and_loss(tmp_path):
+    for layout in ('drone', 'table'):
+        filename = str(tmp_path / f'{layout}.bin')
+        write_capture(filename, layout)
+        report = analyze(filename)
+        frames, loss = report['frames'], report['loss']
+        assert (frames['frames'], frames['complete']) == (19, 18)
+        assert frames['packets_per_frame']['max'] == 5
+        assert frames['complete_frame_bytes']['max'] == len(JPEG)
+        assert frames['layouts'][layout] == 95
+        assert (loss['lost'], loss['missing_frames'], loss['duplicates']) == (1, 1, 1)
+
+
+def test_unsized_frames_run_to_their_highest_packet(tmp_path):
+    packets = drone_packets(JPEG, size=700, sized=False)
+    del packets[2]
+    filename = str(tmp_path / 'unsized.bin')
+    with CaptureWriter(filename) as writer:
+        for index, packet in enumerate(packets):
+            writer.write(packet, index * 1000000)
+    report = analyze(filename)
+    assert (report['frames']['frames'], report['frames']['complete']) == (1, 0)
+    assert report['frames']['layouts']['unsized'] == 4
+    assert report['loss']['lost'] == 1
@@ -0,0 +1,34 @@
+"""
+Metrics exports.
+
+    python3 -m pytest tests
+"""
+
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import Histogram, Metrics, MetricsServer
+
+
+def test_metrics_json_has_null_for_missing_readings():
+    metrics = Metrics()
+    metrics.counter('frames_total', "Frames", lambda: 3)
+    metrics.gauge('startup_seconds', "Start command to first frame", lambda: float('nan'))
+    metrics.histogram('decode_seconds', "Decode time", Histogram())
+
+    server = MetricsServer(metrics, port=0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics.json") as response:
+            text = response.read().decode()
+    finally:
+        server.stop()
+
+    assert 'NaN' not in text
+    values = json.loads(text)
+    assert values['frames_total'] == 3
+    assert values['startup_seconds'] is None
+    assert values['decode_seconds']['p50'] is None
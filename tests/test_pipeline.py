@@ -0,0 +1,82 @@
+"""
+Decode workers and record stage of the Pipeline.
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pipeline import BLOCK, Pipeline
+from reassembly import Frame
+
+
+def test_decode_errors_are_counted_and_workers_survive():
+    released = []
+
+    def decode(frame):
+        if frame.frame_id % 3 == 0:
+            raise ValueError("corrupt frame")
+        return None if frame.frame_id % 3 == 1 else frame.frame_id
+
+    pipeline = Pipeline(decode, released.append, workers=4, decode_policy=BLOCK, clock=None)
+    pipeline.start()
+    for frame_num in range(300):
+        pipeline.submit(frame_num, Frame(frame_num, 0x02, bytearray(4), 4))
+    pipeline.stop(drain=True)
+
+    assert len(released) == 300
+    assert pipeline.frames_failed == 200
+    assert pipeline.frames_decoded == 100
+    assert pipeline.decode_time.count == 300
+
+
+def test_stalled_recorder_does_not_block_submit():
+    released, recorded = [], []
+    stalled = threading.Event()
+
+    def record(frame_num, frame):
+        stalled.wait()
+        recorded.append(frame_num)
+
+    # Live defaults: submit() runs on the receive loop and must never wait
+    pipeline = Pipeline(None, released.append, record=record, record_frames=True, clock=None)
+    pipeline.start()
+    submitter = threading.Thread(target=lambda: [
+        pipeline.submit(frame_num, Frame(frame_num, 0x02, bytearray(4), 4)) for frame_num in range(200)])
+    submitter.start()
+    submitter.join(timeout=5)
+    blocked = submitter.is_alive()
+    stalled.set()
+    submitter.join()
+    pipeline.stop(drain=True)
+
+    assert not blocked
+    assert pipeline.record_queue.spilled > 0
+    assert recorded == list(range(200))
+    assert len(released) == 200
+
+
+def test_record_errors_are_counted_and_writer_survives():
+    released, recorded = [], []
+
+    def record(frame_num, frame):
+        if frame_num % 2:
+            raise OSError("disk full")
+        recorded.append(frame_num)
+
+    # BLOCK would wait forever on a dead writer once the queue filled
+    pipeline = Pipeline(None, released.append, record=record, record_frames=True,
+                        record_policy=BLOCK, clock=None)
+    pipeline.start()
+    for frame_num in range(300):
+        pipeline.submit(frame_num, Frame(frame_num, 0x02, bytearray(4), 4))
+    pipeline.stop(drain=True)
+
+    assert recorded == list(range(0, 300, 2))
+    assert pipeline.frames_recorded == 150
+    assert pipeline.frames_record_failed == 150
+    assert pipeline.record_time.count == 300
@@ -0,0 +1,187 @@
+"""
+Multi-packet reassembly from the receiver's point of view, with the drone's
+own packet layout as well as the one simulator.py writes.
+
+    python3 -m pytest tests
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from obfuscation import FRAME_TYPE_HW_ENCODED, FRAME_TYPE_PLAIN, decode_vga_obfuscation
+from protocol import PAYLOAD_OFFSET, SEQ_BYTE_OFFSET, VIDEO_FIELDS, VGAPacket
+from simulator import create_video_packets
+from stream_video import create_video_receiver
+
+# A cmd 0x03 packet from the drone (WorkInProgress/decode_packet.py)
+DRONE_PACKET = bytes.fromhex(
+    "63630300004601037e675a5a681c00005a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a5a"
+    "5a5a5a01060006001001a28a0028a28a")
+DRONE_FRAME_ID = 0x5a5a677e
+DRONE_FRAME_TYPE = 0x03
+
+JPEG = b'\xff\xd8' + bytes(range(256)) * 12 + b'\xff\xd9'
+
+
+def receiver():
+    frames = []
+    video = create_video_receiver(display=None, record=None, decode=False,
+                                  publish=lambda frame_num, frame: frames.append(frame))
+    return video, frames
+
+
+def feed(video, packets):
+    for now, packet in enumerate(packets):
+        video.on_video(VGAPacket(packet), now * 0.001)
+
+
+def drone_packets(jpeg, size=1000, sized=True, pad_last=0):
+    """The JPEG in packets with the drone sample's header, obfuscated like the drone's"""
+    jpeg = decode_vga_obfuscation(jpeg, DRONE_FRAME_ID, DRONE_FRAME_TYPE)
+    chunks = [jpeg[i:i + size] for i in range(0, len(jpeg), size)]
+    packets = []
+    for number, chunk in enumerate(chunks, 1):
+        packet = bytearray(DRONE_PACKET[:PAYLOAD_OFFSET] + chunk)
+        if sized:
+            VIDEO_FIELDS.pack_into(packet, SEQ_BYTE_OFFSET, number, len(chunks), len(chunk))
+        else:
+            packet[SEQ_BYTE_OFFSET + 1:PAYLOAD_OFFSET] = b'\x5a' * (PAYLOAD_OFFSET - SEQ_BYTE_OFFSET - 1)
+            packet[SEQ_BYTE_OFFSET] = number
+        if number == len(chunks):
+            packet += b'\x5a' * pad_last
+        packets.append(bytes(packet))
+    return packets
+
+
+def test_drone_sample_packet_is_placed():
+    for packet in (DRONE_PACKET, DRONE_PACKET + bytes(1400 - len(DRONE_PACKET))):
+        video, frames = receiver()
+        feed(video, [packet])
+        stats = video.reassembler.stats
+        assert stats.packets == 1
+        assert stats.packets_invalid == 0
+        assert video.reassembler.inflight == 1
+        assert frames == []
+
+
+def test_drone_sample_fields():
+    packet_seq, total_packets, payload, clamped = VGAPacket(DRONE_PACKET).video_position()
+    assert (packet_seq, total_packets, clamped) == (5, 6, True)
+    assert bytes(payload) == DRONE_PACKET[PAYLOAD_OFFSET:]
+
+
+def test_drone_layout_frame():
+    video, frames = receiver()
+    feed(video, drone_packets(JPEG))
+    assert [bytes(frame.data) for frame in frames] == [JPEG]
+    assert frames[0].frame_id == DRONE_FRAME_ID
+
+
+def test_drone_layout_without_count_ends_at_eoi():
+    packets = drone_packets(JPEG, sized=False, pad_last=300)
+    random.Random(1).shuffle(packets)
+    video, frames = receiver()
+    feed(video, packets)
+    assert [bytes(frame.data) for frame in frames] == [JPEG]
+    assert video.reassembler.stats.packets_unsized == len(packets)
+
+
+def test_without_count_first_packet_needs_soi():
+    video, frames = receiver()
+    feed(video, drone_packets(b'\x00\x00' + JPEG[2:], sized=False))
+    assert frames == []
+    assert video.reassembler.stats.packets_invalid == 1
+
+
+def test_simulator_layout_frame():
+    video, frames = receiver()
+    feed(video, create_video_packets(7, JPEG, frame_type=0x03, payload_size=700))
+    assert [bytes(frame.data) for frame in frames] == [JPEG]
+
+
+def test_short_packet_is_clamped_not_dropped():
+    packets = create_video_packets(7, JPEG, frame_type=FRAME_TYPE_PLAIN, payload_size=700)
+    packets[-1] = packets[-1][:-50]
+    video, frames = receiver()
+    feed(video, packets)
+    assert [bytes(frame.data) for frame in frames] == [JPEG[:-50]]
+    assert video.packets_clamped == 1
+    assert video.reassembler.stats.packets_invalid == 0
+
+
+def test_frame_counter_restart():
+    video, frames = receiver()
+
+    def send(frame_id, now):
+        for packet in create_video_packets(frame_id, JPEG, payload_size=4000):
+            video.on_video(VGAPacket(packet), now)
+
+    for now, frame_id in enumerate(range(200, 216)):
+        send(frame_id, now * 0.03)
+    assert len(frames) == 16
+
+    # The drone restarts its counter: late until the slots sit idle a frame timeout
+    send(1, 0.5)
+    assert len(frames) == 16 and video.reassembler.stats.packets_late == 1
+    for now, frame_id in enumerate(range(2, 17)):
+        send(frame_id, 0.8 + now * 0.03)
+    assert [frame.frame_id for frame in frames[16:]] == list(range(2, 17))
+
+
+def test_hw_encoded_frames_pass_through_and_are_counted():
+    video, frames = receiver()
+    feed(video, create_video_packets(7, JPEG, frame_type=FRAME_TYPE_HW_ENCODED, payload_size=700))
+    assert [bytes(frame.data) for frame in frames] == [JPEG]
+    assert video.frames_hw_encoded == 1
+
+
+def test_hw_encoded_frames_are_not_decoded():
+    frames = []
+    video = create_video_receiver(display=None, record=None, clock=None,
+                                  publish=lambda frame_num, frame: frames.append(frame))
+    video.pipeline.start()
+    feed(video, create_video_packets(7, JPEG, frame_type=FRAME_TYPE_HW_ENCODED, payload_size=700))
+    video.pipeline.stop(drain=True)
+    assert [bytes(frame.data) for frame in frames] == [JPEG]
+    assert video.pipeline.frames_failed == 0 and video.pipeline.frames_decoded == 0
+    assert not video.frames_rejected
+
+
+def big_jpeg(size, seed=2):
+    """A JPEG-framed random body of size bytes with stray EOIs in it"""
+    body = bytearray(random.Random(seed).randbytes(size))
+    for at in range(1000, size, size // 5):
+        body[at:at + 2] = b'\xff\xd9'
+    return b'\xff\xd8' + bytes(body) + b'\xff\xd9'
+
+
+def test_simulator_layout_frame_over_64_packets():
+    jpeg = big_jpeg(275000)
+    packets = create_video_packets(7, jpeg, frame_type=FRAME_TYPE_PLAIN, payload_size=1400)
+    assert len(packets) == 197
+    random.Random(3).shuffle(packets)
+    video, frames = receiver()
+    feed(video, packets)
+    assert [bytes(frame.data) for frame in frames] == [jpeg]
+    assert video.reassembler.stats.packets_invalid == 0
+
+
+def test_drone_layout_frame_over_255_packets():
+    jpeg = big_jpeg(60000)
+    packets = drone_packets(jpeg, size=200)
+    assert len(packets) > 255
+    video, frames = receiver()
+    feed(video, packets)
+    assert [bytes(frame.data) for frame in frames] == [jpeg]
+
+
+def test_without_count_stray_eoi_does_not_end_frame():
+    jpeg = big_jpeg(100000)
+    packets = drone_packets(jpeg, size=1400, sized=False, pad_last=300)
+    assert len(packets) > 64
+    video, frames = receiver()
+    feed(video, packets)
+    assert [bytes(frame.data) for frame in frames] == [jpeg]
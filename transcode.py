@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Parallel offline transcoding of captures and frame dumps.
+
+A capture (capture.py) is cut into chunks of CHUNK_FRAMES frames at the
+first packet of a frame, as listed in its sidecar index (or found by
+walking the records when it has none). Each chunk is reassembled and
+deobfuscated by a worker process that maps the capture itself, so only
+the chunk's offsets are sent to it. A frame belongs to the chunk holding
+its first packet: a worker reads on past the end of its chunk (for at
+most the frame timeout) to pick up late packets of its own frames, and
+ignores the late packets at its start that finish the previous chunk's
+last frames. A legacy dump (every datagram back to back, as the original
+stream_video.py wrote drone_raw_video_stream.bin) is first converted into a
+capture in the parts directory, with frames stamped at 25 fps as it kept no
+times. A frames/ directory (frame_N.jpg, as saved by stream_video.py) is cut
+into runs of files in frame number order.
+
+Output formats:
+    avi    MJPEG AVI of the drone's own JPEGs (avi.AviRecorder), nothing decoded
+    jpeg   frame_<position>.jpg files, passthrough
+    png    frame_<position>.png files, decoded by the workers
+
+position numbers the frames of the source in order, from each chunk's
+first frame on, so numbers can be skipped where frames were lost. Workers write their frames straight into the
+output directory (jpeg, png) or into a FrameArchive part (avi), then the
+chunk's counters into <output>.parts/. The main process writes the AVI
+from the parts in chunk order, each one as soon as it and the chunks
+before it are done. An interrupted run is continued with --resume, which
+only redoes the chunks that have no counters yet.
+
+Usage:
+    python3 transcode.py drone_raw_video_stream.bin flight.avi
+    python3 transcode.py drone_raw_video_stream.bin flight_png/ --format png --workers 8
+    python3 transcode.py frames/ frames.avi
+    python3 transcode.py drone_raw_video_stream.bin flight.avi --resume
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import shutil
+import signal
+import time
+from collections import namedtuple
+
+from archive import ArchiveReader, FrameArchive
+from avi import RECORD_FPS, AviRecorder
+from capture import (CAPTURE_MAGIC, RECORD_HEADER, CaptureReader, FrameExtractor, convert_raw_dump,
+                     is_capture, is_raw_dump, read_index)
+from protocol import CMD_SINGLE_VIDEO, CMD_VIDEO, PAYLOAD_OFFSET, HDPacket, VGAPacket, is_hd, is_vga
+from reassembly import MAX_INFLIGHT_FRAMES
+
+FORMATS = ('avi', 'jpeg', 'png')
+
+# Frames per chunk, about ten seconds of video
+CHUNK_FRAMES = 250
+
+PARTS_SUFFIX = '.parts'
+PLAN_FILE = 'plan.json'
+# A legacy dump converted to a capture, in the parts directory
+RAW_CAPTURE_FILE = 'source.cap'
+
+# start and end are record offsets (capture) or file list positions
+# (frames directory); first is the position of the chunk's first frame,
+# skip the frame_ids of the previous chunk's last frames
+Chunk = namedtuple('Chunk', 'index start end first frames skip')
+
+
+def plan_capture(filename, chunk_frames=CHUNK_FRAMES):
+    """Chunks of chunk_frames frames, each starting at the first packet of a frame"""
+    starts = read_index(filename)
+    size = os.path.getsize(filename)
+    starts = [(frame_id, offset) for frame_id, offset in starts if offset < size]
+    if not starts:
+        starts = list(_walk_frame_starts(filename))
+
+    chunks = []
+    for first in range(0, len(starts), chunk_frames):
+        following = first + chunk_frames
+        skip = frozenset(frame_id for frame_id, offset in starts[max(0, first - MAX_INFLIGHT_FRAMES):first]
+                         if frame_id is not None)
+        chunks.append(Chunk(len(chunks), len(CAPTURE_MAGIC) if first == 0 else starts[first][1],
+                            starts[following][1] if following < len(starts) else None,
+                            first, len(starts[first:following]), skip))
+    return chunks
+
+
+def _walk_frame_starts(filename):
+    """(frame_id, offset) of the records starting a frame, for captures without an index"""
+    view, hd_view = VGAPacket(), HDPacket()
+    last_frame_id = None
+    offset = len(CAPTURE_MAGIC)
+    with CaptureReader(filename) as capture:
+        packet = None
+        for timestamp_ns, packet in capture:
+            if len(packet) > PAYLOAD_OFFSET and is_vga(packet):
+                if packet[2] == CMD_VIDEO:
+                    frame_id = view.bind(packet).frame_id
+                    if frame_id != last_frame_id:
+                        yield frame_id, offset
+                        last_frame_id = frame_id
+                elif packet[2] == CMD_SINGLE_VIDEO:
+                    yield view.bind(packet).frame_id, offset
+            elif is_hd(packet) and hd_view.bind(packet).first:
+                yield None, offset
+            offset += RECORD_HEADER.size + len(packet)
+        del packet
+        view.bind(b'')
+        hd_view.bind(b'')
+
+
+def frame_files(directory):
+    """JPEG files of a frames directory, by the frame number in their name"""
+    files = glob.glob(os.path.join(directory, '*.jpg')) + glob.glob(os.path.join(directory, '*.jpeg'))
+    return sorted(files, key=lambda name: (_frame_number(name) or 0, name))
+
+
+def plan_files(files, chunk_frames=CHUNK_FRAMES):
+    return [Chunk(index, first, min(first + chunk_frames, len(files)), first,
+                  min(chunk_frames, len(files) - first), frozenset())
+            for index, first in enumerate(range(0, len(files), chunk_frames))]
+
+
+def _frame_number(name):
+    match = re.search(r'(\d+)\D*$', os.path.basename(name))
+    return int(match.group(1)) if match else None
+
+
+# Decoder instances of a worker process, by (backend, scale)
+_decoders = {}
+
+
+def _worker_init():
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _frame_writer(job, counters):
+    """write(position, frame_id, timestamp_ns, jpeg) for the job's format, and its close()"""
+    fmt, output = job['format'], job['output']
+    if fmt == 'avi':
+        archive = FrameArchive(job['part'] + '.tmp')
+
+        def write(position, frame_id, timestamp_ns, jpeg):
+            if not archive.append(frame_id, jpeg, timestamp_ns):
+                counters['rejected'] += 1
+                return
+            counters['frames'] += 1
+
+        def close():
+            archive.close()
+            # The index first, a part is only there once its archive is
+            os.replace(job['part'] + '.tmp.idx', job['part'] + '.idx')
+            os.replace(job['part'] + '.tmp', job['part'])
+        return write, close
+
+    if fmt == 'jpeg':
+        def write(position, frame_id, timestamp_ns, jpeg):
+            with open(os.path.join(output, f"frame_{position:06d}.jpg"), 'wb') as f:
+                f.write(jpeg)
+            counters['frames'] += 1
+        return write, lambda: None
+
+    import cv2
+    from decoders import DECODERS
+
+    key = (job['decoder'], job['scale'])
+    decoder = _decoders.get(key)
+    if decoder is None:
+        decoder = _decoders[key] = DECODERS[job['decoder']](job['scale'])
+
+    def write(position, frame_id, timestamp_ns, jpeg):
+        img = decoder.decode(jpeg)
+        if img is None:
+            counters['failed'] += 1
+            return
+        cv2.imwrite(os.path.join(output, f"frame_{position:06d}.png"), img)
+        counters['frames'] += 1
+    return write, lambda: None
+
+
+def _transcode_chunk(job):
+    """Runs in a worker: one chunk from source to output, then its counters file"""
+    chunk = job['chunk']
+    counters = {'frames': 0, 'rejected': 0, 'failed': 0, 'bytes': 0, 'clamped': 0, 'reassembly': {}}
+    write, close = _frame_writer(job, counters)
+    started = time.perf_counter()
+
+    if job['files'] is not None:
+        for position, name in enumerate(job['files'], chunk.first):
+            with open(name, 'rb') as f:
+                jpeg = f.read()
+            counters['bytes'] += len(jpeg)
+            write(position, _frame_number(name) or position, 0, jpeg)
+    else:
+        counters['reassembly'] = _transcode_capture_chunk(job['source'], chunk, write, counters,
+                                                          job['timeout'])
+    close()
+
+    counters['worker_seconds'] = time.perf_counter() - started
+    _write_json(job['counters'], counters)
+    return counters
+
+
+def _transcode_capture_chunk(filename, chunk, write, counters, timeout):
+    extractor = FrameExtractor(timeout)
+    position = chunk.first
+    # Multi-packet frames this chunk has seen the start of
+    owned = set()
+
+    def emit(frame):
+        nonlocal position
+        jpeg = frame.data
+        counters['bytes'] += len(jpeg)
+        write(position, frame.frame_id, int(frame.started * 1e9) if frame.started else 0, jpeg)
+        jpeg.release()
+        extractor.release(frame)
+        position += 1
+
+    with CaptureReader(filename) as capture:
+        packet = None
+        last_ns = 0
+        for timestamp_ns, packet in capture.packets(chunk.start, chunk.end):
+            frame_id = extractor.video_frame_id(packet)
+            if frame_id is not None:
+                if frame_id in chunk.skip and frame_id not in owned:
+                    continue
+                owned.add(frame_id)
+            last_ns = timestamp_ns
+            frame = extractor.feed(packet, timestamp_ns / 1e9)
+            if frame is not None:
+                emit(frame)
+
+        if chunk.end is not None:
+            # Late packets of this chunk's last frames
+            deadline = last_ns + int(extractor.timeout * 1e9)
+            for timestamp_ns, packet in capture.packets(chunk.end):
+                if timestamp_ns > deadline or not extractor.inflight:
+                    break
+                if extractor.video_frame_id(packet) not in owned:
+                    continue
+                frame = extractor.feed(packet, timestamp_ns / 1e9)
+                if frame is not None:
+                    emit(frame)
+        del packet
+        extractor.close()
+    extractor.expire(float('inf'))
+    counters['clamped'] = extractor.packets_clamped
+    return extractor.stats()
+
+
+def _write_json(filename, data):
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def _read_json(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _add_counters(total, counters):
+    for key, value in counters.items():
+        if isinstance(value, dict):
+            _add_counters(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def transcode(source, output, fmt='avi', workers=None, chunk_frames=CHUNK_FRAMES, resume=False,
+              timeout=None, decoder='opencv', scale=1, fps=RECORD_FPS, progress=None):
+    """
+    Transcode a capture, legacy dump or frames directory to output (an AVI
+    name or a directory) on a process pool of workers. With resume set the chunks
+    finished by an earlier run of the same job are kept. progress(done,
+    total, counters) is called as chunks complete, in order. Returns the
+    summed counters plus 'chunks', 'resumed', 'seconds' and 'segments'.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    started = time.perf_counter()
+
+    parts = output.rstrip('/\\') + PARTS_SUFFIX
+    capture = files = None
+    if os.path.isdir(source):
+        files = frame_files(source)
+        size = len(files)
+    elif is_capture(source):
+        capture = source
+        size = os.path.getsize(source)
+    elif is_raw_dump(source):
+        capture = os.path.join(parts, RAW_CAPTURE_FILE)
+        size = os.path.getsize(source)
+    else:
+        raise ValueError(f"{source} is neither a capture, a raw dump nor a frames directory")
+
+    plan = {'source': os.path.abspath(source), 'size': size, 'format': fmt,
+            'chunk_frames': chunk_frames, 'scale': scale, 'decoder': decoder}
+    if not resume or _read_json(os.path.join(parts, PLAN_FILE)) != plan:
+        shutil.rmtree(parts, ignore_errors=True)
+    os.makedirs(parts, exist_ok=True)
+    _write_json(os.path.join(parts, PLAN_FILE), plan)
+    if capture not in (None, source) and not os.path.exists(capture):
+        convert_raw_dump(source, capture)
+    chunks = plan_files(files, chunk_frames) if files is not None else plan_capture(capture, chunk_frames)
+    if fmt != 'avi':
+        os.makedirs(output, exist_ok=True)
+
+    jobs, finished = [], {}
+    for chunk in chunks:
+        name = os.path.join(parts, f"chunk_{chunk.index:05d}")
+        job = {'chunk': chunk, 'source': capture, 'format': fmt, 'output': output,
+               'part': name + '.arc', 'counters': name + '.json', 'timeout': timeout,
+               'decoder': decoder, 'scale': scale,
+               'files': files[chunk.start:chunk.end] if files is not None else None}
+        counters = _read_json(job['counters'])
+        if counters is not None and (fmt != 'avi' or os.path.exists(job['part'])):
+            finished[chunk.index] = counters
+        jobs.append(job)
+
+    total = {'chunks': len(chunks), 'resumed': len(finished), 'segments': [],
+             'frames': 0, 'rejected': 0, 'failed': 0, 'bytes': 0, 'clamped': 0}
+    recorder = AviRecorder(output, fps) if fmt == 'avi' else None
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                                  initializer=_worker_init)
+    try:
+        futures = {job['chunk'].index: pool.submit(_transcode_chunk, job)
+                   for job in jobs if job['chunk'].index not in finished}
+        for done, job in enumerate(jobs, 1):
+            index = job['chunk'].index
+            counters = finished.get(index) or futures[index].result()
+            _add_counters(total, counters)
+            if recorder is not None:
+                with ArchiveReader(job['part']) as archive:
+                    for frame_id, timestamp_ns, jpeg in archive:
+                        recorder.write(jpeg, timestamp_ns / 1e9 if timestamp_ns else None)
+            if progress is not None:
+                progress(done, len(jobs), total)
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        if recorder is not None:
+            recorder.close()
+            total['segments'] = recorder.segments
+    pool.shutdown()
+
+    shutil.rmtree(parts, ignore_errors=True)
+    total['seconds'] = time.perf_counter() - started
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcode a drone capture or frames directory in parallel")
+    parser.add_argument('source', help="capture file, legacy raw dump or directory of frame_N.jpg")
+    parser.add_argument('output', help="AVI name (avi) or output directory (jpeg, png)")
+    parser.add_argument('--format', default='avi', choices=FORMATS,
+                        help="avi and jpeg keep the drone's JPEGs, png decodes them")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--chunk-frames', type=int, default=CHUNK_FRAMES, help="frames per work unit")
+    parser.add_argument('--resume', action='store_true', help="keep the chunks an interrupted run finished")
+    parser.add_argument('--fps', type=float, default=RECORD_FPS, help="AVI frame rate")
+    parser.add_argument('--decoder', default='opencv', help="JPEG decoder for png (opencv, turbojpeg)")
+    parser.add_argument('--scale', type=int, default=1, choices=(1, 2, 4, 8), help="decode png at 1/N size")
+    args = parser.parse_args()
+
+    def progress(done, total, counters):
+        elapsed = time.perf_counter() - started
+        print(f"\r🎞️  Chunk {done}/{total}: {counters['frames']} frames, "
+              f"{counters['frames'] / elapsed:.0f} frames/s", end='', flush=True)
+
+    if args.format == 'png':
+        from decoders import DECODERS
+        try:
+            DECODERS[args.decoder](args.scale)
+        except (KeyError, ImportError, OSError) as e:
+            print(f"❌ Decoder {args.decoder} is not available: {e!r}")
+            raise SystemExit(1)
+
+    print(f"▶️  Transcoding {args.source} to {args.output} ({args.format})")
+    started = time.perf_counter()
+    try:
+        result = transcode(args.source, args.output, args.format, args.workers, args.chunk_frames,
+                           args.resume, decoder=args.decoder, scale=args.scale, fps=args.fps,
+                           progress=progress)
+    except (OSError, ValueError) as e:
+        print(f"\n❌ {e}")
+        raise SystemExit(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted, continue with --resume")
+        raise SystemExit(130)
+
+    seconds = result['seconds']
+    print(f"\n📊 {result['frames']} frames in {seconds:.2f} s ({result['frames'] / seconds:.0f} frames/s), "
+          f"{result['chunks']} chunks ({result['resumed']} resumed)")
+    if result.get('reassembly'):
+        print(f"Reassembly: {result['reassembly']}")
+    if result['clamped']:
+        print(f"Packets cut short of their data_len: {result['clamped']}")
+    if result['rejected'] or result['failed']:
+        print(f"Rejected (no JPEG scan): {result['rejected']}, failed to decode: {result['failed']}")
+    if result['segments']:
+        print(f"🎞️  Written to {', '.join(result['segments'])}")
+
+
+if __name__ == '__main__':
+    main()